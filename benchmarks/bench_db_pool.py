@@ -0,0 +1,59 @@
+"""Compare request throughput of the NullPool and the queue pool engine modes.
+
+Every simulated request opens an ``AsyncSession`` the same way ``get_session``
+does, runs a small query and commits, so the numbers include the connection
+setup cost that ``NullPool`` pays on every request.
+
+Usage:
+    poetry run python -m benchmarks.bench_db_pool --requests 2000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from form.db import get_pool_status, new_async_engine
+from form.utils.config import get_settings
+
+
+async def run_mode(pool_mode: str, requests: int, concurrency: int) -> None:
+    settings = get_settings()
+    config = settings.database.model_copy(update={"pool_mode": pool_mode})
+    engine = new_async_engine(settings.sqlalchemy_database_uri, config)
+    sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def single_request():
+        async with semaphore:
+            async with sessionmaker() as session:
+                await session.execute(text("SELECT 1"))
+                await session.commit()
+
+    # Warm up so the queue pool is populated before timing
+    await asyncio.gather(*(single_request() for _ in range(concurrency)))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(single_request() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{pool_mode:>5}: {requests / elapsed:10.1f} req/s "
+        f"({elapsed * 1000 / requests:.2f} ms/req) pool={get_pool_status(engine)}"
+    )
+    await engine.dispose()
+
+
+async def main(requests: int, concurrency: int) -> None:
+    for pool_mode in ("null", "queue"):
+        await run_mode(pool_mode, requests, concurrency)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
@@ -0,0 +1,136 @@
+"""Count database round trips and transactions per DatabaseOperations call.
+
+Every call runs in its own session, the same way an endpoint does. SQL
+statements are counted with a ``before_cursor_execute`` listener and
+transactions with a ``begin`` listener on the engine. Session calls run against
+a throwaway session that is deleted at the end; embedding deletes only target
+ids that do not exist, so stored embeddings are left untouched.
+
+Usage:
+    poetry run python -m benchmarks.bench_db_round_trips --repeats 50
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from uuid import uuid4
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from form.db import new_async_engine
+from form.db.db_operations import DatabaseOperations
+from form.db.db_tables import Embedding
+from form.utils.config import get_settings
+
+
+class RoundTripCounter:
+    def __init__(self, engine):
+        self.statements = 0
+        self.transactions = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+        event.listen(engine.sync_engine, "begin", self._on_begin)
+
+    def _on_execute(self, *args) -> None:
+        self.statements += 1
+
+    def _on_begin(self, *args) -> None:
+        self.transactions += 1
+
+    def reset(self) -> None:
+        self.statements = 0
+        self.transactions = 0
+
+
+async def measure(sessionmaker, counter, label, call, repeats: int) -> None:
+    latencies = []
+    for _ in range(repeats):
+        counter.reset()
+        start = time.perf_counter()
+        async with sessionmaker() as session:
+            try:
+                await call(DatabaseOperations(session))
+            except ValueError:
+                # Missing rows are part of what is measured
+                pass
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(
+        f"{label:>36}: statements={counter.statements} "
+        f"transactions={counter.transactions} "
+        f"mean={statistics.mean(latencies):.2f} ms"
+    )
+
+
+async def main(repeats: int) -> None:
+    settings = get_settings()
+    engine = new_async_engine(settings.sqlalchemy_database_uri, settings.database)
+    sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+    counter = RoundTripCounter(engine)
+
+    async with sessionmaker() as session:
+        result = await session.execute(select(Embedding.embedding_id).limit(5))
+        embedding_ids = result.scalars().all()
+
+    session_id, missing_id = uuid4(), uuid4()
+    form_data = json.dumps({"benchmark": True})
+    async with sessionmaker() as session:
+        await DatabaseOperations(session).create_session(session_id, form_data)
+        await DatabaseOperations(session).upsert_message(
+            uuid4(), session_id, "prompt", "response"
+        )
+
+    calls = [
+        ("get_session_data", lambda ops: ops.get_session_data(session_id)),
+        (
+            "get_messages_for_session",
+            lambda ops: ops.get_messages_for_session(session_id),
+        ),
+        (
+            "get_messages_for_session (missing)",
+            lambda ops: ops.get_messages_for_session(missing_id),
+        ),
+        (
+            "update_session_data",
+            lambda ops: ops.update_session_data(session_id, form_data),
+        ),
+        (
+            "update_session_data (missing)",
+            lambda ops: ops.update_session_data(missing_id, form_data),
+        ),
+        ("delete_session (missing)", lambda ops: ops.delete_session(missing_id)),
+        ("delete_embedding (missing)", lambda ops: ops.delete_embedding(missing_id)),
+        (
+            "delete_embeddings (missing)",
+            lambda ops: ops.delete_embeddings([missing_id]),
+        ),
+    ]
+    if embedding_ids:
+        calls += [
+            ("get_embedding", lambda ops: ops.get_embedding(embedding_ids[0])),
+            (
+                "get_embeddings",
+                lambda ops: ops.get_embeddings(embedding_ids, load_vector=False),
+            ),
+        ]
+    calls.append(("get_embedding (missing)", lambda ops: ops.get_embedding(missing_id)))
+
+    for label, call in calls:
+        await measure(sessionmaker, counter, label, call, repeats)
+    await measure(
+        sessionmaker,
+        counter,
+        "delete_session",
+        lambda ops: ops.delete_session(session_id),
+        1,
+    )
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.repeats))
@@ -0,0 +1,131 @@
+"""Compare the recursive form walks with the compiled form index.
+
+Synthetic forms of --fields fields are nested --depth levels deep, with the
+same shape as form.json: sections of a few fields each. Every operation of a
+note-taking round is timed: filling the empty fields from a response, merging
+updated values and finding the first empty field and its rule. The lookups are
+also timed on their own on a form whose only empty field is the last one; the
+compiled form finds it once and then keeps pointing at it.
+
+Usage:
+    poetry run python -m benchmarks.bench_form_index --fields 1000 5000 20000
+"""
+
+import argparse
+import copy
+import random
+import statistics
+import time
+
+from form.utils.compiled_form import CompiledForm
+from form.utils.form_handler import (
+    find_first_empty_field,
+    find_rule_validation,
+    match_if_form_updated,
+    update_all_empty_fields,
+)
+
+
+def make_form(fields: int, depth: int, section_size: int = 8) -> dict:
+    form: dict = {}
+    for i in range(fields):
+        node = form
+        section = i // section_size
+        for level in range(depth - 1, 0, -1):
+            node = node.setdefault(f"section_{level}_{section // 4**level}", {})
+        node[f"field_{i}"] = ""
+    return form
+
+
+def make_rules(form: dict) -> dict:
+    return {
+        key: make_rules(value) if isinstance(value, dict) else f"min 2 chars ({key})"
+        for key, value in form.items()
+    }
+
+
+def fill(form: dict, share: float, rng: random.Random, value: str) -> dict:
+    return {
+        key: fill(child, share, rng, value)
+        if isinstance(child, dict)
+        else (value if rng.random() < share else child)
+        for key, child in form.items()
+    }
+
+
+def timed(call, repeats: int, setup=None) -> float:
+    """Get the median latency of a call, on a fresh result of setup every time."""
+    latencies = []
+    for _ in range(repeats):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        call(*args)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies)
+
+
+def run(fields: int, depth: int, repeats: int) -> None:
+    rng = random.Random(0)
+    empty_form = make_form(fields, depth)
+    rules = make_rules(empty_form)
+    # Half filled, with a response that fills a tenth more and updates a tenth
+    form = fill(empty_form, 0.5, rng, "value")
+    response = fill(form, 0.1, rng, "updated")
+    # Only the last field is empty, the worst case of the recursive lookups
+    nearly_full = fill(empty_form, 1.0, rng, "value")
+    nearly_full_compiled = CompiledForm(nearly_full, rules)
+    last_path = nearly_full_compiled.keys(nearly_full_compiled.paths[-1])
+    nearly_full_compiled.set(last_path, "")
+
+    # As in the note-taking loop, which compares the whole form for progress
+    def recursive_round(schema: dict):
+        if schema == response:
+            return
+        update_all_empty_fields(schema, response)
+        match_if_form_updated(schema, response)
+        if schema != response:
+            find_rule_validation(rules, find_first_empty_field(schema))
+
+    def compiled_round(compiled: CompiledForm):
+        if compiled.update(response):
+            compiled.rule(compiled.first_empty())
+
+    compile_ms = timed(lambda: CompiledForm(form, rules), repeats)
+    recursive_ms = timed(recursive_round, repeats, lambda: copy.deepcopy(form))
+    compiled_ms = timed(
+        compiled_round, repeats, lambda: CompiledForm(copy.deepcopy(form), rules)
+    )
+
+    lookups = {
+        "first empty (last field)": (
+            lambda: find_first_empty_field(nearly_full),
+            nearly_full_compiled.first_empty,
+        ),
+        "rule of last field": (
+            lambda: find_rule_validation(rules, last_path),
+            lambda: nearly_full_compiled.rule(last_path),
+        ),
+    }
+
+    print(f"{fields} fields, depth {depth}:")
+    print(f"{'compile':>26}: {compile_ms:.3f} ms")
+    for label, (recursive_call, compiled_call) in lookups.items():
+        print(
+            f"{label:>26}: recursive={timed(recursive_call, repeats):.4f} ms "
+            f"compiled={timed(compiled_call, repeats):.4f} ms"
+        )
+    print(
+        f"{'note-taking round':>26}: recursive={recursive_ms:.3f} ms "
+        f"compiled={compiled_ms:.3f} ms "
+        "(plus the compile once per turn)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fields", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    for fields in args.fields:
+        run(fields, args.depth, args.repeats)
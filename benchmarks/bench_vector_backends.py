@@ -0,0 +1,103 @@
+"""Compare top-k latency of the NumPy and pgvector search backends.
+
+By default stored embeddings are used as queries against both backends, and
+the timings include loading the matching rows from Postgres. With
+--synthetic N only the NumPy engine is timed, on N random vectors, so it can
+run without a database.
+
+Usage:
+    poetry run python -m benchmarks.bench_vector_backends --queries 100 --limit 5
+    poetry run python -m benchmarks.bench_vector_backends --synthetic 100000
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from uuid import uuid4
+
+import numpy as np
+
+from form.vectorstore.numpy_engine import NumpyVectorIndex
+
+DISTANCE_TYPES = [
+    "max_inner_product",
+    "cosine_distance",
+    "l1_distance",
+    "l2_distance",
+    "hamming_distance",
+]
+
+
+def report(label: str, latencies_ms: list) -> None:
+    p95 = statistics.quantiles(latencies_ms, n=20)[-1] if len(latencies_ms) > 1 else 0
+    print(f"{label:>32}: mean={statistics.mean(latencies_ms):.3f} ms p95={p95:.3f} ms")
+
+
+def run_synthetic(rows: int, queries: int, limit: int) -> None:
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(rows, 1536)).astype(np.float32)
+    index = NumpyVectorIndex(dimensions=1536, initial_capacity=rows)
+    start = time.perf_counter()
+    index.add([uuid4() for _ in range(rows)], vectors)
+    print(f"Loaded {rows} vectors in {time.perf_counter() - start:.2f} s")
+
+    for distance_type in DISTANCE_TYPES:
+        latencies = []
+        for query in vectors[rng.integers(0, rows, size=queries)]:
+            start = time.perf_counter()
+            index.search(query, limit, distance_type)
+            latencies.append((time.perf_counter() - start) * 1000)
+        report(f"numpy {distance_type}", latencies)
+
+
+async def run_database(queries: int, limit: int) -> None:
+    from form.db import dispose_async_engine, get_async_session
+    from form.db.db_operations import DatabaseOperations
+    from form.vectorstore.backends import NumpyBackend, PgVectorBackend
+
+    async with get_async_session() as session:
+        db_ops = DatabaseOperations(session)
+        numpy_backend = NumpyBackend()
+        start = time.perf_counter()
+        await numpy_backend._ensure_loaded(db_ops)
+        print(
+            f"Loaded {len(numpy_backend.index)} vectors in "
+            f"{time.perf_counter() - start:.2f} s"
+        )
+        rows = await db_ops.get_all_embedding_vectors()
+        if not rows:
+            print("The embeddings table is empty")
+            return
+        rng = np.random.default_rng(0)
+        targets = [
+            rows[i][1].tolist() for i in rng.integers(0, len(rows), size=queries)
+        ]
+
+        for distance_type in DISTANCE_TYPES[:4]:
+            for label, backend in (
+                ("pgvector", PgVectorBackend()),
+                ("numpy", numpy_backend),
+            ):
+                latencies = []
+                for target in targets:
+                    start = time.perf_counter()
+                    await backend.get_nearest_embeddings(
+                        db_ops, target, limit, distance_type
+                    )
+                    latencies.append((time.perf_counter() - start) * 1000)
+                report(f"{label} {distance_type}", latencies)
+
+    await dispose_async_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--synthetic", type=int, default=0)
+    args = parser.parse_args()
+    if args.synthetic:
+        run_synthetic(args.synthetic, args.queries, args.limit)
+    else:
+        asyncio.run(run_database(args.queries, args.limit))
@@ -0,0 +1,102 @@
+"""Compare recall and latency of indexed nearest neighbour search with exact search.
+
+Stored embeddings are used as queries. The exact result comes from a sequential
+scan (index scans disabled for the transaction); the approximate result uses
+whatever HNSW/IVFFlat index exists for the distance type, swept over a range
+of ef_search or probes values.
+
+Usage:
+    poetry run python -m benchmarks.bench_vector_index --queries 100 --limit 10 \
+        --distance-type l2_distance --ef-search 20 40 80 200
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List, Optional
+
+from sqlalchemy import func, select, text
+
+from form.db import dispose_async_engine, get_async_session
+from form.db.db_indexes import set_search_parameters
+from form.db.db_tables import Embedding
+
+
+async def search(
+    target_embedding: list,
+    limit: int,
+    distance_type: str,
+    exact: bool,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> List:
+    distance = Embedding.embedding.__getattr__(distance_type)(target_embedding)
+    async with get_async_session() as session:
+        if exact:
+            await session.execute(text("SET LOCAL enable_indexscan = off"))
+        await set_search_parameters(session, ef_search=ef_search, probes=probes)
+        result = await session.execute(
+            select(Embedding.embedding_id).order_by(distance).limit(limit)
+        )
+        return result.scalars().all()
+
+
+async def timed_searches(queries: List[list], **kwargs) -> tuple:
+    results, latencies = [], []
+    for target_embedding in queries:
+        start = time.perf_counter()
+        results.append(await search(target_embedding, **kwargs))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, latencies
+
+
+def report(label: str, latencies: List[float], recall: float) -> None:
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else 0.0
+    print(
+        f"{label:>18}: recall@k={recall:.3f} "
+        f"mean={statistics.mean(latencies):.2f} ms p95={p95:.2f} ms"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    async with get_async_session() as session:
+        result = await session.execute(
+            select(Embedding.embedding).order_by(func.random()).limit(args.queries)
+        )
+        queries = [embedding.tolist() for embedding in result.scalars().all()]
+    if not queries:
+        print("The embeddings table is empty")
+        return
+
+    search_kwargs = dict(limit=args.limit, distance_type=args.distance_type)
+    exact_results, exact_latencies = await timed_searches(
+        queries, exact=True, **search_kwargs
+    )
+    report("exact", exact_latencies, 1.0)
+
+    sweep = [("ef_search", value) for value in args.ef_search] + [
+        ("probes", value) for value in args.probes
+    ] or [("default", None)]
+    for parameter, value in sweep:
+        kwargs = {parameter: value} if value is not None else {}
+        results, latencies = await timed_searches(
+            queries, exact=False, **search_kwargs, **kwargs
+        )
+        recall = statistics.mean(
+            len(set(approximate) & set(exact)) / max(len(exact), 1)
+            for approximate, exact in zip(results, exact_results)
+        )
+        report(f"{parameter}={value}", latencies, recall)
+
+    await dispose_async_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--distance-type", default="l2_distance")
+    parser.add_argument("--ef-search", type=int, nargs="*", default=[])
+    parser.add_argument("--probes", type=int, nargs="*", default=[])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,155 @@
+"""Replay recorded chat turns against model tiers of the routing agents.
+
+The user turns stored in the messages table of --sessions sessions are
+replayed through the intent and specialist agents, once per tier, with the
+history that preceded them. A tier is a model (``gpt-4o-mini``) or a cascade
+that tries a small model first (``gpt-4o-mini>gpt-4o``). The first tier is the
+reference: for the others, agreement is the share of turns with the same
+routing decision (intent and next agent, or whether a clarification is
+needed). Costs are estimated from the token counts and --price.
+
+Usage:
+    poetry run python -m benchmarks.eval_model_tiers --sessions 20 \\
+        --tiers gpt-4o gpt-4o-mini "gpt-4o-mini>gpt-4o"
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List, Tuple
+
+from form.agents.history_manager import HISTORY_HEADER, HistoryManager
+from form.agents.intent_agent import IntentAgent
+from form.agents.specialist_agent import SpecialistAgent
+from form.db import get_async_session
+from form.db.db_operations import DatabaseOperations
+from form.utils.config import AgentModel
+
+# USD per million input and output tokens; cached input tokens cost half
+PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+AGENTS = {
+    "intent": (IntentAgent, ("intent", "to")),
+    "specialist": (SpecialistAgent, ("is_clarification_needed",)),
+}
+
+
+def parse_tier(tier: str, min_confidence: float) -> AgentModel:
+    if ">" in tier:
+        cascade_model, model = tier.split(">", 1)
+        return AgentModel(
+            model=model, cascade_model=cascade_model, min_confidence=min_confidence
+        )
+    return AgentModel(model=tier)
+
+
+def cost(calls) -> float:
+    total = 0.0
+    for call in calls:
+        input_price, output_price = PRICES.get(call.model, (0.0, 0.0))
+        uncached = call.prompt_tokens - call.cached_tokens
+        total += (
+            uncached * input_price
+            + call.cached_tokens * input_price / 2
+            + call.completion_tokens * output_price
+        ) / 1_000_000
+    return total
+
+
+async def load_turns(sessions: int) -> List[Tuple[str, str]]:
+    """Get every recorded user prompt with the history text sent along with it."""
+    turns = []
+    async with get_async_session() as session:
+        db_ops = DatabaseOperations(session)
+        for stored_session in await db_ops.get_all_sessions(limit=sessions):
+            messages = await db_ops.get_messages_for_session(stored_session.session_id)
+            history: List[Dict[str, str]] = []
+            for message in messages:
+                if message.prompt:
+                    history.append({"role": "user", "content": message.prompt})
+                    text = HISTORY_HEADER + HistoryManager.to_lines(history)
+                    turns.append((message.prompt, text))
+                else:
+                    history.append({"role": "assistant", "content": message.response})
+    return turns
+
+
+async def run_tier(agent_key: str, agent_model: AgentModel, turns) -> Dict:
+    agent_class, decision_keys = AGENTS[agent_key]
+    agent = agent_class(agent_model=agent_model)
+    decisions, latencies, failures = [], [], 0
+    for prompt, history in turns:
+        start = time.perf_counter()
+        try:
+            response = await agent.process(prompt, messages=history)
+        except Exception as e:
+            print(f"  {agent_key} failed on {prompt[:40]!r}: {e}")
+            decisions.append(None)
+            failures += 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+        decisions.append(tuple(response.get(key) for key in decision_keys))
+    return {
+        "decisions": decisions,
+        "latencies": latencies,
+        "failures": failures,
+        "calls": agent.calls,
+        "escalations": agent.usage["escalations"],
+    }
+
+
+def report(agent_key: str, tier: str, result: Dict, reference: Dict) -> None:
+    latencies = result["latencies"] or [0.0]
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else 0
+    pairs = list(zip(result["decisions"], reference["decisions"]))
+    agreement = sum(a is not None and a == b for a, b in pairs) / max(len(pairs), 1)
+    calls = result["calls"]
+    print(
+        f"{agent_key:>10} {tier:>24}: mean={statistics.mean(latencies):.0f} ms "
+        f"p95={p95:.0f} ms "
+        f"tokens={sum(c.prompt_tokens + c.completion_tokens for c in calls)} "
+        f"cost=${cost(calls):.4f} agreement={agreement:.1%} "
+        f"escalations={result['escalations']} failures={result['failures']}"
+    )
+
+
+async def main(args) -> None:
+    turns = await load_turns(args.sessions)
+    print(f"Replaying {len(turns)} recorded turns")
+    if not turns:
+        return
+    for agent_key in args.agents:
+        reference = None
+        for tier in args.tiers:
+            result = await run_tier(
+                agent_key, parse_tier(tier, args.min_confidence), turns
+            )
+            reference = reference or result
+            report(agent_key, tier, result, reference)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--tiers", nargs="+", default=["gpt-4o", "gpt-4o-mini"])
+    parser.add_argument(
+        "--agents", nargs="+", choices=sorted(AGENTS), default=sorted(AGENTS)
+    )
+    parser.add_argument("--min-confidence", type=float, default=0.8)
+    parser.add_argument(
+        "--price",
+        action="append",
+        default=[],
+        metavar="MODEL=INPUT,OUTPUT",
+        help="USD per million input and output tokens of a model",
+    )
+    args = parser.parse_args()
+    for price in args.price:
+        model, prices = price.split("=", 1)
+        input_price, output_price = prices.split(",")
+        PRICES[model] = (float(input_price), float(output_price))
+    asyncio.run(main(args))
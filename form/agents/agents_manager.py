@@ -1,25 +1,30 @@
 # agents_manager.py
 import asyncio
+import copy
 import json
-from typing import Any, Dict, List, Optional
+import time
+from dataclasses import asdict
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
 from uuid import UUID
 
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from form.db.db_operations import DatabaseOperations
+from form.db.db_tables import Message, Session
 from form.models.exceptions import AgentProcessingError
-from form.utils.form_handler import (
-    find_first_empty_field,
-    find_rule_validation,
-    match_if_form_updated,
-    read_json,
-    update_all_empty_fields,
-)
+from form.utils.compiled_form import CompiledForm, FieldChange, in_template_order
+from form.utils.config import get_settings
+from form.utils.metrics import AgentCall, get_fast_path_metrics, summarize_calls
+from form.utils.templates import get_template_registry
+from form.utils.text_handler import estimate_tokens
 
 from .conversation_agent import ConversationAgent
+from .fast_path import FastPath
+from .history_manager import HistoryManager
 from .intent_agent import IntentAgent
 from .note_taking_agent import NoteTakingAgent
+from .session_cache import SessionState, get_session_cache
 from .specialist_agent import SpecialistAgent
 
 
@@ -33,40 +38,76 @@ class AgentsManager:
         self.note_taking_agent = NoteTakingAgent()
         self.conversation_agent = ConversationAgent()
         self.specialist_agent = SpecialistAgent()
+        agents_config = get_settings().agents
+        self.speculative_execution = agents_config.speculative_execution
+        self.incremental_note_taking = agents_config.incremental_note_taking
+        self.max_note_taking_iterations = agents_config.max_note_taking_iterations
+        self.local_validation = agents_config.local_validation
+        self.fast_path = FastPath() if agents_config.fast_path else None
+        self.history_summary = agents_config.history_summary
+        self.history_manager = HistoryManager(
+            self.db_ops,
+            session_id,
+            window=agents_config.history_window,
+            batch=agents_config.history_summary_batch,
+        )
+        self.history_token_budgets = {
+            "intent": agents_config.intent_history_tokens,
+            "note_taking": agents_config.note_taking_history_tokens,
+            "specialist": agents_config.specialist_history_tokens,
+        }
+        self.unit_of_work = get_settings().chat.unit_of_work
+        self.session_cache = get_session_cache()
+        # Stored messages loaded for this turn and the summary state at that point
+        self._stored_history: List[Dict[str, str]] = []
+        self._summarized_at_load = 0
+        self.turn_metrics: Dict[str, Any] = {}
+        # The form fields changed by this turn, in the order they were merged
+        self.turn_changes: List[FieldChange] = []
+        # The stored version of the form this turn started from, None if the
+        # session is not stored yet
+        self.form_version: Optional[int] = None
 
     async def initialize(self):
-        self.chat_history = await self._get_session_history()
-        self.schema = await self._get_latest_form_status()
+        cached_state = (
+            self.session_cache.get(self.session_id)
+            if self.session_cache is not None
+            else None
+        )
+        if cached_state is not None:
+            self._restore_session_state(cached_state)
+        else:
+            await self._load_from_database()
+        self._stored_history = list(self.chat_history)
+        self._summarized_at_load = self.history_manager.summarized_messages
+
+    async def _load_from_database(self) -> None:
+        session_data, messages = await self._query_session()
+        template = get_template_registry().get_json("form/schemas/form.json")
+        self.schema = (
+            in_template_order(json.loads(session_data.form_data), template)
+            if session_data
+            else template
+        )
+        self.form_version = session_data.form_version if session_data else None
+        self.chat_history = self._messages_to_history(messages)
+        if self.history_summary:
+            self.chat_history = self.history_manager.load(
+                session_data, self.chat_history
+            )
         self.form_validation = self._get_form_validation()
 
     async def process_input(self, input_prompt: str) -> Dict[str, Any]:
         try:
             await self.initialize()
-            self.chat_history.append(
-                {"role": "user", "content": input_prompt, "from": "user"}
-            )
-            full_history_text = self._convert_history_to_text()
-
-            intention_response = await self.intent_agent.process(
-                input_prompt, messages=full_history_text
-            )
-            logger.info(f"Intention Agent: {intention_response['intent']}")
-
-            if intention_response["to"] == "user":
-                self.chat_history.append(intention_response)
-                return {**intention_response, "schema": self.schema}
-
-            # Run note-taking and specialist agents in parallel
-            note_taking_task = asyncio.create_task(
-                self._process_note_taking(input_prompt, full_history_text)
-            )
-            specialist_task = asyncio.create_task(
-                self._process_specialist(input_prompt, full_history_text)
-            )
-
-            self.schema, specialist_clarification = await asyncio.gather(
-                note_taking_task, specialist_task
+            start = time.perf_counter()
+            early_response, specialist_clarification = await self._run_routing_agents(
+                input_prompt
             )
+            if early_response:
+                self._record_turn_latency(start)
+                await self.history_manager.save_summary()
+                return early_response
 
             conversation_response = await self._process_conversation(
                 input_prompt=input_prompt, specialist_response=specialist_clarification
@@ -75,19 +116,291 @@ class AgentsManager:
             # Merge specialist response into conversation response
             conversation_response["specialist_response"] = specialist_clarification
 
+            self._record_turn_latency(start)
+            await self.history_manager.save_summary()
             return conversation_response
 
         except Exception as e:
             logger.exception(f"Error in process_input: {str(e)}")
             raise AgentProcessingError(f"Failed to process input: {str(e)}")
+        finally:
+            self.history_manager.cancel()
+            self._log_turn_breakdown()
+
+    async def stream_input(
+        self, input_prompt: str
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Process the input like `process_input` but stream the conversation reply.
+
+        Yields `token` events with the conversation agent's tokens as they arrive
+        and a final `form` event with the full response and the updated schema.
+        """
+        try:
+            await self.initialize()
+            start = time.perf_counter()
+            early_response, specialist_clarification = await self._run_routing_agents(
+                input_prompt
+            )
+            if early_response:
+                yield {"event": "token", "data": {"token": early_response["content"]}}
+                self._record_turn_latency(start)
+                await self.history_manager.save_summary()
+                yield {
+                    "event": "form",
+                    "data": {
+                        "response": early_response["content"],
+                        "form": self.schema,
+                        "changes": self.get_turn_changes(),
+                        "form_version": self.next_form_version,
+                    },
+                }
+                return
+
+            form = self._compile_form()
+            first_empty_field = form.first_empty()
+            if not first_empty_field:
+                logger.info("All fields are filled.")
+                content = "The form was successfully filled."
+                yield {"event": "token", "data": {"token": content}}
+            else:
+                rule_validation = form.rule(first_empty_field)
+                tokens = []
+                async for token in self.conversation_agent.stream(
+                    input_prompt=input_prompt,
+                    first_empty_field=first_empty_field,
+                    rule_validation=rule_validation,
+                    specialist_response=specialist_clarification,
+                ):
+                    tokens.append(token)
+                    yield {"event": "token", "data": {"token": token}}
+                content = "".join(tokens)
+                logger.info("Conversation Agent: Move to next field.")
+
+            self.chat_history.append(
+                {
+                    "type": "conversation",
+                    "content": content,
+                    "from": "Conversation-Agent",
+                    "role": "assistant",
+                    "to": "user",
+                }
+            )
+            self._record_turn_latency(start)
+            await self.history_manager.save_summary()
+            yield {
+                "event": "form",
+                "data": {
+                    "response": content,
+                    "form": self.schema,
+                    "changes": self.get_turn_changes(),
+                    "form_version": self.next_form_version,
+                },
+            }
+
+        except Exception as e:
+            logger.exception(f"Error in stream_input: {str(e)}")
+            raise AgentProcessingError(f"Failed to process input: {str(e)}")
+        finally:
+            self.history_manager.cancel()
+            self._log_turn_breakdown()
+
+    @property
+    def turn_calls(self) -> List[AgentCall]:
+        """The chat completion requests of this turn, by agent in call order."""
+        agents = (
+            self.intent_agent,
+            self.note_taking_agent,
+            self.specialist_agent,
+            self.conversation_agent,
+            self.history_manager.summary_agent,
+        )
+        return [call for agent in agents for call in getattr(agent, "calls", [])]
+
+    def _log_turn_breakdown(self) -> None:
+        calls = self.turn_calls
+        if not calls:
+            return
+        self.turn_metrics["agents"] = summarize_calls(calls)
+        logger.info(
+            f"Turn breakdown for session {self.session_id}: "
+            f"{self.turn_metrics['agents']}, calls: "
+            + ", ".join(
+                f"{call.agent}({call.model}) {call.latency * 1000:.0f} ms "
+                f"{call.prompt_tokens}+{call.completion_tokens} tokens"
+                for call in calls
+            )
+        )
+
+    async def _run_routing_agents(
+        self, input_prompt: str
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Run the intent, note-taking and specialist agents for a user turn.
+
+        Turns the fast path answers on its own skip the agents.
+
+        Returns:
+            tuple: The intent agent's or fast path's response if the turn goes
+                straight back to the user (otherwise None) and the specialist
+                clarification.
+        """
+        self.chat_history.append(
+            {"role": "user", "content": input_prompt, "from": "user"}
+        )
+        self.turn_metrics = {"speculative": self.speculative_execution}
+        self.turn_changes = []
+        fast_response = self._process_fast_path(input_prompt)
+        if fast_response is not None:
+            return fast_response, None
+        histories = self._get_agent_histories()
+        routing_agents = (
+            self.intent_agent,
+            self.note_taking_agent,
+            self.specialist_agent,
+        )
+        usage_before = [dict(agent.usage) for agent in routing_agents]
+
+        if self.speculative_execution:
+            result = await self._run_routing_agents_speculative(input_prompt, histories)
+        else:
+            result = await self._run_routing_agents_sequential(input_prompt, histories)
+        for key in ("prompt_tokens", "cached_prompt_tokens"):
+            self.turn_metrics[key] = sum(
+                agent.usage[key] - usage[key]
+                for agent, usage in zip(routing_agents, usage_before)
+            )
+        logger.info(f"Routing metrics: {self.turn_metrics}")
+        return result
+
+    async def _run_routing_agents_sequential(
+        self, input_prompt: str, histories: Dict[str, str]
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        start = time.perf_counter()
+        intention_response = await self.intent_agent.process(
+            input_prompt, messages=histories["intent"]
+        )
+        self.turn_metrics["intent_latency"] = time.perf_counter() - start
+        logger.info(f"Intention Agent: {intention_response['intent']}")
+
+        if intention_response["to"] == "user":
+            self.chat_history.append(intention_response)
+            return {**intention_response, "schema": self.schema}, None
+
+        # Run note-taking and specialist agents in parallel
+        branch_start = time.perf_counter()
+        note_taking_task = asyncio.create_task(
+            self._process_note_taking(input_prompt, histories["note_taking"])
+        )
+        specialist_task = asyncio.create_task(
+            self._process_specialist(input_prompt, histories["specialist"])
+        )
+
+        self.schema, specialist_clarification = await asyncio.gather(
+            note_taking_task, specialist_task
+        )
+        self.turn_metrics["branch_latency"] = time.perf_counter() - branch_start
+        self.turn_metrics["routing_latency"] = time.perf_counter() - start
+        return None, specialist_clarification
+
+    async def _run_routing_agents_speculative(
+        self, input_prompt: str, histories: Dict[str, str]
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Start the intent agent together with the note-taking and specialist agents.
+
+        If the intent agent sends the turn back to the user, the speculative work is
+        cancelled and the form is restored to its state before the turn.
+        """
+        # Note-taking updates the schema in place, keep a copy to roll back to
+        schema_before = copy.deepcopy(self.schema)
+        speculative_agents = (self.note_taking_agent, self.specialist_agent)
+        usage_before = [dict(agent.usage) for agent in speculative_agents]
+        start = time.perf_counter()
+
+        intent_task = asyncio.create_task(
+            self.intent_agent.process(input_prompt, messages=histories["intent"])
+        )
+        branch_finished_at: List[float] = []
+
+        async def run_branch():
+            results = await asyncio.gather(
+                self._process_note_taking(input_prompt, histories["note_taking"]),
+                self._process_specialist(input_prompt, histories["specialist"]),
+            )
+            branch_finished_at.append(time.perf_counter())
+            return results
+
+        branch_task = asyncio.create_task(run_branch())
+
+        try:
+            intention_response = await intent_task
+        except (asyncio.CancelledError, Exception):
+            await self._cancel_speculative_branch(branch_task)
+            self.schema = schema_before
+            self.turn_changes = []
+            raise
+        intent_latency = time.perf_counter() - start
+        self.turn_metrics["intent_latency"] = intent_latency
+        logger.info(f"Intention Agent: {intention_response['intent']}")
+
+        if intention_response["to"] == "user":
+            await self._cancel_speculative_branch(branch_task)
+            self.schema = schema_before
+            self.turn_changes = []
+            wasted_tokens = 0
+            cancelled_calls = 0
+            for agent, usage in zip(speculative_agents, usage_before):
+                wasted_tokens += (
+                    agent.usage["prompt_tokens"]
+                    + agent.usage["completion_tokens"]
+                    - usage["prompt_tokens"]
+                    - usage["completion_tokens"]
+                )
+                cancelled_calls += (
+                    agent.usage["started_calls"] - agent.usage["completed_calls"]
+                ) - (usage["started_calls"] - usage["completed_calls"])
+            self.turn_metrics.update(
+                speculation_cancelled=True,
+                wasted_tokens=wasted_tokens,
+                cancelled_calls=cancelled_calls,
+                latency_saved=0.0,
+            )
+            self.chat_history.append(intention_response)
+            return {**intention_response, "schema": self.schema}, None
+
+        self.schema, specialist_clarification = await branch_task
+        routing_latency = time.perf_counter() - start
+        branch_latency = branch_finished_at[0] - start
+        self.turn_metrics.update(
+            speculation_cancelled=False,
+            branch_latency=branch_latency,
+            routing_latency=routing_latency,
+            # Running sequentially would have cost both latencies back to back
+            latency_saved=intent_latency + branch_latency - routing_latency,
+        )
+        return None, specialist_clarification
+
+    @staticmethod
+    async def _cancel_speculative_branch(branch_task: asyncio.Task) -> None:
+        branch_task.cancel()
+        try:
+            await branch_task
+        except (asyncio.CancelledError, Exception):
+            # The results of cancelled speculative work are discarded
+            pass
 
     async def _process_note_taking(
         self, input_prompt: str, full_history_text: str
     ) -> Dict[str, Any]:
+        if self.incremental_note_taking:
+            return await self._process_note_taking_incremental(
+                input_prompt, full_history_text
+            )
+
+        form = self._compile_form()
         round_i = 0
+        prompt_size = 0
         while True:
             round_i += 1
-            if round_i > 5:
+            if round_i > self.max_note_taking_iterations:
                 logger.info("Note-Taking Agent: Maximum iterations reached.")
                 break
             logger.debug(f"Note-Taking Agent: Iteration {round_i}")
@@ -97,19 +410,125 @@ class AgentsManager:
                 form_val=self.form_validation,
                 messages=full_history_text,
             )
-            if self.schema == note_response["schema"]:
+            prompt_size += self.note_taking_agent.last_prompt_size
+            # Fill the empty fields and, in case of an update, take the new values
+            changes = form.update(
+                note_response["schema"], source=self.note_taking_agent.name
+            )
+            self._record_rejected_values(form)
+            if not changes:
                 logger.info("Note-Taking Agent: No new fields filled.")
                 break
-            # Only update the schema if the note-taking agent has filled in a new field
-            update_all_empty_fields(self.schema, note_response["schema"])
-            # In case of an update, the form should be updated with the new values
-            match_if_form_updated(self.schema, note_response["schema"])
-            if self.schema == note_response["schema"]:
+            self.turn_changes.extend(changes)
+            if form.matches_last_update:
                 logger.info("Note-Taking Agent: Form filled successfully.")
                 break
 
+        self._record_note_taking_metrics(
+            min(round_i, self.max_note_taking_iterations), prompt_size
+        )
+        return self.schema
+
+    async def _process_note_taking_incremental(
+        self, input_prompt: str, full_history_text: str
+    ) -> Dict[str, Any]:
+        """Fill the form, sending only the still-empty fields after the first round.
+
+        The first round sends the whole form so the agent can still correct filled
+        fields. Later rounds only send the empty fields and their rules, and the
+        loop stops at the first round that does not change the form.
+        """
+        compiled_form = self._compile_form()
+        iterations = 0
+        prompt_size = 0
+        for round_i in range(1, self.max_note_taking_iterations + 1):
+            if round_i == 1:
+                form = self.schema
+                form_val = self.form_validation
+            else:
+                form = compiled_form.empty_fields()
+                if not form:
+                    logger.info("Note-Taking Agent: Form filled successfully.")
+                    break
+                form_val = compiled_form.empty_rules()
+
+            logger.debug(f"Note-Taking Agent: Iteration {round_i}")
+            note_response = await self.note_taking_agent.process(
+                input_prompt,
+                form=form,
+                form_val=form_val,
+                messages=full_history_text,
+                indent=None,
+            )
+            iterations += 1
+            prompt_size += self.note_taking_agent.last_prompt_size
+
+            changes = compiled_form.update(
+                note_response["schema"], source=self.note_taking_agent.name
+            )
+            self._record_rejected_values(compiled_form)
+            if not changes:
+                logger.info("Note-Taking Agent: No new fields filled.")
+                break
+            self.turn_changes.extend(changes)
+        else:
+            logger.info("Note-Taking Agent: Maximum iterations reached.")
+
+        self._record_note_taking_metrics(iterations, prompt_size)
         return self.schema
 
+    def _process_fast_path(self, input_prompt: str) -> Optional[Dict[str, Any]]:
+        if self.fast_path is None:
+            return None
+        start = time.perf_counter()
+        result = self.fast_path.process(input_prompt, self._compile_form())
+        metrics = get_fast_path_metrics()
+        if result is None:
+            metrics.record_miss()
+            self.turn_metrics["fast_path"] = False
+            return None
+        change, response = result
+        latency = time.perf_counter() - start
+        metrics.record_hit(latency)
+        self.turn_changes.append(change)
+        self.chat_history.append(response)
+        self.turn_metrics.update(fast_path=True, fast_path_latency=latency)
+        logger.info(
+            f"Fast path: filled {change.path} with {change.new!r} in "
+            f"{latency * 1000:.2f} ms, hit rate {metrics.hit_rate:.1%}, "
+            f"{metrics.saved_seconds:.1f} s saved so far"
+        )
+        return {**response, "schema": self.schema}
+
+    def _record_turn_latency(self, start: float) -> None:
+        latency = time.perf_counter() - start
+        self.turn_metrics["turn_latency"] = latency
+        if not self.turn_metrics.get("fast_path"):
+            get_fast_path_metrics().record_agent_turn(latency)
+
+    def _compile_form(self) -> CompiledForm:
+        return CompiledForm(
+            self.schema, self.form_validation, validate=self.local_validation
+        )
+
+    def _record_rejected_values(self, form: CompiledForm) -> None:
+        for rejected in form.rejected:
+            logger.info(
+                f"Note-Taking Agent: rejected {rejected.value!r} for "
+                f"{rejected.path}, it {rejected.reason}"
+            )
+        self.turn_metrics["rejected_values"] = self.turn_metrics.get(
+            "rejected_values", 0
+        ) + len(form.rejected)
+
+    def _record_note_taking_metrics(self, iterations: int, prompt_size: int) -> None:
+        self.turn_metrics["note_taking_iterations"] = iterations
+        self.turn_metrics["note_taking_prompt_chars"] = prompt_size
+        logger.info(
+            f"Note-Taking Agent: {iterations} iteration(s), "
+            f"{prompt_size} prompt characters"
+        )
+
     async def _process_specialist(
         self, input_prompt: str, full_history_text: str
     ) -> Optional[str]:
@@ -125,8 +544,9 @@ class AgentsManager:
     async def _process_conversation(
         self, input_prompt: str, specialist_response: str
     ) -> Dict[str, Any]:
-        first_empty_field = find_first_empty_field(self.schema)
-        rule_validation = find_rule_validation(self.form_validation, first_empty_field)
+        form = self._compile_form()
+        first_empty_field = form.first_empty()
+        rule_validation = form.rule(first_empty_field)
 
         if first_empty_field:
             conversation_response = await self.conversation_agent.process(
@@ -149,31 +569,86 @@ class AgentsManager:
                 "to": "user",
             }
 
-    async def _get_session_history(self) -> List[Dict[str, str]]:
+    async def _query_session(self) -> Tuple[Optional[Session], List[Message]]:
+        if self.unit_of_work:
+            return await self.db_ops.load_chat_state(self.session_id)
         messages = await self.db_ops.get_messages_for_session(
             self.session_id, create_if_not_exists=True
         )
-        return [
-            {
-                "role": "user" if msg.prompt else "assistant",
-                "content": msg.prompt or msg.response,
-            }
-            for msg in messages
-        ]
+        session_data = await self.db_ops.get_session_data(self.session_id)
+        return session_data, messages
+
+    def _restore_session_state(self, state: SessionState) -> None:
+        # The turn updates the form in place, the cached form must stay intact
+        self.schema = copy.deepcopy(state.form)
+        self.form_validation = state.form_validation
+        self.form_version = state.form_version
+        self.chat_history = list(state.history)
+        if self.history_summary:
+            self.history_manager.restore(
+                state.summary, state.summarized_messages, self.chat_history
+            )
+
+    @property
+    def form_changed(self) -> bool:
+        """Whether the turn has a form to store, False if the stored one is current."""
+        return self.form_version is None or bool(self.turn_changes)
+
+    @property
+    def next_form_version(self) -> int:
+        """The version of the form once this turn is stored."""
+        if self.form_version is None:
+            return 0
+        return self.form_version + 1 if self.turn_changes else self.form_version
+
+    def get_turn_changes(self) -> List[Dict[str, Any]]:
+        """Get the form fields changed by this turn, with their path and source."""
+        return [asdict(change) for change in self.turn_changes]
+
+    def get_session_state(self, prompt: str, response: str) -> SessionState:
+        """Get the state a reload from the database returns once the turn is stored."""
+        history = self._stored_history + [self._history_entry(prompt, response)]
+        # Messages folded into the summary during this turn are no longer loaded
+        folded = self.history_manager.summarized_messages - self._summarized_at_load
+        return SessionState(
+            form=self.schema,
+            form_validation=self.form_validation,
+            history=history[folded:],
+            summary=self.history_manager.summary,
+            summarized_messages=self.history_manager.summarized_messages,
+            form_version=self.next_form_version,
+        )
+
+    @classmethod
+    def _messages_to_history(cls, messages: List[Message]) -> List[Dict[str, str]]:
+        return [cls._history_entry(msg.prompt, msg.response) for msg in messages]
+
+    @staticmethod
+    def _history_entry(prompt: str, response: str) -> Dict[str, str]:
+        return {
+            "role": "user" if prompt else "assistant",
+            "content": prompt or response,
+        }
 
     @staticmethod
     def _get_form_validation() -> Dict[str, Any]:
-        return read_json(path="form/schemas/form_val.json")
+        return get_template_registry().get_json("form/schemas/form_val.json")
 
-    async def _get_latest_form_status(self) -> Dict[str, Any]:
-        session_data = await self.db_ops.get_session_data(self.session_id)
-        return (
-            json.loads(session_data.form_data)
-            if session_data
-            else read_json(path="form/schemas/form.json")
-        )
+    def _get_agent_histories(self) -> Dict[str, str]:
+        """Render the history sent to the intent, note-taking and specialist agents."""
+        if not self.history_summary:
+            full_history_text = self._convert_history_to_text()
+            return dict.fromkeys(self.history_token_budgets, full_history_text)
+        histories = {
+            agent: self.history_manager.render(self.chat_history, max_tokens)
+            for agent, max_tokens in self.history_token_budgets.items()
+        }
+        self.turn_metrics["history_tokens"] = {
+            agent: estimate_tokens(text) for agent, text in histories.items()
+        }
+        return histories
 
     def _convert_history_to_text(self) -> str:
         return "continue from history conversations: ...\n" + "\n".join(
-            f'{message["role"]}: {message["content"]}' for message in self.chat_history
+            f"{message['role']}: {message['content']}" for message in self.chat_history
         )
@@ -1,14 +1,80 @@
 import json
+import time
 from abc import ABC, abstractmethod
+from typing import AsyncGenerator, List, Optional, Tuple
 
-from openai import AsyncOpenAI
+from loguru import logger
 
-from form.utils.config import get_settings
+from form.agents.call_policy import PolicyCall, get_call_policy, get_latency_tracker
+from form.agents.cascade import decision_confidence, get_agent_model, missing_keys
+from form.utils.config import AgentModel
+from form.utils.metrics import AgentCall, get_agent_metrics
+from form.utils.openai_client import get_openai_client
+from form.utils.templates import get_template_registry
 
 
 class BaseAgent(ABC):
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=get_settings().open_ai_config.api_key)
+    # Selects the call policy and the model of the agent in the settings
+    agent_key = "agent"
+    # Keys a response must have, and those whose values carry the decision of
+    # the agent, to accept a response of the cascade model
+    response_keys: Tuple[str, ...] = ()
+    decision_keys: Tuple[str, ...] = ()
+
+    def __init__(self, agent_model: Optional[AgentModel] = None):
+        # Retries are made by the call policy, within the deadline of the call
+        self.client = get_openai_client().with_options(max_retries=0)
+        self.name = type(self).__name__
+        self.call_policy = get_call_policy(self.agent_key)
+        self.agent_model = agent_model or get_agent_model(self.agent_key)
+        self.model = self.agent_model.model
+        # Every chat completion request made by this agent instance
+        self.calls: List[AgentCall] = []
+        self.usage = {
+            "started_calls": 0,
+            "completed_calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_prompt_tokens": 0,
+            "escalations": 0,
+        }
+
+    def _record_usage(self, usage) -> None:
+        self.usage["completed_calls"] += 1
+        self._add_tokens(usage)
+
+    def _add_tokens(self, usage) -> None:
+        if usage:
+            self.usage["prompt_tokens"] += usage.prompt_tokens
+            self.usage["completion_tokens"] += usage.completion_tokens
+            details = getattr(usage, "prompt_tokens_details", None)
+            self.usage["cached_prompt_tokens"] += (
+                getattr(details, "cached_tokens", None) or 0
+            )
+
+    def _record_call(self, call: AgentCall) -> None:
+        self.calls.append(call)
+        get_agent_metrics().record(call)
+
+    def _record_failed_call(
+        self, model_name: str, start: float, policy_call: PolicyCall
+    ) -> None:
+        self._record_call(
+            AgentCall(
+                self.name,
+                model_name,
+                time.perf_counter() - start,
+                retries=policy_call.retries,
+                hedges=policy_call.hedges,
+                cancelled_hedges=policy_call.cancelled_hedges,
+                error=True,
+            )
+        )
+
+    def _new_policy_call(self) -> PolicyCall:
+        return PolicyCall(
+            self.call_policy, get_latency_tracker(self.agent_key), self.agent_key
+        )
 
     @abstractmethod
     async def process(self, input_prompt: str, **kwargs) -> str:
@@ -18,11 +84,65 @@ class BaseAgent(ABC):
     def _get_sys_prompt(self) -> str:
         pass
 
+    @staticmethod
+    def _build_messages(sys_prompt: str, context: str, input_prompt: str) -> list:
+        """Put the static instructions first and the per-turn content last.
+
+        The provider caches prompts by their longest common prefix, so the
+        system prompt, which only changes with the prompt files, must not be
+        preceded by anything that changes from turn to turn.
+        """
+        messages = [{"role": "system", "content": sys_prompt}]
+        if context:
+            messages.append({"role": "system", "content": context})
+        messages.append({"role": "user", "content": input_prompt})
+        return messages
+
     @staticmethod
     def _read_prompt(file_path: str, **kwargs) -> str:
-        with open(file_path, "r") as file:
-            content = file.read()
-            return content.format(**kwargs)
+        return get_template_registry().render(file_path, **kwargs)
+
+    async def _call_model(self, messages: list, **kwargs) -> dict:
+        """Call the model of the agent, trying the cascade model first if set."""
+        cascade_model = self.agent_model.cascade_model
+        if cascade_model:
+            response = await self._call_cascade_model(cascade_model, messages, **kwargs)
+            if response is not None:
+                return response
+        return await self._call_openai(self.model, messages, **kwargs)
+
+    async def _call_cascade_model(
+        self, model_name: str, messages: list, **kwargs
+    ) -> Optional[dict]:
+        completion = await self._request_openai(
+            model_name, messages, logprobs=True, **kwargs
+        )
+        choice = completion.choices[0]
+        content = choice.message.content
+        try:
+            response = json.loads(content)
+        except (TypeError, json.JSONDecodeError):
+            reason = "invalid JSON"
+        else:
+            missing = missing_keys(response, self.response_keys)
+            confidence = None
+            if self.decision_keys and choice.logprobs and choice.logprobs.content:
+                confidence = decision_confidence(
+                    content, choice.logprobs.content, self.decision_keys
+                )
+            if missing:
+                reason = f"missing {missing}"
+            elif (
+                confidence is not None and confidence < self.agent_model.min_confidence
+            ):
+                reason = f"confidence {confidence:.2f}"
+            else:
+                return response
+        self.usage["escalations"] += 1
+        logger.info(
+            f"{self.name}: escalating from {model_name} to {self.model} ({reason})"
+        )
+        return None
 
     async def _call_openai(
         self,
@@ -31,12 +151,103 @@ class BaseAgent(ABC):
         max_tokens: int = 4096,
         response_format={"type": "json_object"},
         **kwargs,
-    ) -> str:
-        response = await self.client.chat.completions.create(
-            model=model_name,
-            messages=messages,
-            max_tokens=max_tokens,
-            response_format=response_format,
-            **kwargs,
+    ) -> dict:
+        response = await self._request_openai(
+            model_name, messages, max_tokens, response_format, **kwargs
         )
         return json.loads(response.choices[0].message.content)
+
+    async def _request_openai(
+        self,
+        model_name: str,
+        messages: list,
+        max_tokens: int = 4096,
+        response_format={"type": "json_object"},
+        **kwargs,
+    ):
+        self.usage["started_calls"] += 1
+        start = time.perf_counter()
+        policy_call = self._new_policy_call()
+        try:
+            raw_response = await policy_call.run(
+                lambda timeout: self.client.chat.completions.with_raw_response.create(
+                    model=model_name,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    response_format=response_format,
+                    timeout=timeout,
+                    **kwargs,
+                )
+            )
+        except Exception:
+            self._record_failed_call(model_name, start, policy_call)
+            raise
+        response = raw_response.parse()
+        self._record_usage(response.usage)
+        call = AgentCall.from_usage(
+            self.name,
+            model_name,
+            time.perf_counter() - start,
+            response.usage,
+            retries=policy_call.retries,
+            hedges=policy_call.hedges,
+            cancelled_hedges=policy_call.cancelled_hedges,
+        )
+        # A hedged request that returned with the one used is billed as well
+        for discarded in policy_call.discarded:
+            usage = discarded.parse().usage
+            self._add_tokens(usage)
+            call.add_usage(usage)
+        self._record_call(call)
+        return response
+
+    async def _stream_openai(
+        self,
+        model_name: str,
+        messages: list,
+        max_tokens: int = 4096,
+        **kwargs,
+    ) -> AsyncGenerator[str, None]:
+        self.usage["started_calls"] += 1
+        start = time.perf_counter()
+        # The policy covers opening the stream, tokens already sent are not retried
+        policy_call = self._new_policy_call()
+        usage = None
+        try:
+            raw_response = await policy_call.run(
+                lambda timeout: self.client.chat.completions.with_raw_response.create(
+                    model=model_name,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    timeout=timeout,
+                    **kwargs,
+                )
+            )
+            # The usage of a stream comes with its last chunk, a duplicate stream
+            # is closed before and counted as cancelled
+            for discarded in policy_call.discarded:
+                await discarded.parse().close()
+            async for chunk in raw_response.parse():
+                # The usage arrives in a last chunk without choices
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception:
+            self._record_failed_call(model_name, start, policy_call)
+            raise
+        self._record_usage(usage)
+        self._record_call(
+            AgentCall.from_usage(
+                self.name,
+                model_name,
+                time.perf_counter() - start,
+                usage,
+                retries=policy_call.retries,
+                hedges=policy_call.hedges,
+                cancelled_hedges=policy_call.cancelled_hedges
+                + len(policy_call.discarded),
+            )
+        )
@@ -0,0 +1,164 @@
+import asyncio
+import random
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+import openai
+from loguru import logger
+
+from form.models.exceptions import AgentCallTimeoutError
+from form.utils.config import CallPolicy, get_settings
+
+T = TypeVar("T")
+
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class LatencyTracker:
+    """The latencies of the most recent successful requests of an agent.
+
+    Args:
+        size (int): The number of latencies kept.
+    """
+
+    def __init__(self, size: int = 200):
+        self._latencies: Deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def add(self, latency: float) -> None:
+        self._latencies.append(latency)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(int(percentile * len(ordered)), len(ordered) - 1)]
+
+
+_LATENCY_TRACKERS: Dict[str, LatencyTracker] = {}
+
+
+def get_latency_tracker(agent_key: str) -> LatencyTracker:
+    """Get the process-wide latency tracker of an agent."""
+    if agent_key not in _LATENCY_TRACKERS:
+        _LATENCY_TRACKERS[agent_key] = LatencyTracker()
+    return _LATENCY_TRACKERS[agent_key]
+
+
+def get_call_policy(agent_key: str) -> CallPolicy:
+    agents_config = get_settings().agents
+    return agents_config.call_policies.get(agent_key, agents_config.call_policy)
+
+
+class PolicyCall:
+    """Run an agent request under a call policy.
+
+    Each attempt gets the time left until the deadline as its timeout. Failed
+    attempts with a retryable error are retried after an exponential backoff
+    with full jitter, as long as the deadline allows it. With hedging, a
+    duplicate request is sent once an attempt is slower than the configured
+    percentile of the agent's recent requests. The request of a hedged attempt
+    that is still in flight once the other one returned is cancelled; its tokens
+    are unknown, so it is only counted in `cancelled_hedges`. Responses that
+    returned at the same time as the one used are kept in `discarded`.
+
+    Args:
+        policy (CallPolicy): The deadline, retry and hedging settings.
+        tracker (LatencyTracker): The recent request latencies of the agent.
+        agent_key (str): The agent, for error messages.
+    """
+
+    def __init__(self, policy: CallPolicy, tracker: LatencyTracker, agent_key: str):
+        self.policy = policy
+        self.tracker = tracker
+        self.agent_key = agent_key
+        self.retries = 0
+        self.hedges = 0
+        self.cancelled_hedges = 0
+        self.discarded: List[T] = []
+
+    async def run(self, request: Callable[[float], Awaitable[T]]) -> T:
+        """Run the request, which is called with its timeout in seconds."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.policy.deadline
+        while True:
+            remaining = deadline - loop.time()
+            try:
+                return await asyncio.wait_for(
+                    self._attempt(request, deadline), remaining
+                )
+            except asyncio.TimeoutError:
+                raise self._timeout_error()
+            except RETRYABLE_ERRORS as e:
+                if self.retries >= self.policy.max_retries:
+                    raise
+                delay = random.uniform(
+                    0,
+                    min(
+                        self.policy.backoff_max,
+                        self.policy.backoff_base * 2**self.retries,
+                    ),
+                )
+                if loop.time() + delay >= deadline:
+                    raise self._timeout_error() from e
+                self.retries += 1
+                logger.warning(
+                    f"Retrying {self.agent_key} agent call in {delay:.2f} s "
+                    f"({self.retries}/{self.policy.max_retries}): {e}"
+                )
+                await asyncio.sleep(delay)
+
+    async def _attempt(
+        self, request: Callable[[float], Awaitable[T]], deadline: float
+    ) -> T:
+        loop = asyncio.get_running_loop()
+        hedge_after = None
+        if self.policy.hedging and len(self.tracker) >= self.policy.hedge_min_samples:
+            hedge_after = self.tracker.percentile(self.policy.hedge_percentile)
+
+        async def timed_request() -> T:
+            start = loop.time()
+            result = await request(deadline - start)
+            self.tracker.add(loop.time() - start)
+            return result
+
+        tasks = {asyncio.ensure_future(timed_request())}
+        hedged = False
+        try:
+            if hedge_after is not None:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+                if not done:
+                    self.hedges += 1
+                    hedged = True
+                    logger.info(
+                        f"Hedging {self.agent_key} agent call after {hedge_after:.2f} s"
+                    )
+                    tasks.add(asyncio.ensure_future(timed_request()))
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                responses = [task.result() for task in done if task.exception() is None]
+                if responses:
+                    self.discarded.extend(responses[1:])
+                    return responses[0]
+                error = next(iter(done)).exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                    self.cancelled_hedges += hedged
+
+    def _timeout_error(self) -> AgentCallTimeoutError:
+        return AgentCallTimeoutError(
+            f"The {self.agent_key} agent call exceeded its deadline of "
+            f"{self.policy.deadline} s"
+        )
@@ -0,0 +1,55 @@
+import math
+import re
+from typing import Any, Optional, Sequence
+
+from form.utils.config import AgentModel, get_settings
+
+# A JSON value following a key: a string, true, false, null or a number
+_VALUE = r'\s*:\s*("(?:[^"\\]|\\.)*"|true|false|null|-?[\d.eE+-]+)'
+
+
+def decision_confidence(
+    content: str, token_logprobs: Sequence[Any], keys: Sequence[str]
+) -> Optional[float]:
+    """Get the probability of the least likely token of the decision values.
+
+    Free text in a response, such as a reply to the user, is naturally less
+    likely token by token, so only the tokens of the values of `keys` count.
+
+    Args:
+        content (str): The response text.
+        token_logprobs (list): The logprobs of the response tokens, with a
+            `token` and a `logprob` each.
+        keys (list): The JSON keys whose values carry the decision.
+
+    Returns:
+        float: The probability, or None if none of the keys was found.
+    """
+    spans = []
+    for key in keys:
+        match = re.search(f'"{re.escape(key)}"' + _VALUE, content)
+        if match:
+            spans.append(match.span(1))
+    if not spans:
+        return None
+
+    probability = 1.0
+    offset = 0
+    for token in token_logprobs:
+        start, offset = offset, offset + len(token.token)
+        if any(
+            start < span_end and offset > span_start for span_start, span_end in spans
+        ):
+            probability = min(probability, math.exp(token.logprob))
+    return probability
+
+
+def missing_keys(response: Any, keys: Sequence[str]) -> Sequence[str]:
+    if not isinstance(response, dict):
+        return list(keys)
+    return [key for key in keys if key not in response]
+
+
+def get_agent_model(agent_key: str) -> AgentModel:
+    agents_config = get_settings().agents
+    return agents_config.models.get(agent_key, agents_config.model)
@@ -1,7 +1,29 @@
+from typing import AsyncGenerator
+
 from form.agents.base_agent import BaseAgent
 
+JSON_REPLY_FORMAT = """[IMPORTANT] Return the following JSON object with the schema and the bot response:
+{
+    "type": "conversation",
+    "content": "<bot-response>",
+    "from": "Conversation-Agent",
+    "role": "assistant",
+    "to": "user"
+}
+
+<bot-response> is your response."""
+
+# Streamed tokens are sent to the user as they arrive
+TEXT_REPLY_FORMAT = (
+    "[IMPORTANT] Reply with the plain text message for the user only, without "
+    "JSON or any other formatting."
+)
+
 
 class ConversationAgent(BaseAgent):
+    agent_key = "conversation"
+    response_keys = ("content",)
+
     async def process(
         self,
         input_prompt: str,
@@ -9,20 +31,54 @@ class ConversationAgent(BaseAgent):
         rule_validation: str,
         specialist_response: str,
     ):
-        sys_prompt = self._get_sys_prompt(first_empty_field, rule_validation)
-        response = await self._call_openai(
-            model_name="gpt-4o",
-            messages=[
-                {"role": "system", "content": sys_prompt},
-                {"role": "user", "content": input_prompt},
-                {"role": "assistant", "content": specialist_response},
-            ],
+        response = await self._call_model(
+            messages=self._get_messages(
+                input_prompt,
+                first_empty_field,
+                rule_validation,
+                specialist_response,
+                self._get_sys_prompt(),
+            ),
         )
         return response
 
-    def _get_sys_prompt(self, first_empty_field: list, rule_validation: str) -> str:
+    async def stream(
+        self,
+        input_prompt: str,
+        first_empty_field: list,
+        rule_validation: str,
+        specialist_response: str,
+    ) -> AsyncGenerator[str, None]:
+        sys_prompt = self._get_sys_prompt(reply_format=TEXT_REPLY_FORMAT)
+        async for token in self._stream_openai(
+            model_name=self.model,
+            messages=self._get_messages(
+                input_prompt,
+                first_empty_field,
+                rule_validation,
+                specialist_response,
+                sys_prompt,
+            ),
+        ):
+            yield token
+
+    def _get_messages(
+        self,
+        input_prompt: str,
+        first_empty_field: list,
+        rule_validation: str,
+        specialist_response: str,
+        sys_prompt: str,
+    ) -> list:
+        context = (
+            f"- Empty fields: {first_empty_field[-1]}\n"
+            f"- Rule validation: {rule_validation}"
+        )
+        return self._build_messages(sys_prompt, context, input_prompt) + [
+            {"role": "assistant", "content": specialist_response}
+        ]
+
+    def _get_sys_prompt(self, reply_format: str = JSON_REPLY_FORMAT) -> str:
         return self._read_prompt(
-            "form/prompts/conversation_sys_prompt.txt",
-            first_empty_field=first_empty_field[-1],
-            rule_validation=rule_validation,
+            "form/prompts/conversation_sys_prompt.txt", reply_format=reply_format
         )
@@ -0,0 +1,75 @@
+from typing import Any, Dict, Optional, Tuple
+
+from form.utils.compiled_form import CompiledForm, FieldChange
+from form.utils.rule_validation import compile_rule
+from form.utils.templates import get_template_registry
+
+
+class FastPath:
+    """Fill the next empty field from a turn that is nothing but its value.
+
+    Turns like "EUR" or "2025-03-01" that answer the question for the first
+    empty field with one of its choices, a number or an ISO date are filled in
+    after checking the value against the field's rule. The next question is
+    rendered from a template, so the turn needs no agent call. Anything else is
+    left to the agents.
+    """
+
+    name = "FastPath"
+    question_path = "form/prompts/fast_path_question.txt"
+
+    def process(
+        self, input_prompt: str, form: CompiledForm
+    ) -> Optional[Tuple[FieldChange, Dict[str, Any]]]:
+        """Fill the first empty field of the form in place if the turn answers it.
+
+        Returns:
+            tuple: The change and the response to the user, or None if the turn
+                is not a valid answer of its own.
+        """
+        target = form.first_empty()
+        rule = form.rule(target)
+        if not isinstance(rule, str):
+            return None
+        value = compile_rule(rule).extract(input_prompt)
+        if value is None or form.check(target, value) is not None:
+            return None
+        change = form.set(target, value, source=self.name)
+
+        next_field = form.first_empty()
+        if next_field is None:
+            content = "The form was successfully filled."
+        else:
+            question = get_template_registry().render(
+                self.question_path,
+                field=self._label(target[-1]),
+                value=value,
+                next_field=self._label(next_field[-1]),
+                hint=self._hint(form.rule(next_field)),
+            )
+            content = question.strip()
+        response = {
+            "type": "conversation",
+            "content": content,
+            "from": "Fast-Path",
+            "role": "assistant",
+            "to": "user",
+        }
+        return change, response
+
+    @staticmethod
+    def _label(key: str) -> str:
+        return key.replace("_", " ")
+
+    @staticmethod
+    def _hint(rule: Any) -> str:
+        if not isinstance(rule, str):
+            return ""
+        compiled = compile_rule(rule)
+        if compiled.choices:
+            return f" The options are {', '.join(compiled.choices)}."
+        if compiled.iso_date:
+            return " Please use the format YYYY-MM-DD."
+        if compiled.numeric:
+            return " Please answer with a number."
+        return ""
@@ -0,0 +1,130 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from loguru import logger
+
+from form.db.db_operations import DatabaseOperations
+from form.db.db_tables import Session
+from form.utils.text_handler import estimate_tokens
+
+from .summary_agent import SummaryAgent
+
+HISTORY_HEADER = "continue from history conversations: ...\n"
+
+
+class HistoryManager:
+    """Bound the conversation history sent to the agents.
+
+    The messages already covered by the rolling summary of the session are
+    dropped. Once at least `batch` messages beyond the last `window` have piled
+    up, they are folded into the summary by the summary agent, which runs
+    alongside the other agents of the turn.
+
+    Args:
+        db_ops (DatabaseOperations): Stores the updated summary.
+        session_id (UUID): The chat session.
+        window (int): The number of most recent messages kept verbatim.
+        batch (int): The minimum number of messages folded into the summary at once.
+    """
+
+    def __init__(
+        self,
+        db_ops: DatabaseOperations,
+        session_id: UUID,
+        window: int,
+        batch: int,
+        summary_agent: Optional[SummaryAgent] = None,
+    ):
+        self.db_ops = db_ops
+        self.session_id = session_id
+        self.window = window
+        self.batch = batch
+        self.summary_agent = summary_agent or SummaryAgent()
+        self.summary = ""
+        self.summarized_messages = 0
+        self._summary_task: Optional[asyncio.Task] = None
+        self._summary_covers = 0
+
+    def load(
+        self, session_data: Optional[Session], history: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Drop the messages covered by the stored summary and start folding.
+
+        Args:
+            session_data (Session, optional): The stored session.
+            history (list): All stored messages of the session, oldest first.
+
+        Returns:
+            list: The messages that are not covered by the summary.
+        """
+        summary, summarized_messages = "", 0
+        if session_data is not None:
+            summary = session_data.summary or ""
+            summarized_messages = session_data.summarized_messages or 0
+        history = history[summarized_messages:]
+        self.restore(summary, summarized_messages, history)
+        return history
+
+    def restore(
+        self, summary: str, summarized_messages: int, history: List[Dict[str, Any]]
+    ) -> None:
+        """Resume from a summary and the messages it does not cover yet."""
+        self.summary = summary
+        self.summarized_messages = summarized_messages
+        overflow = len(history) - self.window
+        if overflow >= self.batch:
+            self._summary_covers = self.summarized_messages + overflow
+            self._summary_task = asyncio.create_task(
+                self.summary_agent.process(
+                    self.to_lines(history[:overflow]), summary=self.summary
+                )
+            )
+
+    def render(self, history: List[Dict[str, Any]], max_tokens: int) -> str:
+        """Render the summary and as many of the latest messages as fit the budget.
+
+        The latest message is always included.
+        """
+        text = HISTORY_HEADER
+        if self.summary:
+            text += f"summary of the earlier conversation: {self.summary}\n"
+        budget = max_tokens - estimate_tokens(text)
+        kept: List[str] = []
+        for message in reversed(history):
+            line = self.to_lines([message])
+            cost = estimate_tokens(line) + 1
+            if kept and cost > budget:
+                break
+            budget -= cost
+            kept.append(line)
+        return text + "\n".join(reversed(kept))
+
+    @staticmethod
+    def to_lines(history: List[Dict[str, Any]]) -> str:
+        return "\n".join(
+            f"{message['role']}: {message['content']}" for message in history
+        )
+
+    async def save_summary(self) -> None:
+        """Wait for a running summary update and store it on the session."""
+        if self._summary_task is None:
+            return
+        task, self._summary_task = self._summary_task, None
+        try:
+            response = await task
+            await self.db_ops.update_session_summary(
+                self.session_id, response["summary"], self._summary_covers
+            )
+        except Exception as e:
+            # The summary is retried on the next turn, the current one is unaffected
+            logger.warning(f"Failed to update the history summary: {e}")
+            return
+        self.summary = response["summary"]
+        self.summarized_messages = self._summary_covers
+        logger.info(f"History summary covers {self.summarized_messages} messages")
+
+    def cancel(self) -> None:
+        if self._summary_task is not None:
+            self._summary_task.cancel()
+            self._summary_task = None
@@ -2,18 +2,17 @@ from form.agents.base_agent import BaseAgent
 
 
 class IntentAgent(BaseAgent):
+    agent_key = "intent"
+    response_keys = ("intent", "content", "to")
+    decision_keys = ("intent", "to")
+
     async def process(self, input_prompt: str, messages: str):
-        sys_prompt = self._get_sys_prompt(messages)
-        response = await self._call_openai(
-            model_name="gpt-4o",
-            messages=[
-                {"role": "system", "content": sys_prompt},
-                {"role": "user", "content": input_prompt},
-            ],
+        response = await self._call_model(
+            messages=self._build_messages(
+                self._get_sys_prompt(), messages, input_prompt
+            ),
         )
         return response
 
-    def _get_sys_prompt(self, messages: str):
-        return (
-            messages + "\n\n" + self._read_prompt("form/prompts/intent_sys_prompt.txt")
-        )
+    def _get_sys_prompt(self):
+        return self._read_prompt("form/prompts/intent_sys_prompt.txt")
@@ -1,29 +1,49 @@
 import json
+from typing import Optional
 
 from form.agents.base_agent import BaseAgent
+from form.utils.config import AgentModel
 
 
 class NoteTakingAgent(BaseAgent):
+    agent_key = "note_taking"
+    response_keys = ("schema",)
+
+    def __init__(self, agent_model: Optional[AgentModel] = None):
+        super().__init__(agent_model)
+        self.last_prompt_size = 0
+
     async def process(
-        self, input_prompt: str, form: dict, form_val: dict, messages: list
+        self,
+        input_prompt: str,
+        form: dict,
+        form_val: dict,
+        messages: str,
+        indent: Optional[int] = 2,
     ):
-        sys_prompt = self._get_sys_prompt(form, form_val, messages)
-        response = await self._call_openai(
-            model_name="gpt-4o",
-            messages=[
-                {"role": "system", "content": sys_prompt},
-                {"role": "user", "content": input_prompt},
-            ],
+        # The rules change with the fields sent, so they are not part of the
+        # system prompt
+        prompt_messages = self._build_messages(
+            self._get_sys_prompt(),
+            self._get_context(form, form_val, messages, indent),
+            input_prompt,
         )
+        self.last_prompt_size = sum(len(m["content"]) for m in prompt_messages)
+        response = await self._call_model(messages=prompt_messages)
         return response
 
-    def _get_sys_prompt(self, form: dict, form_val: dict, messages: list):
+    def _get_sys_prompt(self):
+        return self._read_prompt("form/prompts/note_taking_sys_prompt.txt")
+
+    @staticmethod
+    def _get_context(
+        form: dict, form_val: dict, messages: str, indent: Optional[int] = 2
+    ) -> str:
         return (
-            messages
+            "Here are the validation rules:\n"
+            + json.dumps(form_val, indent=indent)
+            + "\n\nThe form has the following fields:\n"
+            + json.dumps(form, indent=indent)
             + "\n\n"
-            + self._read_prompt(
-                "form/prompts/note_taking_sys_prompt.txt",
-                form=json.dumps(form, indent=2),
-                validation_rules=json.dumps(form_val, indent=2),
-            )
+            + messages
         )
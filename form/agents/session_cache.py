@@ -0,0 +1,38 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from form.utils.cache import TTLCache
+from form.utils.config import get_settings
+
+
+@dataclass
+class SessionState:
+    """What a chat turn loads from the database, as of the last stored turn.
+
+    `history` holds the stored messages that are not covered by the rolling
+    summary, formatted as chat history entries. `form_version` is None if the
+    session is not stored yet.
+    """
+
+    form: Dict[str, Any]
+    form_validation: Dict[str, Any]
+    history: List[Dict[str, str]]
+    summary: str = ""
+    summarized_messages: int = 0
+    form_version: Optional[int] = None
+
+
+_SESSION_CACHE: Optional[TTLCache] = None
+
+
+def get_session_cache() -> Optional[TTLCache]:
+    """Get the process-wide session state cache, or None if it is disabled."""
+    global _SESSION_CACHE
+    config = get_settings().session_cache
+    if not config.enabled:
+        return None
+    if _SESSION_CACHE is None:
+        _SESSION_CACHE = TTLCache(
+            max_size=config.max_size, ttl_seconds=config.ttl_seconds
+        )
+    return _SESSION_CACHE
@@ -3,10 +3,13 @@ from form.agents.base_agent import BaseAgent
 
 
 class SpecialistAgent(BaseAgent):
+    agent_key = "specialist"
+    response_keys = ("is_clarification_needed", "content")
+    decision_keys = ("is_clarification_needed",)
+
     async def process(self, input_prompt: str, messages: str):
         sys_prompt = self._get_sys_prompt()
-        response = await self._call_openai(
-            model_name="gpt-4o",
+        response = await self._call_model(
             messages=[
                 {"role": "system", "content": sys_prompt},
                 {
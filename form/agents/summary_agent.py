@@ -0,0 +1,23 @@
+from form.agents.base_agent import BaseAgent
+
+
+class SummaryAgent(BaseAgent):
+    agent_key = "summary"
+    response_keys = ("summary",)
+
+    async def process(self, input_prompt: str, summary: str = ""):
+        sys_prompt = self._get_sys_prompt()
+        response = await self._call_model(
+            messages=[
+                {"role": "system", "content": sys_prompt},
+                {
+                    "role": "user",
+                    "content": f"Current summary: {summary or '(empty)'}\n\n"
+                    f"Next messages:\n{input_prompt}",
+                },
+            ],
+        )
+        return response
+
+    def _get_sys_prompt(self) -> str:
+        return self._read_prompt("form/prompts/summary_sys_prompt.txt")
@@ -1,21 +1,163 @@
+import asyncio
 import json
 from datetime import datetime
+from typing import Any, AsyncGenerator, Dict, List, Optional
 from uuid import UUID, uuid5
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from form.agents.agents_manager import AgentsManager
+from form.agents.session_cache import SessionState, get_session_cache
 from form.api.deps import get_session
-from form.db.db_operations import DatabaseOperations
+from form.db import get_async_session
+from form.db.db_operations import DatabaseOperations, FormField
 from form.models.exceptions import AgentProcessingError, DatabaseOperationError
 from form.models.requests import ChatInput
 from form.models.responses import ChatOutput
+from form.utils.compiled_form import to_json_patch
+from form.utils.config import get_settings
 
 router = APIRouter()
 
 
+def _get_form_fields(chat_response: ChatOutput) -> Optional[List[FormField]]:
+    """Get the changed fields to write on their own, None to write the whole form."""
+    if not get_settings().chat.partial_form_writes or not chat_response.form_version:
+        return None
+    # Added fields may need parent objects that jsonb_set does not create
+    if any(change["old"] is None for change in chat_response.changes):
+        return None
+    return [
+        (change["path"].split("."), change["new"]) for change in chat_response.changes
+    ]
+
+
+async def _save_chat_turn(
+    db_ops: DatabaseOperations,
+    session_id: UUID,
+    prompt: str,
+    chat_response: ChatOutput,
+    session_state: Optional[SessionState] = None,
+    form_changed: bool = True,
+) -> None:
+    session_cache = get_session_cache()
+    try:
+        message_id = uuid5(session_id, datetime.now().isoformat())
+        form_fields = _get_form_fields(chat_response) if form_changed else None
+        base_version = (chat_response.form_version or 0) - 1
+        if get_settings().chat.unit_of_work and form_changed:
+            written = form_fields is not None and await db_ops.save_chat_turn(
+                session_id=session_id,
+                form_data=None,
+                message_id=message_id,
+                prompt=prompt,
+                response=chat_response.response,
+                changes=chat_response.changes,
+                form_fields=form_fields,
+                form_version=base_version,
+            )
+            if not written:
+                await db_ops.save_chat_turn(
+                    session_id=session_id,
+                    form_data=json.dumps(chat_response.form),
+                    message_id=message_id,
+                    prompt=prompt,
+                    response=chat_response.response,
+                    changes=chat_response.changes,
+                )
+        else:
+            # A turn that changed no field leaves the stored form and its version
+            patched = form_fields is not None and await db_ops.patch_session_form(
+                session_id, form_fields, base_version
+            )
+            if form_changed and not patched:
+                await db_ops.upsert_session(
+                    session_id=session_id, form_data=json.dumps(chat_response.form)
+                )
+            await db_ops.upsert_message(
+                message_id=message_id,
+                session_id=session_id,
+                prompt=prompt,
+                response=chat_response.response,
+                changes=chat_response.changes,
+            )
+    except DatabaseOperationError as e:
+        logger.exception(f"Database operation error: {str(e)}")
+        # We don't raise an exception here because we want to return the chat response
+        # even if the database operation fails
+        logger.warning("Failed to save chat history to database")
+        if session_cache is not None:
+            session_cache.pop(session_id)
+        return
+    # Write-through: the cache only ever holds what is stored in the database
+    if session_cache is not None and session_state is not None:
+        session_cache.set(session_id, session_state)
+
+
+def _get_session_state(
+    agent_manager: AgentsManager, prompt: str, chat_response: ChatOutput
+) -> Optional[SessionState]:
+    if get_session_cache() is None:
+        return None
+    return agent_manager.get_session_state(prompt, chat_response.response)
+
+
+# Chat turns still being written after their response was sent, by session
+_PENDING_CHAT_TURNS: Dict[UUID, asyncio.Task] = {}
+
+
+def _save_chat_turn_deferred(
+    session_id: UUID,
+    prompt: str,
+    chat_response: ChatOutput,
+    session_state: Optional[SessionState],
+    form_changed: bool = True,
+) -> None:
+    previous_turn = _PENDING_CHAT_TURNS.get(session_id)
+
+    async def write_turn():
+        if previous_turn is not None:
+            await asyncio.gather(previous_turn, return_exceptions=True)
+        # The request session is closed once the response is sent
+        async with get_async_session() as session:
+            await _save_chat_turn(
+                DatabaseOperations(session),
+                session_id,
+                prompt,
+                chat_response,
+                session_state,
+                form_changed,
+            )
+
+    task = asyncio.create_task(write_turn())
+    _PENDING_CHAT_TURNS[session_id] = task
+
+    def forget(finished: asyncio.Task) -> None:
+        if _PENDING_CHAT_TURNS.get(session_id) is finished:
+            del _PENDING_CHAT_TURNS[session_id]
+
+    task.add_done_callback(forget)
+
+
+async def _wait_for_pending_chat_turn(session_id: UUID) -> None:
+    # The next turn must load the history including the previous one
+    pending_turn = _PENDING_CHAT_TURNS.get(session_id)
+    if pending_turn is not None:
+        await asyncio.gather(asyncio.shield(pending_turn), return_exceptions=True)
+
+
+async def wait_for_pending_chat_turns() -> None:
+    """Wait until every deferred chat turn write has finished."""
+    await asyncio.gather(*_PENDING_CHAT_TURNS.values(), return_exceptions=True)
+
+
+def _format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @router.post(
     "/message",
     response_model=ChatOutput,
@@ -26,13 +168,17 @@ async def chat_with_gpt(
     session_id: UUID,
     session: AsyncSession = Depends(get_session),
 ) -> ChatOutput:
+    await _wait_for_pending_chat_turn(session_id)
     agent_manager = AgentsManager(session, session_id)
     db_ops = DatabaseOperations(session)
 
     try:
         response = await agent_manager.process_input(input_prompt=input_data.message)
         chat_response = ChatOutput(
-            response=response["content"], form=response["schema"]
+            response=response["content"],
+            form=response["schema"],
+            changes=agent_manager.get_turn_changes(),
+            form_version=agent_manager.next_form_version,
         )
     except AgentProcessingError as e:
         logger.exception(f"Agent processing error: {str(e)}")
@@ -44,20 +190,82 @@ async def chat_with_gpt(
             detail="An unexpected error occurred. Please try again or contact the admin if the issue persists.",
         )
 
-    try:
-        await db_ops.upsert_session(
-            session_id=session_id, form_data=json.dumps(chat_response.form)
+    session_state = _get_session_state(agent_manager, input_data.message, chat_response)
+    if get_settings().chat.deferred_persistence:
+        _save_chat_turn_deferred(
+            session_id,
+            input_data.message,
+            chat_response,
+            session_state,
+            agent_manager.form_changed,
         )
-        await db_ops.upsert_message(
-            message_id=uuid5(session_id, datetime.now().isoformat()),
-            session_id=session_id,
-            prompt=input_data.message,
-            response=chat_response.response,
+    else:
+        await _save_chat_turn(
+            db_ops,
+            session_id,
+            input_data.message,
+            chat_response,
+            session_state,
+            agent_manager.form_changed,
         )
-    except DatabaseOperationError as e:
-        logger.exception(f"Database operation error: {str(e)}")
-        # We don't raise an exception here because we want to return the chat response
-        # even if the database operation fails
-        logger.warning("Failed to save chat history to database")
 
+    # The client has the form the turn started from, send it the changes only
+    if input_data.form_version is not None and (
+        input_data.form_version == agent_manager.form_version
+    ):
+        patch = to_json_patch(agent_manager.turn_changes)
+        if patch is not None:
+            return chat_response.model_copy(update={"form": None, "patch": patch})
     return chat_response
+
+
+@router.post(
+    "/message/stream",
+    response_class=StreamingResponse,
+    description="Chat with GPT and stream the response as Server-Sent Events",
+)
+async def stream_chat_with_gpt(
+    input_data: ChatInput,
+    session_id: UUID,
+) -> StreamingResponse:
+    async def event_stream() -> AsyncGenerator[str, None]:
+        # The stream outlives the request dependencies, so it owns its DB session
+        await _wait_for_pending_chat_turn(session_id)
+        async with get_async_session() as session:
+            agent_manager = AgentsManager(session, session_id)
+            chat_response = None
+            try:
+                async for event in agent_manager.stream_input(
+                    input_prompt=input_data.message
+                ):
+                    if event["event"] == "form":
+                        chat_response = ChatOutput(**event["data"])
+                    yield _format_sse(event["event"], event["data"])
+            except AgentProcessingError as e:
+                logger.exception(f"Agent processing error: {str(e)}")
+                yield _format_sse("error", {"detail": str(e)})
+                return
+            except Exception as e:
+                logger.exception(f"Unexpected error in stream_chat_with_gpt: {str(e)}")
+                yield _format_sse(
+                    "error",
+                    {
+                        "detail": "An unexpected error occurred. Please try again or contact the admin if the issue persists."
+                    },
+                )
+                return
+
+            await _save_chat_turn(
+                DatabaseOperations(session),
+                session_id,
+                input_data.message,
+                chat_response,
+                _get_session_state(agent_manager, input_data.message, chat_response),
+                agent_manager.form_changed,
+            )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -3,9 +3,13 @@ from typing import List
 from fastapi import APIRouter, Depends, HTTPException, Response
 from loguru import logger
 
+from form.db import get_async_engine_pool_status
 from form.db.db_check import DatabaseChecks, get_db_checks
 from form.db.db_tables import Message, Session
 from form.models.exceptions import DatabaseOperationError
+from form.models.responses import PoolStatusOutput, TemplateRegistryStatsOutput
+from form.utils.metrics import get_agent_metrics, get_fast_path_metrics
+from form.utils.templates import get_template_registry
 
 router = APIRouter()
 
@@ -27,6 +31,38 @@ async def check_db(db_checks: DatabaseChecks = Depends(get_db_checks)):
         )
 
 
+@router.get(
+    "/check_db_pool",
+    response_model=PoolStatusOutput,
+    description="Get the database connection pool statistics",
+)
+async def check_db_pool() -> PoolStatusOutput:
+    return PoolStatusOutput(**get_async_engine_pool_status())
+
+
+@router.get(
+    "/check_templates",
+    response_model=TemplateRegistryStatsOutput,
+    description="Get the load and render statistics of the prompt templates",
+)
+async def check_templates() -> TemplateRegistryStatsOutput:
+    return TemplateRegistryStatsOutput(**get_template_registry().stats())
+
+
+@router.get(
+    "/metrics",
+    description="Get the token and latency counters of the agent calls and the fast path hits and misses in the Prometheus text format",
+    response_class=Response,
+)
+async def get_metrics():
+    return Response(
+        status_code=200,
+        content=get_agent_metrics().render_prometheus()
+        + get_fast_path_metrics().render_prometheus(),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
 @router.get(
     "/check_table/{table_name}", description="Check if a table exists in the database"
 )
@@ -1,18 +1,47 @@
 import json
-from typing import List
+from typing import Annotated, AsyncGenerator, List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from loguru import logger
 
+from form.agents.session_cache import get_session_cache
+from form.db import get_async_session
 from form.db.db_operations import DatabaseOperations, get_db_ops
+from form.db.db_tables import Session
 from form.models.exceptions import DatabaseOperationError
-from form.models.responses import MessageDataOutput, SessionDataOutput
-from form.utils.form_handler import read_json
+from form.models.responses import (
+    MessageDataOutput,
+    SessionCacheStatsOutput,
+    SessionDataOutput,
+)
+from form.utils.compiled_form import in_template_order
+from form.utils.config import get_settings
+from form.utils.templates import get_template_registry
 
 router = APIRouter()
 
 
+def _invalidate_session_state(session_id: UUID) -> None:
+    session_cache = get_session_cache()
+    if session_cache is not None:
+        session_cache.pop(session_id)
+
+
+def _to_session_output(session: Session) -> SessionDataOutput:
+    return SessionDataOutput(
+        session_id=session.session_id,
+        form_data=in_template_order(
+            json.loads(session.form_data),
+            get_template_registry().get_json("form/schemas/form.json"),
+        ),
+        form_version=session.form_version,
+        created_at=session.created_at,
+        last_updated_at=session.last_updated_at,
+    )
+
+
 @router.post(
     "/create_session",
     response_model=SessionDataOutput,
@@ -24,15 +53,11 @@ async def create_session(
 ) -> SessionDataOutput:
     try:
         await db_ops.create_session(
-            session_id, json.dumps(read_json(path="form/schemas/form.json"))
+            session_id,
+            json.dumps(get_template_registry().get_json("form/schemas/form.json")),
         )
         session_data = await db_ops.get_session_data(session_id)
-        return SessionDataOutput(
-            session_id=session_data.session_id,
-            form_data=json.loads(session_data.form_data),
-            created_at=session_data.created_at,
-            last_updated_at=session_data.last_updated_at,
-        )
+        return _to_session_output(session_data)
     except DatabaseOperationError as e:
         logger.error(f"Database error while creating session: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -44,24 +69,47 @@ async def create_session(
     description="Get all available sessions from the database",
 )
 async def get_all_sessions(
+    response: Response,
+    limit: Annotated[
+        Optional[int], Query(ge=1, description="Maximum number of sessions")
+    ] = None,
+    after: Annotated[
+        Optional[UUID],
+        Query(description="Return sessions after this cursor (X-Next-Cursor)"),
+    ] = None,
     db_ops: DatabaseOperations = Depends(get_db_ops),
 ) -> List[SessionDataOutput]:
     try:
-        sessions = await db_ops.get_all_sessions()
-        return [
-            SessionDataOutput(
-                session_id=session.session_id,
-                form_data=json.loads(session.form_data),
-                created_at=session.created_at,
-                last_updated_at=session.last_updated_at,
-            )
-            for session in sessions
-        ]
+        sessions = await db_ops.get_all_sessions(limit=limit, after=after)
+        if limit is not None and len(sessions) == limit:
+            response.headers["X-Next-Cursor"] = str(sessions[-1].session_id)
+        return [_to_session_output(session) for session in sessions]
     except DatabaseOperationError as e:
         logger.error(f"Database error while fetching all sessions: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@router.get(
+    "/stream_all_sessions",
+    response_class=StreamingResponse,
+    description="Stream all sessions from the database as newline-delimited JSON",
+)
+async def stream_all_sessions() -> StreamingResponse:
+    async def session_stream() -> AsyncGenerator[str, None]:
+        # The stream outlives the request dependencies, so it owns its DB session
+        async with get_async_session() as db_session:
+            db_ops = DatabaseOperations(db_session)
+            batch_size = get_settings().database.stream_batch_size
+            try:
+                async for session in db_ops.stream_sessions(batch_size):
+                    yield _to_session_output(session).model_dump_json() + "\n"
+            except DatabaseOperationError as e:
+                logger.error(f"Database error while streaming all sessions: {e}")
+                yield json.dumps({"error": "Internal server error"}) + "\n"
+
+    return StreamingResponse(session_stream(), media_type="application/x-ndjson")
+
+
 @router.get(
     "/get_session_data/{session_id}",
     response_model=SessionDataOutput,
@@ -77,12 +125,7 @@ async def get_session(
             raise HTTPException(
                 status_code=404, detail=f"Session {session_id} does not exist"
             )
-        return SessionDataOutput(
-            session_id=session_data.session_id,
-            form_data=json.loads(session_data.form_data),
-            created_at=session_data.created_at,
-            last_updated_at=session_data.last_updated_at,
-        )
+        return _to_session_output(session_data)
     except DatabaseOperationError as e:
         logger.error(f"Database error while fetching session {session_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -105,6 +148,7 @@ async def get_session_messages(
                 session_id=message.session_id,
                 prompt=message.prompt,
                 response=message.response,
+                changes=message.changes or [],
                 created_at=message.created_at,
             )
             for message in messages
@@ -131,18 +175,15 @@ async def update_session(
 ) -> SessionDataOutput:
     try:
         if create_if_not_exists:
-            await db_ops.upsert_session(
+            updated_session = await db_ops.upsert_session(
                 session_id=session_id, form_data=json.dumps(form_data)
             )
-        await db_ops.update_session_data(session_id, json.dumps(form_data))
-        updated_session = await db_ops.get_session_data(session_id)
-
-        return SessionDataOutput(
-            session_id=updated_session.session_id,
-            form_data=json.loads(updated_session.form_data),
-            created_at=updated_session.created_at,
-            last_updated_at=updated_session.last_updated_at,
-        )
+        else:
+            updated_session = await db_ops.update_session_data(
+                session_id, json.dumps(form_data)
+            )
+        _invalidate_session_state(session_id)
+        return _to_session_output(updated_session)
     except ValueError as _:
         raise HTTPException(
             status_code=404, detail=f"Session {session_id} does not exist"
@@ -163,6 +204,7 @@ async def delete_session(
 ) -> Response:
     try:
         await db_ops.delete_session(session_id)
+        _invalidate_session_state(session_id)
         return Response(status_code=204)
     except ValueError as _:
         raise HTTPException(
@@ -171,3 +213,15 @@ async def delete_session(
     except DatabaseOperationError as e:
         logger.error(f"Database error while deleting session {session_id}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get(
+    "/session_cache_stats",
+    response_model=SessionCacheStatsOutput,
+    description="Get the hit and miss counters of the session state cache",
+)
+async def session_cache_stats() -> SessionCacheStatsOutput:
+    session_cache = get_session_cache()
+    if session_cache is None:
+        return SessionCacheStatsOutput(enabled=False)
+    return SessionCacheStatsOutput(enabled=True, **session_cache.stats())
@@ -1,20 +1,65 @@
-from typing import Annotated, List, Literal
+import base64
+import json
+from typing import Annotated, AsyncGenerator, List, Literal, Optional, Union
 from uuid import UUID
 
+import numpy as np
 from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from loguru import logger
 
+from form.db import get_async_session
+from form.db.db_indexes import VectorIndexes, get_vector_indexes
 from form.db.db_operations import DatabaseOperations, get_db_ops
+from form.db.db_tables import Embedding
 from form.models.exceptions import DatabaseOperationError
 from form.models.requests import Document
 from form.models.responses import (
+    EmbeddingCacheStatsOutput,
     EmbeddingDataOutput,
     EmbeddingWithDistanceOutput,
+    VectorIndexOutput,
 )
+from form.utils.config import get_settings
+from form.utils.text_handler import convert_str_to_uuid
+from form.vectorstore.backends import VectorSearchBackend, get_vector_backend
+from form.vectorstore.cache import get_embedding_cache
 from form.vectorstore.pgvector import OpenAIEmbeddings
 
 router = APIRouter()
 
+VectorFormat = Annotated[
+    Literal["list", "base64", "omit"],
+    Query(
+        description="Return the vectors as lists of floats, as base64-encoded "
+        "little-endian float32, or leave them out"
+    ),
+]
+
+
+def _format_vector(
+    embedding: Embedding, vector_format: str
+) -> Optional[Union[List[float], str]]:
+    if vector_format == "omit":
+        return None
+    if vector_format == "base64":
+        packed = np.asarray(embedding.embedding, dtype="<f4").tobytes()
+        return base64.b64encode(packed).decode("ascii")
+    return embedding.embedding.tolist()
+
+
+def _to_embedding_output(
+    embedding: Embedding, vector_format: str
+) -> EmbeddingDataOutput:
+    return EmbeddingDataOutput(
+        embedding_id=embedding.embedding_id,
+        content=embedding.content,
+        embedding=_format_vector(embedding, vector_format),
+        properties=embedding.properties,
+        created_at=embedding.created_at,
+        last_updated_at=embedding.last_updated_at,
+    )
+
 
 @router.put(
     "/upsert_embedding",
@@ -25,9 +70,11 @@ router = APIRouter()
 async def upsert_embedding(
     doc: Document,
     db_ops: DatabaseOperations = Depends(get_db_ops),
+    vector_backend: VectorSearchBackend = Depends(get_vector_backend),
 ) -> Response:
     try:
-        await db_ops.upsert_embedding(doc)
+        embedding = await db_ops.upsert_embedding(doc)
+        vector_backend.on_upsert({convert_str_to_uuid(doc.content): embedding})
         return Response(status_code=204)
     except DatabaseOperationError as e:
         logger.error(f"Database error while upserting embedding: {e}")
@@ -43,9 +90,10 @@ async def upsert_embedding(
 async def upsert_embeddings(
     embeddings: List[Document],
     db_ops: DatabaseOperations = Depends(get_db_ops),
+    vector_backend: VectorSearchBackend = Depends(get_vector_backend),
 ) -> Response:
     try:
-        await db_ops.upsert_embeddings(embeddings)
+        vector_backend.on_upsert(await db_ops.upsert_embeddings(embeddings))
         return Response(status_code=204)
     except DatabaseOperationError as e:
         logger.error(f"Database error while upserting embeddings: {e}")
@@ -58,26 +106,58 @@ async def upsert_embeddings(
     description="Get all available embeddings from the database",
 )
 async def get_all_embeddings(
+    response: Response,
+    vector_format: VectorFormat = "list",
+    limit: Annotated[
+        Optional[int], Query(ge=1, description="Maximum number of embeddings")
+    ] = None,
+    after: Annotated[
+        Optional[UUID],
+        Query(description="Return embeddings after this cursor (X-Next-Cursor)"),
+    ] = None,
     db_ops: DatabaseOperations = Depends(get_db_ops),
 ) -> List[EmbeddingDataOutput]:
     try:
-        embeddings = await db_ops.get_all_embeddings()
+        embeddings = await db_ops.get_all_embeddings(
+            load_vector=vector_format != "omit", limit=limit, after=after
+        )
+        if limit is not None and len(embeddings) == limit:
+            response.headers["X-Next-Cursor"] = str(embeddings[-1].embedding_id)
         return [
-            EmbeddingDataOutput(
-                embedding_id=embedding.embedding_id,
-                content=embedding.content,
-                embedding=embedding.embedding.tolist(),
-                properties=embedding.properties,
-                created_at=embedding.created_at,
-                last_updated_at=embedding.last_updated_at,
-            )
-            for embedding in embeddings
+            _to_embedding_output(embedding, vector_format) for embedding in embeddings
         ]
     except DatabaseOperationError as e:
         logger.error(f"Database error while fetching all embeddings: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@router.get(
+    "/stream_all_embeddings",
+    response_class=StreamingResponse,
+    description="Stream all embeddings from the database as newline-delimited JSON",
+)
+async def stream_all_embeddings(
+    vector_format: VectorFormat = "list",
+) -> StreamingResponse:
+    async def embedding_stream() -> AsyncGenerator[str, None]:
+        # The stream outlives the request dependencies, so it owns its DB session
+        async with get_async_session() as db_session:
+            db_ops = DatabaseOperations(db_session)
+            embeddings = db_ops.stream_embeddings(
+                load_vector=vector_format != "omit",
+                batch_size=get_settings().database.stream_batch_size,
+            )
+            try:
+                async for embedding in embeddings:
+                    output = _to_embedding_output(embedding, vector_format)
+                    yield output.model_dump_json() + "\n"
+            except DatabaseOperationError as e:
+                logger.error(f"Database error while streaming all embeddings: {e}")
+                yield json.dumps({"error": "Internal server error"}) + "\n"
+
+    return StreamingResponse(embedding_stream(), media_type="application/x-ndjson")
+
+
 @router.get(
     "/get_embedding/{embedding_id}",
     response_model=EmbeddingDataOutput,
@@ -113,20 +193,15 @@ async def get_embedding(
 )
 async def get_embeddings(
     embedding_id: Annotated[List[UUID], Query()],
+    vector_format: VectorFormat = "list",
     db_ops: DatabaseOperations = Depends(get_db_ops),
 ) -> List[EmbeddingDataOutput]:
     try:
-        embeddings = await db_ops.get_embeddings(embedding_id)
+        embeddings = await db_ops.get_embeddings(
+            embedding_id, load_vector=vector_format != "omit"
+        )
         return [
-            EmbeddingDataOutput(
-                embedding_id=embedding.embedding_id,
-                content=embedding.content,
-                embedding=embedding.embedding.tolist(),
-                properties=embedding.properties,
-                created_at=embedding.created_at,
-                last_updated_at=embedding.last_updated_at,
-            )
-            for embedding in embeddings
+            _to_embedding_output(embedding, vector_format) for embedding in embeddings
         ]
     except ValueError as _:
         raise HTTPException(status_code=404, detail="None of the embeddings exist")
@@ -143,9 +218,11 @@ async def get_embeddings(
 async def delete_embedding(
     embedding_id: UUID,
     db_ops: DatabaseOperations = Depends(get_db_ops),
+    vector_backend: VectorSearchBackend = Depends(get_vector_backend),
 ) -> Response:
     try:
         await db_ops.delete_embedding(embedding_id)
+        vector_backend.on_delete([embedding_id])
         return Response(status_code=204)
     except ValueError as _:
         raise HTTPException(
@@ -164,9 +241,11 @@ async def delete_embedding(
 async def delete_embeddings(
     embedding_id: Annotated[List[UUID] | None, Query()] = None,
     db_ops: DatabaseOperations = Depends(get_db_ops),
+    vector_backend: VectorSearchBackend = Depends(get_vector_backend),
 ) -> Response:
     try:
         await db_ops.delete_embeddings(embedding_id)
+        vector_backend.on_delete(embedding_id)
         return Response(status_code=204)
     except ValueError as _:
         raise HTTPException(status_code=404, detail="None of the embeddings exist")
@@ -221,22 +300,33 @@ async def get_nearest_embeddings(
         "l2_distance",
         "hamming_distance",
     ] = "l2_distance",
+    ef_search: Annotated[
+        Optional[int],
+        Query(ge=1, le=1000, description="HNSW candidate list size for this query"),
+    ] = None,
+    probes: Annotated[
+        Optional[int],
+        Query(ge=1, description="IVFFlat lists to scan for this query"),
+    ] = None,
+    vector_format: VectorFormat = "list",
     db_ops: DatabaseOperations = Depends(get_db_ops),
+    vector_backend: VectorSearchBackend = Depends(get_vector_backend),
 ) -> List[EmbeddingWithDistanceOutput]:
     try:
-        async with OpenAIEmbeddings() as openai_embedding:
+        async with OpenAIEmbeddings(db=db_ops.db) as openai_embedding:
             target_embedding = await openai_embedding.get_embedding(query)
-        embeddings = await db_ops.get_nearest_embeddings(
-            target_embedding, limit, distance_type
+        embeddings = await vector_backend.get_nearest_embeddings(
+            db_ops,
+            target_embedding,
+            limit,
+            distance_type,
+            ef_search=ef_search,
+            probes=probes,
+            load_vector=vector_format != "omit",
         )
         return [
             EmbeddingWithDistanceOutput(
-                embedding_id=embedding.embedding_id,
-                content=embedding.content,
-                embedding=embedding.embedding.tolist(),
-                properties=embedding.properties,
-                created_at=embedding.created_at,
-                last_updated_at=embedding.last_updated_at,
+                **_to_embedding_output(embedding, vector_format).model_dump(),
                 distance=distance,
             )
             for embedding, distance in embeddings
@@ -261,24 +351,22 @@ async def get_embeddings_within_distance(
         "l2_distance",
         "hamming_distance",
     ] = "l2_distance",
+    vector_format: VectorFormat = "list",
     db_ops: DatabaseOperations = Depends(get_db_ops),
+    vector_backend: VectorSearchBackend = Depends(get_vector_backend),
 ) -> List[EmbeddingDataOutput]:
     try:
-        async with OpenAIEmbeddings() as openai_embedding:
+        async with OpenAIEmbeddings(db=db_ops.db) as openai_embedding:
             target_embedding = await openai_embedding.get_embedding(query)
-        embeddings = await db_ops.get_embeddings_within_distance(
-            target_embedding, distance, distance_type
+        embeddings = await vector_backend.get_embeddings_within_distance(
+            db_ops,
+            target_embedding,
+            distance,
+            distance_type,
+            load_vector=vector_format != "omit",
         )
         return [
-            EmbeddingDataOutput(
-                embedding_id=embedding.embedding_id,
-                content=embedding.content,
-                embedding=embedding.embedding.tolist(),
-                properties=embedding.properties,
-                created_at=embedding.created_at,
-                last_updated_at=embedding.last_updated_at,
-            )
-            for embedding in embeddings
+            _to_embedding_output(embedding, vector_format) for embedding in embeddings
         ]
     except DatabaseOperationError as e:
         logger.error(f"Database error while fetching embeddings within distance: {e}")
@@ -292,9 +380,10 @@ async def get_embeddings_within_distance(
 )
 async def embed_query(
     query: str,
+    db_ops: DatabaseOperations = Depends(get_db_ops),
 ) -> List[float]:
     try:
-        async with OpenAIEmbeddings() as openai_embedding:
+        async with OpenAIEmbeddings(db=db_ops.db) as openai_embedding:
             embedding = await openai_embedding.get_embedding(query)
         return embedding
     except ValueError as _:
@@ -311,9 +400,10 @@ async def embed_query(
 )
 async def embed_queries(
     queries: Annotated[List[str] | None, Query()] = None,
+    db_ops: DatabaseOperations = Depends(get_db_ops),
 ) -> List[List[float]]:
     try:
-        async with OpenAIEmbeddings() as openai_embedding:
+        async with OpenAIEmbeddings(db=db_ops.db) as openai_embedding:
             embeddings = await openai_embedding.get_embeddings(queries)
         return [embedding for embedding in embeddings]
     except ValueError as _:
@@ -321,3 +411,115 @@ async def embed_queries(
     except Exception as e:
         logger.error(f"Error while embedding queries {queries}: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get(
+    "/embedding_cache_stats",
+    response_model=EmbeddingCacheStatsOutput,
+    description="Get the hit and miss counters of the query embedding cache",
+)
+async def embedding_cache_stats() -> EmbeddingCacheStatsOutput:
+    embedding_cache = get_embedding_cache()
+    if embedding_cache is None:
+        return EmbeddingCacheStatsOutput(enabled=False)
+    return EmbeddingCacheStatsOutput(enabled=True, **embedding_cache.stats())
+
+
+@router.get(
+    "/get_index_status",
+    response_model=List[VectorIndexOutput],
+    description="Get the status of the vector indexes of the embeddings table",
+)
+async def get_index_status(
+    vector_indexes: VectorIndexes = Depends(get_vector_indexes),
+) -> List[VectorIndexOutput]:
+    try:
+        return [
+            VectorIndexOutput(**index)
+            for index in await vector_indexes.get_index_status()
+        ]
+    except DatabaseOperationError as e:
+        logger.error(f"Database error while fetching index status: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.put(
+    "/create_index",
+    status_code=204,
+    response_class=Response,
+    description="Create an HNSW or IVFFlat index for a distance type",
+)
+async def create_index(
+    method: Literal["hnsw", "ivfflat"] = "hnsw",
+    distance_type: Literal[
+        "max_inner_product",
+        "cosine_distance",
+        "l1_distance",
+        "l2_distance",
+    ] = "l2_distance",
+    m: Annotated[int, Query(ge=2, le=100)] = 16,
+    ef_construction: Annotated[int, Query(ge=4, le=1000)] = 64,
+    lists: Annotated[int, Query(ge=1, le=32768)] = 100,
+    vector_indexes: VectorIndexes = Depends(get_vector_indexes),
+) -> Response:
+    try:
+        await vector_indexes.create_index(
+            method, distance_type, m=m, ef_construction=ef_construction, lists=lists
+        )
+        return Response(status_code=204)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DatabaseOperationError as e:
+        logger.error(f"Database error while creating index: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post(
+    "/rebuild_index",
+    status_code=204,
+    response_class=Response,
+    description="Rebuild the index of a distance type",
+)
+async def rebuild_index(
+    method: Literal["hnsw", "ivfflat"] = "hnsw",
+    distance_type: Literal[
+        "max_inner_product",
+        "cosine_distance",
+        "l1_distance",
+        "l2_distance",
+    ] = "l2_distance",
+    vector_indexes: VectorIndexes = Depends(get_vector_indexes),
+) -> Response:
+    try:
+        await vector_indexes.rebuild_index(method, distance_type)
+        return Response(status_code=204)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except DatabaseOperationError as e:
+        logger.error(f"Database error while rebuilding index: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.delete(
+    "/drop_index",
+    status_code=204,
+    description="Drop the index of a distance type",
+)
+async def drop_index(
+    method: Literal["hnsw", "ivfflat"] = "hnsw",
+    distance_type: Literal[
+        "max_inner_product",
+        "cosine_distance",
+        "l1_distance",
+        "l2_distance",
+    ] = "l2_distance",
+    vector_indexes: VectorIndexes = Depends(get_vector_indexes),
+) -> Response:
+    try:
+        await vector_indexes.drop_index(method, distance_type)
+        return Response(status_code=204)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except DatabaseOperationError as e:
+        logger.error(f"Database error while dropping index: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
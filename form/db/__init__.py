@@ -1,3 +1,5 @@
+from typing import Any, Dict
+
 from sqlalchemy.engine.url import URL
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
@@ -7,24 +9,61 @@ from sqlalchemy.ext.asyncio import (
 )
 from sqlalchemy.pool import NullPool
 
-from form.utils.config import get_settings
+from form.utils.config import Database, get_settings
 
 
-def new_async_engine(uri: URL) -> AsyncEngine:
+def new_async_engine(uri: URL, config: Database) -> AsyncEngine:
+    if config.pool_mode == "null":
+        return create_async_engine(
+            uri,
+            pool_pre_ping=config.pool_pre_ping,
+            poolclass=NullPool,
+        )
     return create_async_engine(
         uri,
-        pool_pre_ping=True,
-        # pool_size=20,
-        # max_overflow=100,
-        # pool_timeout=30.0,
-        pool_recycle=600,
-        poolclass=NullPool,
+        pool_pre_ping=config.pool_pre_ping,
+        pool_size=config.pool_size,
+        max_overflow=config.max_overflow,
+        pool_timeout=config.pool_timeout,
+        pool_recycle=config.pool_recycle,
+    )
+
+
+def get_pool_status(engine: AsyncEngine) -> Dict[str, Any]:
+    """Get the connection pool statistics of an engine.
+
+    Args:
+        engine (AsyncEngine): The engine to inspect.
+
+    Returns:
+        dict: The pool class and, for queue pools, the pool counters.
+    """
+    pool = engine.pool
+    status: Dict[str, Any] = {"pool_class": type(pool).__name__}
+    if isinstance(pool, NullPool):
+        return status
+    status.update(
+        size=pool.size(),
+        checked_in=pool.checkedin(),
+        checked_out=pool.checkedout(),
+        overflow=pool.overflow(),
     )
+    return status
 
 
-_ASYNC_ENGINE = new_async_engine(get_settings().sqlalchemy_database_uri)
+_ASYNC_ENGINE = new_async_engine(
+    get_settings().sqlalchemy_database_uri, get_settings().database
+)
 _ASYNC_SESSIONMAKER = async_sessionmaker(_ASYNC_ENGINE, expire_on_commit=False)
 
 
 def get_async_session() -> AsyncSession:  # pragma: no cover
     return _ASYNC_SESSIONMAKER()
+
+
+def get_async_engine_pool_status() -> Dict[str, Any]:
+    return get_pool_status(_ASYNC_ENGINE)
+
+
+async def dispose_async_engine() -> None:  # pragma: no cover
+    await _ASYNC_ENGINE.dispose()
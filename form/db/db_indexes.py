@@ -0,0 +1,186 @@
+from typing import Any, Dict, List, Literal, Optional
+
+from fastapi import Depends
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from form.api.deps import get_session
+from form.models.exceptions import DatabaseOperationError
+
+# pgvector operator class used by an index for each distance type
+DISTANCE_OPERATOR_CLASSES = {
+    "l2_distance": "vector_l2_ops",
+    "cosine_distance": "vector_cosine_ops",
+    "max_inner_product": "vector_ip_ops",
+    "l1_distance": "vector_l1_ops",
+}
+
+
+class VectorIndexes:
+    """Manage the approximate nearest neighbour indexes of the embeddings table."""
+
+    def __init__(self, db_session: AsyncSession):
+        self.db_session = db_session
+
+    @staticmethod
+    def index_name(method: str, distance_type: str) -> str:
+        return f"idx_embeddings_embedding_{method}_{distance_type}"
+
+    @staticmethod
+    def _operator_class(method: str, distance_type: str) -> str:
+        if distance_type not in DISTANCE_OPERATOR_CLASSES:
+            raise ValueError(
+                f"Distance type {distance_type} can not be indexed on a vector column"
+            )
+        if method == "ivfflat" and distance_type == "l1_distance":
+            raise ValueError("IVFFlat indexes do not support l1_distance")
+        return DISTANCE_OPERATOR_CLASSES[distance_type]
+
+    async def _execute_autocommit(self, query: str) -> None:
+        # CREATE/REINDEX ... CONCURRENTLY can not run inside a transaction block
+        try:
+            async with self.db_session.bind.connect() as connection:
+                connection = await connection.execution_options(
+                    isolation_level="AUTOCOMMIT"
+                )
+                await connection.execute(text(query))
+        except SQLAlchemyError as e:
+            logger.exception(f"Error executing index query: {e}")
+            raise DatabaseOperationError(f"Index operation failed: {str(e)}")
+
+    async def create_index(
+        self,
+        method: Literal["hnsw", "ivfflat"],
+        distance_type: str,
+        m: int = 16,
+        ef_construction: int = 64,
+        lists: int = 100,
+    ) -> str:
+        """Create an HNSW or IVFFlat index for a distance type without locking writes.
+
+        Args:
+            method (str): The index method, hnsw or ivfflat.
+            distance_type (str): The distance the index accelerates.
+            m (int): HNSW only, the maximum connections per layer.
+            ef_construction (int): HNSW only, the candidate list size while building.
+            lists (int): IVFFlat only, the number of inverted lists.
+
+        Returns:
+            str: The name of the index.
+        """
+        operator_class = self._operator_class(method, distance_type)
+        name = self.index_name(method, distance_type)
+        if method == "hnsw":
+            options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+        else:
+            options = f"lists = {int(lists)}"
+        await self._execute_autocommit(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON embeddings "
+            f"USING {method} (embedding {operator_class}) WITH ({options})"
+        )
+        return name
+
+    async def rebuild_index(
+        self, method: Literal["hnsw", "ivfflat"], distance_type: str
+    ) -> str:
+        """Rebuild an index, e.g. after bulk loads changed the data distribution."""
+        self._operator_class(method, distance_type)
+        name = self.index_name(method, distance_type)
+        if not await self._index_exists(name):
+            raise ValueError(f"Index {name} does not exist")
+        await self._execute_autocommit(f"REINDEX INDEX CONCURRENTLY {name}")
+        return name
+
+    async def drop_index(
+        self, method: Literal["hnsw", "ivfflat"], distance_type: str
+    ) -> str:
+        self._operator_class(method, distance_type)
+        name = self.index_name(method, distance_type)
+        if not await self._index_exists(name):
+            raise ValueError(f"Index {name} does not exist")
+        await self._execute_autocommit(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        return name
+
+    async def get_index_status(self) -> List[Dict[str, Any]]:
+        """Report the vector indexes of the embeddings table.
+
+        Returns:
+            list: Name, method, distance type, definition, validity, size, number of
+                scans and the build phase (if a build is in progress) of every index.
+        """
+        query = text(
+            """
+            SELECT
+                i.relname AS name,
+                am.amname AS method,
+                opc.opcname AS operator_class,
+                pg_get_indexdef(ix.indexrelid) AS definition,
+                ix.indisvalid AS is_valid,
+                pg_relation_size(ix.indexrelid) AS size_bytes,
+                COALESCE(s.idx_scan, 0) AS scans,
+                p.phase AS build_phase
+            FROM pg_index ix
+            JOIN pg_class i ON i.oid = ix.indexrelid
+            JOIN pg_class t ON t.oid = ix.indrelid
+            JOIN pg_am am ON am.oid = i.relam
+            JOIN pg_opclass opc ON opc.oid = ix.indclass[0]
+            LEFT JOIN pg_stat_user_indexes s ON s.indexrelid = ix.indexrelid
+            LEFT JOIN pg_stat_progress_create_index p ON p.index_relid = ix.indexrelid
+            WHERE t.relname = 'embeddings' AND am.amname IN ('hnsw', 'ivfflat')
+            ORDER BY i.relname
+            """
+        )
+        distance_types = {
+            operator_class: distance_type
+            for distance_type, operator_class in DISTANCE_OPERATOR_CLASSES.items()
+        }
+        try:
+            result = await self.db_session.execute(query)
+            return [
+                {
+                    **row,
+                    "distance_type": distance_types.get(row["operator_class"]),
+                }
+                for row in result.mappings().all()
+            ]
+        except SQLAlchemyError as e:
+            logger.exception(f"Error fetching index status: {e}")
+            raise DatabaseOperationError(f"Index status query failed: {str(e)}")
+
+    async def _index_exists(self, name: str) -> bool:
+        result = await self.db_session.execute(
+            text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}
+        )
+        return bool(result.scalar())
+
+
+async def set_search_parameters(
+    db_session: AsyncSession,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> None:
+    """Set the HNSW and IVFFlat query parameters for the current transaction.
+
+    Args:
+        db_session (AsyncSession): The session running the search.
+        ef_search (int, optional): HNSW candidate list size, trades speed for recall.
+        probes (int, optional): IVFFlat lists to scan, trades speed for recall.
+    """
+    if ef_search is not None:
+        await db_session.execute(
+            text("SELECT set_config('hnsw.ef_search', :value, true)"),
+            {"value": str(int(ef_search))},
+        )
+    if probes is not None:
+        await db_session.execute(
+            text("SELECT set_config('ivfflat.probes', :value, true)"),
+            {"value": str(int(probes))},
+        )
+
+
+async def get_vector_indexes(
+    db_session: AsyncSession = Depends(get_session),
+) -> VectorIndexes:
+    return VectorIndexes(db_session)
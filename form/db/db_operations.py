@@ -1,20 +1,103 @@
+import asyncio
 from datetime import datetime
-from typing import List, Literal, Optional
+from typing import Any, AsyncGenerator, Dict, List, Literal, Optional, Tuple
 from uuid import UUID
 
 from fastapi import Depends
-from sqlalchemy import delete, select, update
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import (
+    ARRAY,
+    JSON,
+    Text,
+    cast,
+    delete,
+    exists,
+    func,
+    literal,
+    literal_column,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import JSONB, aggregate_order_by, insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+from sqlalchemy.sql import Select
 
 from form.api.deps import get_session
+from form.db.db_indexes import set_search_parameters
 from form.db.db_tables import Embedding, Message, Session
 from form.models.exceptions import DatabaseOperationError
 from form.models.requests import Document
-from form.utils.text_handler import convert_str_to_uuid
+from form.utils.config import get_settings
+from form.utils.text_handler import batch_by_token_budget, convert_str_to_uuid
 from form.vectorstore.pgvector import OpenAIEmbeddings
 
+# The key path and the new value of a changed form field
+FormField = Tuple[List[str], Any]
+
+
+def _patched_form_data(fields: List[FormField]):
+    """Get the stored form_data with the fields set, computed in the database.
+
+    form_data holds the form as a JSON-encoded string, so it is decoded, the
+    fields are set with jsonb_set and the form is encoded again.
+    """
+    form = cast(
+        Session.form_data.op("#>>", return_type=Text)(literal_column("'{}'")), JSONB
+    )
+    for keys, value in fields:
+        form = func.jsonb_set(form, literal(keys, ARRAY(Text)), literal(value, JSONB))
+    return func.to_jsonb(cast(form, Text))
+
+
+def _patch_form(session_id: UUID, fields: List[FormField], form_version: int):
+    return (
+        update(Session)
+        .where(Session.session_id == session_id, Session.form_version == form_version)
+        .values(
+            form_data=_patched_form_data(fields),
+            form_version=Session.form_version + 1,
+            last_updated_at=datetime.now(),
+        )
+    )
+
+
+def _messages_json():
+    """Get the messages of the selected session as a JSON array, oldest first."""
+    columns = [
+        Message.message_id,
+        Message.prompt,
+        Message.response,
+        Message.changes,
+        Message.created_at,
+    ]
+    # The keys are inlined, as asyncpg cannot type parameters of "any" type
+    message = func.json_build_object(
+        *(
+            value
+            for column in columns
+            for value in (literal_column(f"'{column.key}'"), column)
+        )
+    )
+    return (
+        select(
+            func.json_agg(aggregate_order_by(message, Message.created_at), type_=JSON)
+        )
+        .where(Message.session_id == Session.session_id)
+        .scalar_subquery()
+    )
+
+
+def _message_from_json(session_id: UUID, message: Dict[str, Any]) -> Message:
+    return Message(
+        message_id=UUID(message["message_id"]),
+        session_id=session_id,
+        prompt=message["prompt"],
+        response=message["response"],
+        changes=message["changes"],
+        created_at=datetime.fromisoformat(message["created_at"]),
+    )
+
 
 class DatabaseOperations:
     def __init__(self, db: AsyncSession):
@@ -37,19 +120,53 @@ class DatabaseOperations:
 
         await self._execute_with_error_handling(operation)
 
-    async def upsert_session(self, session_id: UUID, form_data: dict) -> None:
+    async def upsert_session(self, session_id: UUID, form_data: dict) -> Session:
         async def operation():
             stmt = insert(Session).values(session_id=session_id, form_data=form_data)
             stmt = stmt.on_conflict_do_update(
                 index_elements=["session_id"],
-                set_=dict(last_updated_at=datetime.now(), form_data=form_data),
+                set_=dict(
+                    last_updated_at=datetime.now(),
+                    form_data=form_data,
+                    form_version=Session.form_version + 1,
+                ),
             )
-            await self.db.execute(stmt)
+            result = await self.db.execute(stmt.returning(Session))
+            return result.scalar_one()
 
-        await self._execute_with_error_handling(operation)
+        return await self._execute_with_error_handling(operation)
+
+    async def patch_session_form(
+        self, session_id: UUID, fields: List[FormField], form_version: int
+    ) -> bool:
+        """Set only the changed fields of the stored form.
+
+        Args:
+            session_id (UUID): The session.
+            fields (list): The key path and new value of every changed field.
+            form_version (int): The version of the form the changes apply to.
+
+        Returns:
+            bool: Whether the form was written, False if it is not at
+                `form_version` (anymore).
+        """
+
+        async def operation():
+            stmt = _patch_form(session_id, fields, form_version).returning(
+                Session.session_id
+            )
+            result = await self.db.execute(stmt)
+            return result.scalar_one_or_none() is not None
+
+        return await self._execute_with_error_handling(operation)
 
     async def upsert_message(
-        self, message_id: UUID, session_id: UUID, prompt: str, response: str
+        self,
+        message_id: UUID,
+        session_id: UUID,
+        prompt: str,
+        response: str,
+        changes: Optional[List[Dict[str, Any]]] = None,
     ) -> None:
         async def operation():
             stmt = insert(Message).values(
@@ -57,6 +174,7 @@ class DatabaseOperations:
                 session_id=session_id,
                 prompt=prompt,
                 response=response,
+                changes=changes,
             )
             stmt = stmt.on_conflict_do_update(
                 index_elements=["message_id"],
@@ -65,6 +183,7 @@ class DatabaseOperations:
                     session_id=session_id,
                     prompt=prompt,
                     response=response,
+                    changes=changes,
                     created_at=datetime.now(),
                 ),
             )
@@ -72,10 +191,10 @@ class DatabaseOperations:
 
         await self._execute_with_error_handling(operation)
 
-    async def upsert_embedding(self, doc: Document) -> None:
+    async def upsert_embedding(self, doc: Document) -> List[float]:
         async def operation():
             embedding_id = convert_str_to_uuid(doc.content)
-            async with OpenAIEmbeddings() as openai_embedding:
+            async with OpenAIEmbeddings(use_cache=False) as openai_embedding:
                 embedding = await openai_embedding.get_embedding(doc.content)
             stmt = insert(Embedding).values(
                 embedding_id=embedding_id,
@@ -94,75 +213,133 @@ class DatabaseOperations:
                 ),
             )
             await self.db.execute(stmt)
+            return embedding
 
-        await self._execute_with_error_handling(operation)
+        return await self._execute_with_error_handling(operation)
 
-    async def upsert_embeddings(self, docs: List[Document]) -> None:
-        async def operation():
-            values = []
-            for doc in docs:
-                async with OpenAIEmbeddings() as openai_embedding:
-                    embedding = await openai_embedding.get_embedding(doc.content)
-                values.append(
-                    {
-                        "embedding_id": convert_str_to_uuid(doc.content),
-                        "content": doc.content,
-                        "embedding": embedding,
-                        "properties": doc.properties,
-                        "last_updated_at": datetime.now(),
-                    }
+    async def upsert_embeddings(self, docs: List[Document]) -> Dict[UUID, List[float]]:
+        config = get_settings().open_ai_config
+        # Identical contents map to the same row, keep the last version of each
+        unique_docs = list(
+            {convert_str_to_uuid(doc.content): doc for doc in docs}.values()
+        )
+        batches = batch_by_token_budget(
+            unique_docs,
+            max_tokens=config.embedding_batch_max_tokens,
+            max_batch_size=config.embedding_batch_max_size,
+            get_text=lambda doc: doc.content,
+        )
+        semaphore = asyncio.Semaphore(config.embedding_max_concurrency)
+
+        async def embed_batch(
+            openai_embedding: OpenAIEmbeddings, batch: List[Document]
+        ) -> Tuple[List[Document], List[List[float]]]:
+            async with semaphore:
+                embeddings = await openai_embedding.get_embeddings(
+                    [doc.content for doc in batch]
                 )
-            stmt = insert(Embedding).values(values)
-            stmt = stmt.on_conflict_do_update(
-                index_elements=["embedding_id"],
-                set_=dict(
-                    content=stmt.excluded.content,
-                    embedding=stmt.excluded.embedding,
-                    properties=stmt.excluded.properties,
-                    last_updated_at=stmt.excluded.last_updated_at,
-                ),
-            )
-            await self.db.execute(stmt)
+            return batch, embeddings
 
-        await self._execute_with_error_handling(operation)
+        async def operation():
+            upserted: Dict[UUID, List[float]] = {}
+            # Documents are stored in the embeddings table, caching them is wasted
+            async with OpenAIEmbeddings(use_cache=False) as openai_embedding:
+                tasks = [
+                    asyncio.create_task(embed_batch(openai_embedding, batch))
+                    for batch in batches
+                ]
+                try:
+                    # Write every batch in one statement as soon as it is embedded
+                    for next_batch in asyncio.as_completed(tasks):
+                        batch, embeddings = await next_batch
+                        await self.db.execute(
+                            self._upsert_embeddings_statement(batch, embeddings)
+                        )
+                        for doc, embedding in zip(batch, embeddings):
+                            upserted[convert_str_to_uuid(doc.content)] = embedding
+                finally:
+                    for task in tasks:
+                        task.cancel()
+            return upserted
+
+        return await self._execute_with_error_handling(operation)
+
+    @staticmethod
+    def _upsert_embeddings_statement(
+        docs: List[Document], embeddings: List[List[float]]
+    ):
+        values = [
+            {
+                "embedding_id": convert_str_to_uuid(doc.content),
+                "content": doc.content,
+                "embedding": embedding,
+                "properties": doc.properties,
+                "last_updated_at": datetime.now(),
+            }
+            for doc, embedding in zip(docs, embeddings)
+        ]
+        stmt = insert(Embedding).values(values)
+        return stmt.on_conflict_do_update(
+            index_elements=["embedding_id"],
+            set_=dict(
+                content=stmt.excluded.content,
+                embedding=stmt.excluded.embedding,
+                properties=stmt.excluded.properties,
+                last_updated_at=stmt.excluded.last_updated_at,
+            ),
+        )
+
+    @staticmethod
+    def _select_embedding(load_vector: bool, *columns) -> Select:
+        query = select(Embedding, *columns)
+        if not load_vector:
+            # Leave the 1536-float vector column out of the SELECT
+            query = query.options(defer(Embedding.embedding, raiseload=True))
+        return query
 
     async def get_embedding(self, embedding_id: UUID) -> Optional[Embedding]:
         async def operation():
-            if not await self.check_embedding_exists(embedding_id):
-                raise ValueError(f"Embedding {embedding_id} does not exist")
             query = select(Embedding).where(Embedding.embedding_id == embedding_id)
             result = await self.db.execute(query)
-            return result.scalar_one_or_none()
+            embedding = result.scalar_one_or_none()
+            if embedding is None:
+                raise ValueError(f"Embedding {embedding_id} does not exist")
+            return embedding
 
         return await self._execute_with_error_handling(operation)
 
-    async def get_embeddings(self, embedding_ids: List[UUID]) -> List[Embedding]:
+    async def get_embeddings(
+        self, embedding_ids: List[UUID], load_vector: bool = True
+    ) -> List[Embedding]:
         async def operation():
-            if not await self.check_if_any_embedding_exists(embedding_ids):
-                raise ValueError("None of the embeddings exist")
-            query = select(Embedding).where(Embedding.embedding_id.in_(embedding_ids))
+            query = self._select_embedding(load_vector).where(
+                Embedding.embedding_id.in_(embedding_ids)
+            )
             result = await self.db.execute(query)
-            return result.scalars().all()
+            embeddings = result.scalars().all()
+            if not embeddings:
+                raise ValueError("None of the embeddings exist")
+            return embeddings
 
         return await self._execute_with_error_handling(operation)
 
     async def delete_embedding(self, embedding_id: UUID) -> None:
         async def operation():
-            if not await self.check_embedding_exists(embedding_id):
-                raise ValueError(f"Embedding {embedding_id} does not exist")
-            await self.db.execute(
+            result = await self.db.execute(
                 delete(Embedding).where(Embedding.embedding_id == embedding_id)
             )
+            if result.rowcount == 0:
+                raise ValueError(f"Embedding {embedding_id} does not exist")
 
         await self._execute_with_error_handling(operation)
 
     async def delete_embeddings(self, embedding_ids: List[UUID]) -> None:
         async def operation():
-            if not await self.check_if_any_embedding_exists(embedding_ids):
-                raise ValueError("None of the embeddings exist")
-            await self.db.execute(
+            result = await self.db.execute(
                 delete(Embedding).where(Embedding.embedding_id.in_(embedding_ids))
             )
+            if result.rowcount == 0:
+                raise ValueError("None of the embeddings exist")
 
         await self._execute_with_error_handling(operation)
 
@@ -174,14 +351,63 @@ class DatabaseOperations:
 
         return await self._execute_with_error_handling(operation)
 
-    async def get_all_embeddings(self) -> List[Embedding]:
+    @staticmethod
+    def _paginate(
+        query: Select, key, limit: Optional[int], after: Optional[UUID]
+    ) -> Select:
+        # Keyset pagination on the primary key, every page is an index range scan
+        query = query.order_by(key)
+        if after is not None:
+            query = query.where(key > after)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    async def _stream(self, query: Select, batch_size: int) -> AsyncGenerator:
+        try:
+            # Server-side cursor, only batch_size rows are held in memory at a time
+            result = await self.db.stream_scalars(
+                query.execution_options(yield_per=batch_size)
+            )
+            async for row in result:
+                yield row
+            await self.db.commit()
+        except SQLAlchemyError as e:
+            await self.db.rollback()
+            raise DatabaseOperationError(f"Database operation failed: {str(e)}")
+
+    async def get_all_embeddings(
+        self,
+        load_vector: bool = True,
+        limit: Optional[int] = None,
+        after: Optional[UUID] = None,
+    ) -> List[Embedding]:
         async def operation():
-            query = select(Embedding)
+            query = self._paginate(
+                self._select_embedding(load_vector),
+                Embedding.embedding_id,
+                limit,
+                after,
+            )
             result = await self.db.execute(query)
             return result.scalars().all()
 
         return await self._execute_with_error_handling(operation)
 
+    def stream_embeddings(
+        self, load_vector: bool = True, batch_size: int = 500
+    ) -> AsyncGenerator[Embedding, None]:
+        query = self._select_embedding(load_vector).order_by(Embedding.embedding_id)
+        return self._stream(query, batch_size)
+
+    async def get_all_embedding_vectors(self) -> List[Tuple[UUID, list]]:
+        async def operation():
+            query = select(Embedding.embedding_id, Embedding.embedding)
+            result = await self.db.execute(query)
+            return [tuple(row) for row in result.all()]
+
+        return await self._execute_with_error_handling(operation)
+
     async def get_nearest_embeddings(
         self,
         target_embedding: list,
@@ -193,11 +419,15 @@ class DatabaseOperations:
             "l2_distance",
             "hamming_distance",
         ] = "l2_distance",
+        ef_search: Optional[int] = None,
+        probes: Optional[int] = None,
+        load_vector: bool = True,
     ) -> List[Embedding]:
         async def operation():
+            await set_search_parameters(self.db, ef_search=ef_search, probes=probes)
             query = (
-                select(
-                    Embedding,
+                self._select_embedding(
+                    load_vector,
                     Embedding.embedding.__getattr__(distance_type)(
                         target_embedding
                     ).label("distance"),
@@ -224,9 +454,10 @@ class DatabaseOperations:
             "l2_distance",
             "hamming_distance",
         ] = "l2_distance",
+        load_vector: bool = True,
     ) -> List[Embedding]:
         async def operation():
-            query = select(Embedding).filter(
+            query = self._select_embedding(load_vector).filter(
                 Embedding.embedding.__getattr__(distance_type)(target_embedding)
                 < distance
             )
@@ -235,6 +466,102 @@ class DatabaseOperations:
 
         return await self._execute_with_error_handling(operation)
 
+    async def load_chat_state(
+        self, session_id: UUID
+    ) -> Tuple[Optional[Session], List[Message]]:
+        """Load a session and its messages, oldest first, in a single query.
+
+        The messages are aggregated into a JSON array next to the session row,
+        so its form is sent once rather than with every message of a join.
+
+        Returns:
+            tuple: The session (None if it does not exist) and its messages.
+        """
+
+        async def operation():
+            query = select(Session, _messages_json()).where(
+                Session.session_id == session_id
+            )
+            row = (await self.db.execute(query)).one_or_none()
+            if row is None:
+                return None, []
+            session, messages = row
+            return session, [
+                _message_from_json(session_id, message) for message in messages or []
+            ]
+
+        return await self._execute_with_error_handling(operation)
+
+    async def save_chat_turn(
+        self,
+        session_id: UUID,
+        form_data: Optional[str],
+        message_id: UUID,
+        prompt: str,
+        response: str,
+        changes: Optional[List[Dict[str, Any]]] = None,
+        form_fields: Optional[List[FormField]] = None,
+        form_version: Optional[int] = None,
+    ) -> bool:
+        """Upsert the session form and insert the turn's message in one statement.
+
+        The message is inserted from a CTE that upserts the session, so either
+        both rows are written or neither is. With `form_fields`, only those
+        fields of the stored form are set instead of `form_data`, see
+        `patch_session_form`.
+
+        Returns:
+            bool: Whether the turn was written, False if only fields were to be
+                set and the stored form is not at `form_version`.
+        """
+
+        async def operation():
+            if form_fields is not None:
+                session_write = _patch_form(session_id, form_fields, form_version)
+            else:
+                session_write = (
+                    insert(Session)
+                    .values(session_id=session_id, form_data=form_data)
+                    .on_conflict_do_update(
+                        index_elements=["session_id"],
+                        set_=dict(
+                            last_updated_at=datetime.now(),
+                            form_data=form_data,
+                            form_version=Session.form_version + 1,
+                        ),
+                    )
+                )
+            upserted_session = session_write.returning(Session.session_id).cte(
+                "upserted_session"
+            )
+            stmt = insert(Message).from_select(
+                ["message_id", "session_id", "prompt", "response", "changes"],
+                select(
+                    literal(message_id, Message.message_id.type),
+                    upserted_session.c.session_id,
+                    literal(prompt, Message.prompt.type),
+                    literal(response, Message.response.type),
+                    literal(changes, Message.changes.type),
+                ),
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["message_id"],
+                set_=dict(
+                    prompt=stmt.excluded.prompt,
+                    response=stmt.excluded.response,
+                    changes=stmt.excluded.changes,
+                    created_at=datetime.now(),
+                ),
+            )
+            if form_fields is None:
+                await self.db.execute(stmt)
+                return True
+            # No message is inserted if the session was not updated
+            result = await self.db.execute(stmt.returning(Message.message_id))
+            return result.scalar_one_or_none() is not None
+
+        return await self._execute_with_error_handling(operation)
+
     async def get_session_data(self, session_id: UUID) -> Optional[Session]:
         async def operation():
             query = select(Session).where(Session.session_id == session_id)
@@ -247,76 +574,113 @@ class DatabaseOperations:
         self, session_id: UUID, create_if_not_exists: bool = False
     ) -> List[Message]:
         async def operation():
-            if (
-                not await self.check_session_exists(session_id)
-                and not create_if_not_exists
-            ):
-                raise ValueError(f"Session {session_id} does not exist")
+            # The outer join returns one row without a message for an empty
+            # session and no row at all for a missing one
             query = (
-                select(Message)
-                .where(Message.session_id == session_id)
+                select(Session.session_id, Message)
+                .outerjoin(Message, Message.session_id == Session.session_id)
+                .where(Session.session_id == session_id)
                 .order_by(Message.created_at)
             )
             result = await self.db.execute(query)
-            return result.scalars().all()
+            rows = result.all()
+            if not rows and not create_if_not_exists:
+                raise ValueError(f"Session {session_id} does not exist")
+            return [message for _, message in rows if message is not None]
 
         return await self._execute_with_error_handling(operation)
 
     async def delete_session(self, session_id: UUID) -> None:
         async def operation():
-            if not await self.check_session_exists(session_id):
-                raise ValueError(f"Session {session_id} does not exist")
-            await self.db.execute(
-                delete(Message).where(Message.session_id == session_id)
+            # Messages go in a CTE of the same statement, the foreign key is
+            # checked at the end of the statement
+            deleted_messages = (
+                delete(Message)
+                .where(Message.session_id == session_id)
+                .cte("deleted_messages")
             )
-            await self.db.execute(
-                delete(Session).where(Session.session_id == session_id)
+            stmt = (
+                delete(Session)
+                .where(Session.session_id == session_id)
+                .add_cte(deleted_messages)
+                .returning(Session.session_id)
             )
+            result = await self.db.execute(stmt)
+            if result.scalar_one_or_none() is None:
+                raise ValueError(f"Session {session_id} does not exist")
 
         await self._execute_with_error_handling(operation)
 
-    async def update_session_data(self, session_id: UUID, form_data: str) -> None:
+    async def update_session_data(self, session_id: UUID, form_data: str) -> Session:
         async def operation():
-            if not await self.check_session_exists(session_id):
+            stmt = (
+                update(Session)
+                .where(Session.session_id == session_id)
+                .values(
+                    form_data=form_data,
+                    form_version=Session.form_version + 1,
+                    last_updated_at=datetime.now(),
+                )
+                .returning(Session)
+            )
+            result = await self.db.execute(stmt)
+            session = result.scalar_one_or_none()
+            if session is None:
                 raise ValueError(f"Session {session_id} does not exist")
+            return session
+
+        return await self._execute_with_error_handling(operation)
+
+    async def update_session_summary(
+        self, session_id: UUID, summary: str, summarized_messages: int
+    ) -> None:
+        async def operation():
             stmt = (
                 update(Session)
                 .where(Session.session_id == session_id)
-                .values(form_data=form_data, last_updated_at=datetime.now())
+                .values(summary=summary, summarized_messages=summarized_messages)
             )
-            await self.db.execute(stmt)
+            result = await self.db.execute(stmt)
+            if result.rowcount == 0:
+                raise ValueError(f"Session {session_id} does not exist")
 
         await self._execute_with_error_handling(operation)
 
-    async def get_all_sessions(self) -> List[Session]:
+    async def get_all_sessions(
+        self, limit: Optional[int] = None, after: Optional[UUID] = None
+    ) -> List[Session]:
         async def operation():
-            query = select(Session)
+            query = self._paginate(select(Session), Session.session_id, limit, after)
             result = await self.db.execute(query)
             return result.scalars().all()
 
         return await self._execute_with_error_handling(operation)
 
+    def stream_sessions(self, batch_size: int = 500) -> AsyncGenerator[Session, None]:
+        query = select(Session).order_by(Session.session_id)
+        return self._stream(query, batch_size)
+
     async def check_session_exists(self, session_id: UUID) -> bool:
         async def operation():
-            query = select(Session).where(Session.session_id == session_id)
+            query = select(exists().where(Session.session_id == session_id))
             result = await self.db.execute(query)
-            return result.scalar_one_or_none() is not None
+            return result.scalar()
 
         return await self._execute_with_error_handling(operation)
 
     async def check_embedding_exists(self, embedding_id: UUID) -> bool:
         async def operation():
-            query = select(Embedding).where(Embedding.embedding_id == embedding_id)
+            query = select(exists().where(Embedding.embedding_id == embedding_id))
             result = await self.db.execute(query)
-            return result.scalar_one_or_none() is not None
+            return result.scalar()
 
         return await self._execute_with_error_handling(operation)
 
     async def check_if_any_embedding_exists(self, embedding_ids: List[UUID]) -> bool:
         async def operation():
-            query = select(Embedding).where(Embedding.embedding_id.in_(embedding_ids))
+            query = select(exists().where(Embedding.embedding_id.in_(embedding_ids)))
             result = await self.db.execute(query)
-            return result.scalars().all() != []
+            return result.scalar()
 
         return await self._execute_with_error_handling(operation)
 
@@ -1,8 +1,9 @@
 from datetime import datetime
+from typing import Optional
 from uuid import UUID, uuid4
 
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import JSON, DateTime, Text, func
+from sqlalchemy import JSON, DateTime, Integer, Text, func
 from sqlalchemy.dialects.postgresql import UUID as PGUUID
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
@@ -23,6 +24,15 @@ class Session(TableBase):
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
     form_data: Mapped[dict] = mapped_column(JSON, nullable=False)
+    # Rolling summary of the oldest `summarized_messages` messages of the session
+    summary: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    summarized_messages: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    # Incremented on every write of form_data, so clients can ask for deltas
+    form_version: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
 
 
 class Message(TableBase):
@@ -32,6 +42,8 @@ class Message(TableBase):
     session_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), nullable=False)
     prompt: Mapped[str] = mapped_column(Text, nullable=False)
     response: Mapped[str] = mapped_column(Text, nullable=False)
+    # The form fields changed by the turn, see `CompiledForm.update`
+    changes: Mapped[Optional[list]] = mapped_column(JSON, nullable=True)
 
 
 class Embedding(TableBase):
@@ -44,3 +56,14 @@ class Embedding(TableBase):
     last_updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
+
+
+class EmbeddingCacheEntry(TableBase):
+    __tablename__ = "embedding_cache"
+
+    cache_key: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), primary_key=True)
+    model: Mapped[str] = mapped_column(Text, nullable=False)
+    embedding: Mapped[list] = mapped_column(Vector(1536), nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
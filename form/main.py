@@ -1,3 +1,5 @@
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import APIRouter, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,16 +8,35 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from form.api.api_router import api_router
+from form.api.endpoints.chat import wait_for_pending_chat_turns
+from form.db import dispose_async_engine
+from form.utils.openai_client import close_openai_clients, get_openai_client
+from form.utils.templates import preload_templates
 
 
 def custom_generate_unique_id(route: APIRouter):
     return route.name
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the shared OpenAI client up front so its connections are reused
+    get_openai_client()
+    # Read prompts and form schemas once instead of on every request
+    preload_templates()
+    yield
+    # Finish deferred chat turn writes, then close pooled database and HTTP
+    # connections on shutdown
+    await wait_for_pending_chat_turns()
+    await close_openai_clients()
+    await dispose_async_engine()
+
+
 app = FastAPI(
     title="Form GenAI chatbot",
     docs_url="/docs",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
 templates = Jinja2Templates(directory="form/templates")
@@ -8,3 +8,9 @@ class AgentProcessingError(Exception):
     """Exception raised for errors in the agent processing."""
 
     pass
+
+
+class AgentCallTimeoutError(AgentProcessingError):
+    """Exception raised when an agent call exceeds the deadline of its call policy."""
+
+    pass
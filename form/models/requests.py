@@ -1,10 +1,15 @@
-from typing import Dict
+from typing import Dict, Optional
 
 from pydantic import BaseModel, Field
 
 
 class ChatInput(BaseModel):
     message: str = Field(..., min_length=1, description="The user's input message")
+    form_version: Optional[int] = Field(
+        None,
+        description="The last form version the client has. If it is still the "
+        "stored version, only the JSON Patch operations of the turn are returned",
+    )
 
 
 class Document(BaseModel):
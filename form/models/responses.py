@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Union
 from uuid import UUID
 
 from pydantic import BaseModel, ConfigDict, Field
@@ -11,7 +11,22 @@ class BaseResponse(BaseModel):
 
 class ChatOutput(BaseResponse):
     response: str = Field(..., description="The assistant's response message")
-    form: Dict[str, Any] = Field(..., description="The updated form schema")
+    form: Optional[Dict[str, Any]] = Field(
+        ..., description="The updated form schema, None if `patch` is returned"
+    )
+    changes: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="The form fields changed by this turn, with their dotted "
+        "path, old and new value and the agent the new value came from",
+    )
+    form_version: Optional[int] = Field(
+        None, description="The version of the form after this turn"
+    )
+    patch: Optional[List[Dict[str, Any]]] = Field(
+        None,
+        description="The JSON Patch operations from the client's form version "
+        "to `form_version`, instead of the whole form",
+    )
 
 
 class SessionDataOutput(BaseResponse):
@@ -19,6 +34,9 @@ class SessionDataOutput(BaseResponse):
     form_data: Dict[str, Any] = Field(
         ..., description="The form data associated with the session"
     )
+    form_version: int = Field(
+        0, description="The version of the form, incremented on every write"
+    )
     created_at: datetime = Field(
         ..., description="The timestamp when the session was created"
     )
@@ -32,6 +50,9 @@ class MessageDataOutput(BaseResponse):
     session_id: UUID = Field(..., description="The unique identifier for the session")
     prompt: str = Field(..., description="The prompt message")
     response: str = Field(..., description="The response message")
+    changes: List[Dict[str, Any]] = Field(
+        default_factory=list, description="The form fields changed by this turn"
+    )
     created_at: datetime = Field(
         ..., description="The timestamp when the message was created"
     )
@@ -42,7 +63,11 @@ class EmbeddingDataOutput(BaseResponse):
         ..., description="The unique identifier for the embedding"
     )
     content: str = Field(..., description="The content associated with the embedding")
-    embedding: list = Field(..., description="The embedding vector")
+    embedding: Optional[Union[List[float], str]] = Field(
+        None,
+        description="The embedding vector as a list of floats, as base64-encoded "
+        "little-endian float32 or omitted, depending on the requested vector format",
+    )
     properties: Dict[str, Any] = Field(
         ..., description="Additional properties associated with the embedding"
     )
@@ -62,3 +87,61 @@ class EmbeddingWithDistanceOutput(EmbeddingDataOutput):
 
 class UUIDOutput(BaseResponse):
     uuid: UUID = Field(..., description="The converted UUID")
+
+
+class TemplateRegistryStatsOutput(BaseResponse):
+    templates: int = Field(..., description="The number of loaded prompt templates")
+    schemas: int = Field(..., description="The number of loaded JSON schemas")
+    hot_reload: bool = Field(..., description="Whether changed files are reloaded")
+    loads: int = Field(..., description="The number of file loads and reloads")
+    load_ms: float = Field(..., description="The total time spent loading files")
+    renders: int = Field(..., description="The number of rendered prompts")
+    render_ms: float = Field(..., description="The total time spent rendering")
+
+
+class PoolStatusOutput(BaseResponse):
+    pool_class: str = Field(..., description="The connection pool implementation")
+    size: Optional[int] = Field(None, description="The configured pool size")
+    checked_in: Optional[int] = Field(
+        None, description="The number of idle connections in the pool"
+    )
+    checked_out: Optional[int] = Field(
+        None, description="The number of connections currently in use"
+    )
+    overflow: Optional[int] = Field(
+        None, description="The number of overflow connections currently open"
+    )
+
+
+class EmbeddingCacheStatsOutput(BaseResponse):
+    enabled: bool = Field(..., description="Whether the embedding cache is enabled")
+    memory_hits: int = Field(0, description="Lookups answered by the in-process cache")
+    persistent_hits: int = Field(
+        0, description="Lookups answered by the persistent cache table"
+    )
+    misses: int = Field(0, description="Lookups that required an embedding request")
+    size: int = Field(0, description="Entries in the in-process cache")
+    max_size: int = Field(0, description="Maximum entries in the in-process cache")
+
+
+class SessionCacheStatsOutput(BaseResponse):
+    enabled: bool = Field(..., description="Whether the session cache is enabled")
+    hits: int = Field(0, description="Turns that started from the cached state")
+    misses: int = Field(0, description="Turns that loaded the state from the database")
+    size: int = Field(0, description="Sessions in the cache")
+    max_size: int = Field(0, description="Maximum sessions in the cache")
+
+
+class VectorIndexOutput(BaseResponse):
+    name: str = Field(..., description="The name of the index")
+    method: str = Field(..., description="The index method, hnsw or ivfflat")
+    distance_type: Optional[str] = Field(
+        None, description="The distance type the index accelerates"
+    )
+    definition: str = Field(..., description="The index definition")
+    is_valid: bool = Field(..., description="Whether the index can serve queries")
+    size_bytes: int = Field(..., description="The size of the index on disk")
+    scans: int = Field(..., description="The number of scans that used the index")
+    build_phase: Optional[str] = Field(
+        None, description="The phase of a build in progress, if any"
+    )
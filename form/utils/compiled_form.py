@@ -0,0 +1,325 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from form.utils.form_handler import match_if_form_updated
+from form.utils.rule_validation import RejectedValue, compile_rule
+
+FieldPath = Union[str, Sequence[str]]
+
+
+@dataclass
+class FieldChange:
+    """A field value changed by a merge, addressed by its dotted path.
+
+    The source is the agent or client the new value came from, if known.
+    """
+
+    path: str
+    old: Any
+    new: Any
+    source: Optional[str] = None
+
+
+def to_json_patch(changes: Iterable[FieldChange]) -> Optional[List[dict]]:
+    """Convert changes to JSON Patch (RFC 6902) `replace` operations.
+
+    Added fields would need their missing parent objects added first, so there
+    is no patch for changes that add fields.
+
+    Returns:
+        list: The operations, or None if a field was added.
+    """
+    operations = []
+    for change in changes:
+        if change.old is None:
+            return None
+        pointer = "/".join(
+            key.replace("~", "~0").replace("/", "~1") for key in change.path.split(".")
+        )
+        operations.append({"op": "replace", "path": f"/{pointer}", "value": change.new})
+    return operations
+
+
+def in_template_order(form: dict, template: dict) -> dict:
+    """Put the keys of a form in the order of its template, e.g. `form.json`.
+
+    JSONB does not keep the key order of objects, so a form written field by
+    field comes back in storage order. The fields of the template come first,
+    in its order, followed by any others in the order they are stored in.
+    """
+    ordered = {}
+    for key, value in template.items():
+        if key not in form:
+            continue
+        if isinstance(value, dict) and isinstance(form[key], dict):
+            ordered[key] = in_template_order(form[key], value)
+        else:
+            ordered[key] = form[key]
+    for key, value in form.items():
+        ordered.setdefault(key, value)
+    return ordered
+
+
+class CompiledForm:
+    """A nested form flattened once into an ordered index of its fields.
+
+    Every field gets a slot, in the order of a depth-first walk of the form, and
+    is looked up by its dotted path, e.g. `general_information.title`. Values
+    are read and written through the nested dict, which is updated in place and
+    stays the form sent to the agents. Rules are looked up by the key path of a
+    field instead of searching the whole rules tree. The first empty slot is
+    tracked as fields are set, so finding the next empty field does not walk the
+    form again. Changes to the form must go through the compiled form to keep
+    the index right.
+
+    With `validate`, values merged by `update` are checked against the rules of
+    their fields, see `compile_rule`, and invalid ones are taken out again.
+
+    Args:
+        form (dict): The nested form, e.g. `form.json`.
+        rules (dict, optional): The nested validation rules, e.g. `form_val.json`.
+        validate (bool): Whether to reject merged values that break their rule.
+    """
+
+    def __init__(
+        self, form: dict, rules: Optional[dict] = None, validate: bool = False
+    ):
+        self.form = form
+        self.rules = rules or {}
+        self.validate = validate
+        # The values rejected by the last update
+        self.rejected: List[RejectedValue] = []
+        self._compile()
+
+    def _compile(self) -> None:
+        self.paths: List[str] = []
+        self._slots: Dict[str, int] = {}
+        # The keys of the section, the section dict and the key of every slot
+        self._sections: List[Tuple[str, ...]] = []
+        self._parents: List[dict] = []
+        self._leaf_keys: List[str] = []
+        self._index(self.form, (), "")
+        self._next_empty = 0
+        self.matches_last_update = False
+
+    def _index(self, tree: dict, section: Tuple[str, ...], prefix: str) -> None:
+        for key, value in tree.items():
+            path = f"{prefix}{key}"
+            if isinstance(value, dict):
+                self._index(value, section + (key,), path + ".")
+                continue
+            self._slots[path] = len(self.paths)
+            self.paths.append(path)
+            self._sections.append(section)
+            self._parents.append(tree)
+            self._leaf_keys.append(key)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __contains__(self, path: FieldPath) -> bool:
+        return self._slot(path) is not None
+
+    def get(self, path: FieldPath) -> Any:
+        return self._value(self._slots[self._dotted(path)])
+
+    def set(
+        self, path: FieldPath, value: Any, source: Optional[str] = None
+    ) -> FieldChange:
+        return self._set_slot(self._slots[self._dotted(path)], value, source)
+
+    def keys(self, path: FieldPath) -> List[str]:
+        """Get the key path of a field from its dotted path."""
+        if not isinstance(path, str):
+            return list(path)
+        slot = self._slots.get(path)
+        if slot is None:
+            return path.split(".")
+        return [*self._sections[slot], self._leaf_keys[slot]]
+
+    def rule(self, path: Optional[FieldPath]) -> Optional[Any]:
+        """Get the validation rule of a field, None if it has none."""
+        if path is None:
+            return None
+        node: Any = self.rules
+        for key in self.keys(path):
+            if not isinstance(node, dict) or key not in node:
+                return None
+            node = node[key]
+        return node
+
+    def first_empty(self) -> Optional[List[str]]:
+        """Get the key path of the first empty field, None if all are filled."""
+        while self._next_empty < len(self.paths) and (
+            self._value(self._next_empty) != ""
+        ):
+            self._next_empty += 1
+        if self._next_empty == len(self.paths):
+            return None
+        return self.keys(self.paths[self._next_empty])
+
+    def empty_paths(self) -> List[str]:
+        self.first_empty()
+        return [
+            self.paths[slot]
+            for slot in range(self._next_empty, len(self.paths))
+            if self._value(slot) == ""
+        ]
+
+    def empty_fields(self) -> dict:
+        """Get the empty fields as a nested dict, keeping their nesting."""
+        return self._nest((path, "") for path in self.empty_paths())
+
+    def empty_rules(self) -> dict:
+        """Get the rules of the empty fields as a nested dict."""
+        rules = ((path, self.rule(path)) for path in self.empty_paths())
+        return self._nest((path, rule) for path, rule in rules if rule is not None)
+
+    def update(
+        self,
+        other: dict,
+        fill: bool = True,
+        overwrite: bool = True,
+        source: Optional[str] = None,
+    ) -> List[FieldChange]:
+        """Fill the empty fields and update the filled ones in a single pass.
+
+        Like `update_all_empty_fields` followed by `match_if_form_updated`,
+        empty values never overwrite a field and fields that are not in the
+        form are added to it, with None as the old value of their changes.
+        Afterwards, `matches_last_update` tells whether the form is equal to the
+        other form, without comparing them again.
+
+        Args:
+            other (dict): The form to take the values from.
+            fill (bool): Whether to fill the empty fields.
+            overwrite (bool): Whether to update the filled fields.
+            source (str, optional): Where the values come from, for the changes.
+        """
+        changes: List[FieldChange] = []
+        self._matched = 0
+        restructured = self._update_tree(
+            self.form, other, "", fill, overwrite, source, changes
+        )
+        self.matches_last_update = not restructured and self._matched == len(self)
+        if restructured and overwrite:
+            known = set(self._slots)
+            match_if_form_updated(self.form, other)
+            self._compile()
+            changes.extend(
+                FieldChange(path, None, self.get(path), source)
+                for path in self.paths
+                if path not in known
+            )
+            self.matches_last_update = self.form == other
+        self.rejected = []
+        if self.validate and changes:
+            changes = self._reject_invalid(changes)
+        return changes
+
+    def check(self, path: FieldPath, value: Any) -> Optional[str]:
+        """Check a value against the rule of a field.
+
+        Other fields named by the rule, e.g. `end_date` in "before end_date", are
+        looked up next to the field first and then anywhere in the form.
+
+        Returns:
+            str: Why the value is invalid, or None if it is valid or the field
+                has no rule.
+        """
+        rule = self.rule(path)
+        if not isinstance(rule, str):
+            return None
+        return compile_rule(rule).check(
+            value, lambda name: self._related_value(path, name)
+        )
+
+    def _reject_invalid(self, changes: List[FieldChange]) -> List[FieldChange]:
+        accepted = []
+        for change in changes:
+            reason = self.check(change.path, change.new)
+            if reason is None:
+                accepted.append(change)
+                continue
+            old = "" if change.old is None else change.old
+            self._set_slot(self._slots[change.path], old)
+            self.rejected.append(
+                RejectedValue(change.path, change.new, reason, change.source)
+            )
+            self.matches_last_update = False
+        return accepted
+
+    def _related_value(self, path: FieldPath, name: str) -> Any:
+        keys = self.keys(path)
+        sibling = ".".join([*keys[:-1], name])
+        if sibling in self._slots:
+            return self.get(sibling)
+        for slot, key in enumerate(self._leaf_keys):
+            if key == name:
+                return self._value(slot)
+        return None
+
+    def _update_tree(
+        self,
+        tree: dict,
+        other: dict,
+        prefix: str,
+        fill: bool,
+        overwrite: bool,
+        source: Optional[str],
+        changes: List[FieldChange],
+    ) -> bool:
+        # Walks both trees together so paths are only built for changed fields,
+        # counting the fields left equal to the other form on the way
+        restructured = False
+        for key, value in other.items():
+            if key not in tree:
+                restructured = True
+                continue
+            old = tree[key]
+            if isinstance(old, dict) or isinstance(value, dict):
+                if isinstance(old, dict) and isinstance(value, dict):
+                    restructured |= self._update_tree(
+                        old, value, f"{prefix}{key}.", fill, overwrite, source, changes
+                    )
+                else:
+                    restructured = True
+                continue
+            if value == "":
+                self._matched += old == ""
+                continue
+            if (fill and old == "") or (overwrite and old != "" and old != value):
+                slot = self._slots[f"{prefix}{key}"]
+                changes.append(self._set_slot(slot, value, source))
+                self._matched += 1
+            else:
+                self._matched += old == value
+        return restructured
+
+    def _dotted(self, path: FieldPath) -> str:
+        return path if isinstance(path, str) else ".".join(path)
+
+    def _slot(self, path: FieldPath) -> Optional[int]:
+        return self._slots.get(self._dotted(path))
+
+    def _value(self, slot: int) -> Any:
+        return self._parents[slot][self._leaf_keys[slot]]
+
+    def _set_slot(
+        self, slot: int, value: Any, source: Optional[str] = None
+    ) -> FieldChange:
+        old = self._value(slot)
+        self._parents[slot][self._leaf_keys[slot]] = value
+        if value == "" and slot < self._next_empty:
+            self._next_empty = slot
+        return FieldChange(self.paths[slot], old, value, source)
+
+    def _nest(self, items: Iterable[Tuple[str, Any]]) -> dict:
+        nested: dict = {}
+        for path, value in items:
+            slot = self._slots[path]
+            node = nested
+            for key in self._sections[slot]:
+                node = node.setdefault(key, {})
+            node[self._leaf_keys[slot]] = value
+        return nested
@@ -1,5 +1,6 @@
 from functools import lru_cache
 from pathlib import Path
+from typing import Dict, Literal, Optional
 
 from pydantic import BaseModel, SecretStr, computed_field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -10,6 +11,15 @@ PROJECT_DIR = Path(__file__).parent.parent.parent
 
 class OpenAIConfig(BaseModel):
     api_key: str = ""
+    # HTTP connection pool shared by all agents and embedding calls
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    timeout: float = 60.0
+    # Bulk embedding: inputs per request are bounded by an estimated token budget
+    embedding_batch_max_tokens: int = 100_000
+    embedding_batch_max_size: int = 512
+    embedding_max_concurrency: int = 4
 
 
 class Database(BaseModel):
@@ -19,11 +29,124 @@ class Database(BaseModel):
     port: int = 5432
     name: str = "postgres"
     default_db: str = "postgres"
+    # "null" opens a fresh connection per session, "queue" keeps a connection pool
+    pool_mode: Literal["null", "queue"] = "null"
+    pool_size: int = 20
+    max_overflow: int = 10
+    pool_timeout: float = 30.0
+    pool_recycle: int = 600
+    pool_pre_ping: bool = True
+    # Rows fetched per round trip by the NDJSON streaming endpoints
+    stream_batch_size: int = 500
+
+
+class CallPolicy(BaseModel):
+    # Seconds an agent call may take in total, retries and hedges included
+    deadline: float = 60.0
+    # Retries of timeouts, connection errors, rate limits and server errors,
+    # after a random delay of up to backoff_base * 2**retry seconds
+    max_retries: int = 2
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+    # Send a duplicate request once a call takes longer than the hedge_percentile
+    # latency of the agent's recent calls and take whichever finishes first
+    hedging: bool = False
+    hedge_percentile: float = 0.95
+    hedge_min_samples: int = 20
+
+
+class AgentModel(BaseModel):
+    model: str = "gpt-4o"
+    # Try cascade_model first and only call model if its response is not valid
+    # JSON, misses a field or its decision tokens are less likely than
+    # min_confidence
+    cascade_model: Optional[str] = None
+    min_confidence: float = 0.8
+
+
+class AgentsConfig(BaseModel):
+    # Start the intent, note-taking and specialist agents at the same time and
+    # cancel the latter two if the intent agent routes the turn back to the user
+    speculative_execution: bool = False
+    # Send only the still-empty fields and their rules after the first
+    # note-taking iteration and stop as soon as an iteration changes nothing
+    incremental_note_taking: bool = False
+    max_note_taking_iterations: int = 5
+    # Check the values extracted by the note-taking agent against the rules of
+    # form_val.json (lengths, choices, numbers, ISO dates and their order) and
+    # leave invalid ones out of the form
+    local_validation: bool = False
+    # Answer turns that only give a choice, number or ISO date for the next
+    # empty field by filling it and asking for the following one, without
+    # calling any agent
+    fast_path: bool = False
+    # Keep the last history_window messages verbatim and fold older ones into a
+    # rolling summary stored on the session, at least history_summary_batch at a
+    # time; the history sent to each agent is capped by its token budget
+    history_summary: bool = False
+    history_window: int = 10
+    history_summary_batch: int = 10
+    intent_history_tokens: int = 1500
+    note_taking_history_tokens: int = 1500
+    specialist_history_tokens: int = 3000
+    # Call policy of every agent, overridden per agent by call_policies, keyed
+    # by "intent", "note_taking", "specialist", "conversation" or "summary"
+    call_policy: CallPolicy = CallPolicy()
+    call_policies: Dict[str, CallPolicy] = {}
+    # Model of every agent, overridden per agent by models, with the same keys
+    model: AgentModel = AgentModel()
+    models: Dict[str, AgentModel] = {}
+
+
+class ChatConfig(BaseModel):
+    # Load the session, form and history in one query and write the form
+    # and message of a turn in one statement
+    unit_of_work: bool = False
+    # Write the turn in the background after /chat/message has responded; the
+    # next turn of the same session waits for it (per worker process)
+    deferred_persistence: bool = False
+    # Write only the fields a turn changed, with jsonb_set, if the stored form is
+    # still at the version the turn started from
+    partial_form_writes: bool = False
+
+
+class SessionCacheConfig(BaseModel):
+    # Keep the form and history of recent sessions in memory between turns. Only
+    # safe if all turns of a session reach the same worker process
+    enabled: bool = False
+    max_size: int = 1000
+    ttl_seconds: float = 900.0
+
+
+class TemplatesConfig(BaseModel):
+    # Reload prompt templates and form schemas when their files change
+    hot_reload: bool = False
+
+
+class EmbeddingCacheConfig(BaseModel):
+    enabled: bool = True
+    max_size: int = 10_000
+    ttl_seconds: float = 3600.0
+    # Back the in-process cache with the embedding_cache table
+    persistent: bool = True
+    # Rows of the embedding_cache table expire after this many seconds
+    persistent_ttl_seconds: float = 30 * 24 * 3600.0
+
+
+class VectorstoreConfig(BaseModel):
+    # "pgvector" searches in Postgres, "numpy" in an in-process matrix
+    backend: Literal["pgvector", "numpy"] = "pgvector"
 
 
 class Settings(BaseSettings):
     open_ai_config: OpenAIConfig
     database: Database
+    agents: AgentsConfig = AgentsConfig()
+    chat: ChatConfig = ChatConfig()
+    templates: TemplatesConfig = TemplatesConfig()
+    session_cache: SessionCacheConfig = SessionCacheConfig()
+    embedding_cache: EmbeddingCacheConfig = EmbeddingCacheConfig()
+    vectorstore: VectorstoreConfig = VectorstoreConfig()
 
     @computed_field  # type: ignore[misc]
     @property
@@ -0,0 +1,240 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+
+
+@dataclass
+class AgentCall:
+    """The accounting of a single chat completion request of an agent."""
+
+    agent: str
+    model: str
+    latency: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    retries: int = 0
+    hedges: int = 0
+    # Hedged requests cancelled in flight, their tokens are not counted
+    cancelled_hedges: int = 0
+    error: bool = False
+
+    @classmethod
+    def from_usage(
+        cls,
+        agent: str,
+        model: str,
+        latency: float,
+        usage,
+        retries: int = 0,
+        hedges: int = 0,
+        cancelled_hedges: int = 0,
+    ):
+        call = cls(
+            agent=agent,
+            model=model,
+            latency=latency,
+            retries=retries,
+            hedges=hedges,
+            cancelled_hedges=cancelled_hedges,
+        )
+        call.add_usage(usage)
+        return call
+
+    def add_usage(self, usage) -> None:
+        """Add the tokens of a response, e.g. of a hedged request not used."""
+        details = getattr(usage, "prompt_tokens_details", None)
+        self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+        self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+        self.cached_tokens += getattr(details, "cached_tokens", None) or 0
+
+
+class _Series:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.retries = 0
+        self.hedges = 0
+        self.cancelled_hedges = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+
+
+class AgentMetrics:
+    """Process-wide counters of the agent calls, by agent and model."""
+
+    def __init__(self):
+        self._series: Dict[Tuple[str, str], _Series] = defaultdict(_Series)
+
+    def record(self, call: AgentCall) -> None:
+        series = self._series[(call.agent, call.model)]
+        series.calls += 1
+        series.errors += call.error
+        series.prompt_tokens += call.prompt_tokens
+        series.completion_tokens += call.completion_tokens
+        series.cached_tokens += call.cached_tokens
+        series.retries += call.retries
+        series.hedges += call.hedges
+        series.cancelled_hedges += call.cancelled_hedges
+        series.latency_sum += call.latency
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if call.latency <= bound:
+                series.latency_buckets[i] += 1
+
+    def clear(self) -> None:
+        self._series.clear()
+
+    def render_prometheus(self) -> str:
+        """Render the counters in the Prometheus text exposition format."""
+        counters = [
+            ("calls", "Chat completion requests"),
+            ("errors", "Chat completion requests that failed"),
+            ("prompt_tokens", "Prompt tokens"),
+            ("completion_tokens", "Completion tokens"),
+            ("cached_tokens", "Prompt tokens served from the prompt cache"),
+            ("retries", "Retries made by the call policy"),
+            ("hedges", "Duplicate requests sent by the call policy"),
+            (
+                "cancelled_hedges",
+                "Hedged requests cancelled in flight, without counted tokens",
+            ),
+        ]
+        lines: List[str] = []
+        for attribute, description in counters:
+            name = f"form_agent_{attribute}_total"
+            lines.append(f"# HELP {name} {description}.")
+            lines.append(f"# TYPE {name} counter")
+            for labels, series in self._labelled_series():
+                lines.append(f"{name}{{{labels}}} {getattr(series, attribute)}")
+
+        name = "form_agent_latency_seconds"
+        lines.append(f"# HELP {name} Chat completion request latency.")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, series in self._labelled_series():
+            for bound, count in zip(LATENCY_BUCKETS, series.latency_buckets):
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {series.calls}')
+            lines.append(f"{name}_sum{{{labels}}} {series.latency_sum}")
+            lines.append(f"{name}_count{{{labels}}} {series.calls}")
+        return "\n".join(lines) + "\n"
+
+    def _labelled_series(self):
+        for (agent, model), series in sorted(self._series.items()):
+            yield f'agent="{agent}",model="{model}"', series
+
+
+_AGENT_METRICS = AgentMetrics()
+
+
+def get_agent_metrics() -> AgentMetrics:
+    """Get the process-wide agent call metrics."""
+    return _AGENT_METRICS
+
+
+class FastPathMetrics:
+    """Process-wide counters of the turns answered by the fast path.
+
+    The latency saved by a hit is estimated as the mean latency of the turns
+    answered by the agents so far, minus the latency of the hit.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.hit_latency_sum = 0.0
+        self.agent_turns = 0
+        self.agent_turn_latency_sum = 0.0
+        self.saved_seconds = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        attempts = self.hits + self.misses
+        return self.hits / attempts if attempts else 0.0
+
+    def record_hit(self, latency: float) -> None:
+        self.hits += 1
+        self.hit_latency_sum += latency
+        if self.agent_turns:
+            mean_latency = self.agent_turn_latency_sum / self.agent_turns
+            self.saved_seconds += max(mean_latency - latency, 0.0)
+
+    def record_miss(self) -> None:
+        self.misses += 1
+
+    def record_agent_turn(self, latency: float) -> None:
+        self.agent_turns += 1
+        self.agent_turn_latency_sum += latency
+
+    def render_prometheus(self) -> str:
+        """Render the counters in the Prometheus text exposition format."""
+        metrics = [
+            ("hits_total", "Turns answered by the fast path", self.hits),
+            ("misses_total", "Turns left to the agents", self.misses),
+            (
+                "saved_seconds_total",
+                "Estimated latency saved by the fast path",
+                self.saved_seconds,
+            ),
+            (
+                "agent_turns_total",
+                "Turns answered by the agents",
+                self.agent_turns,
+            ),
+            (
+                "agent_turn_seconds_total",
+                "Latency of the turns answered by the agents",
+                self.agent_turn_latency_sum,
+            ),
+        ]
+        lines: List[str] = []
+        for suffix, description, value in metrics:
+            name = f"form_fast_path_{suffix}"
+            lines.append(f"# HELP {name} {description}.")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+_FAST_PATH_METRICS = FastPathMetrics()
+
+
+def get_fast_path_metrics() -> FastPathMetrics:
+    """Get the process-wide fast path metrics."""
+    return _FAST_PATH_METRICS
+
+
+def summarize_calls(calls: List[AgentCall]) -> Dict[str, Dict[str, float]]:
+    """Sum up the calls of a turn by agent."""
+    breakdown: Dict[str, Dict[str, float]] = {}
+    for call in calls:
+        totals = breakdown.setdefault(
+            call.agent,
+            {
+                "calls": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cached_tokens": 0,
+                "retries": 0,
+                "hedges": 0,
+                "cancelled_hedges": 0,
+                "latency": 0.0,
+            },
+        )
+        totals["calls"] += 1
+        totals["prompt_tokens"] += call.prompt_tokens
+        totals["completion_tokens"] += call.completion_tokens
+        totals["cached_tokens"] += call.cached_tokens
+        totals["retries"] += call.retries
+        totals["hedges"] += call.hedges
+        totals["cancelled_hedges"] += call.cancelled_hedges
+        totals["latency"] += call.latency
+    return breakdown
@@ -0,0 +1,47 @@
+from typing import Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from form.utils.config import OpenAIConfig, get_settings
+
+_OPENAI_CLIENTS: Dict[str, AsyncOpenAI] = {}
+
+
+def new_openai_client(config: OpenAIConfig) -> AsyncOpenAI:
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        ),
+        timeout=config.timeout,
+    )
+    return AsyncOpenAI(
+        api_key=config.api_key, timeout=config.timeout, http_client=http_client
+    )
+
+
+def get_openai_client(api_key: Optional[str] = None) -> AsyncOpenAI:
+    """Get the process-wide OpenAI client for an API key, creating it on first use.
+
+    Args:
+        api_key (str, optional): The API key. Defaults to the configured key.
+
+    Returns:
+        AsyncOpenAI: The shared client, which reuses its HTTP connections.
+    """
+    config = get_settings().open_ai_config
+    if api_key is not None and api_key != config.api_key:
+        config = config.model_copy(update={"api_key": api_key})
+    if config.api_key not in _OPENAI_CLIENTS:
+        _OPENAI_CLIENTS[config.api_key] = new_openai_client(config)
+    return _OPENAI_CLIENTS[config.api_key]
+
+
+async def close_openai_clients() -> None:
+    """Close all shared OpenAI clients and their connection pools."""
+    clients = list(_OPENAI_CLIENTS.values())
+    _OPENAI_CLIENTS.clear()
+    for client in clients:
+        await client.close()
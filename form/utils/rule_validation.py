@@ -0,0 +1,182 @@
+import math
+import re
+from dataclasses import dataclass
+from datetime import date
+from functools import lru_cache
+from typing import Any, Callable, Optional, Tuple
+
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_BOUND = re.compile(r"\b(min|max)\s+(-?\d+(?:\.\d+)?)\s*(char)?", re.IGNORECASE)
+_ORDER = re.compile(r"\b(before|after)\s+(\w+)", re.IGNORECASE)
+_NUMBER = re.compile(r"-?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?")
+_DECIMAL = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+@dataclass
+class RejectedValue:
+    """A value taken out of a merge because it breaks the rule of its field."""
+
+    path: str
+    value: Any
+    reason: str
+    source: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class FieldRule:
+    """The checks of a free-text rule of form_val.json, see `compile_rule`."""
+
+    text: str
+    min_length: Optional[int] = None
+    max_length: Optional[int] = None
+    choices: Tuple[str, ...] = ()
+    numeric: bool = False
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    iso_date: bool = False
+    # Field names, or "today", the date must be before and after
+    before: Tuple[str, ...] = ()
+    after: Tuple[str, ...] = ()
+
+    def check(
+        self, value: Any, lookup: Callable[[str], Any] = lambda name: None
+    ) -> Optional[str]:
+        """Check a value, empty values always pass.
+
+        Args:
+            value: The value of the field.
+            lookup (callable): Gets the value of another field by its name, for
+                the date ordering.
+
+        Returns:
+            str: Why the value is invalid, or None if it is valid.
+        """
+        if value is None or value == "":
+            return None
+        text = str(value).strip()
+        if self.min_length is not None and len(text) < self.min_length:
+            return f"must be at least {self.min_length} characters long"
+        if self.max_length is not None and len(text) > self.max_length:
+            return f"must be at most {self.max_length} characters long"
+        if self.choices and text.casefold() not in (
+            choice.casefold() for choice in self.choices
+        ):
+            return f"must be one of {', '.join(self.choices)}"
+        if self.numeric:
+            number = _to_number(value, text)
+            if number is None:
+                return "must be a number"
+            if self.minimum is not None and number < self.minimum:
+                return f"must be at least {self.minimum:g}"
+            if self.maximum is not None and number > self.maximum:
+                return f"must be at most {self.maximum:g}"
+        if self.iso_date or self.before or self.after:
+            day = _parse_date(text)
+            if day is None:
+                if self.iso_date:
+                    return "must be an ISO date, e.g. 2024-01-31"
+                return None
+            for name in self.before:
+                other = _date_of(name, lookup)
+                if other is not None and not day < other:
+                    return f"must be before {name} ({other.isoformat()})"
+            for name in self.after:
+                other = _date_of(name, lookup)
+                if other is not None and not day > other:
+                    return f"must be after {name} ({other.isoformat()})"
+        return None
+
+    def extract(self, message: str) -> Optional[str]:
+        """Get the value of a message that is nothing but an answer to the rule.
+
+        Only closed answers are recognized: one of the choices, a number or an
+        ISO date, with nothing else in the message but surrounding punctuation.
+        The value is not checked, see `check`.
+
+        Returns:
+            str: The value, e.g. the choice as spelled in the rule, or None.
+        """
+        text = message.strip().strip(".!").strip()
+        if self.choices:
+            for choice in self.choices:
+                if text.casefold() == choice.casefold():
+                    return choice
+            return None
+        if self.numeric:
+            return text.replace(",", "") if _NUMBER.fullmatch(text) else None
+        if self.iso_date:
+            return text if _parse_date(text) else None
+        return None
+
+
+@lru_cache(maxsize=1024)
+def compile_rule(text: str) -> FieldRule:
+    """Compile a free-text rule such as "min 3 chars, max 50 characters".
+
+    Understands character lengths ("min 2 chars"), choices ("drop-down list ->
+    USD, EUR"), numbers with bounds ("only numbers, min 0, max 1000000"), ISO
+    dates ("iso format", "date picker") and the order of dates ("before
+    end_date and after today"). Anything else in the rule is left to the
+    agents.
+    """
+    lowered = text.lower()
+    numeric = re.search(r"\bnumbers?\b|\bnumeric\b", lowered) is not None
+    lengths = {}
+    bounds = {}
+    for match in _BOUND.finditer(text):
+        kind, number, chars = match.group(1).lower(), match.group(2), match.group(3)
+        if chars:
+            lengths[kind] = int(float(number))
+        elif numeric:
+            bounds[kind] = float(number)
+    choices = ()
+    if "->" in text:
+        choices = tuple(
+            choice.strip()
+            for choice in text.split("->", 1)[1].split(",")
+            if choice.strip()
+        )
+    order = {"before": [], "after": []}
+    for match in _ORDER.finditer(text):
+        order[match.group(1).lower()].append(match.group(2))
+    return FieldRule(
+        text=text,
+        min_length=lengths.get("min"),
+        max_length=lengths.get("max"),
+        choices=choices,
+        numeric=numeric,
+        minimum=bounds.get("min"),
+        maximum=bounds.get("max"),
+        iso_date="iso format" in lowered
+        or "yyyy-mm-dd" in lowered
+        or "date picker" in lowered,
+        before=tuple(order["before"]),
+        after=tuple(order["after"]),
+    )
+
+
+def _to_number(value: Any, text: str) -> Optional[float]:
+    # float() alone also takes "nan", "inf" and "1_000", and NaN passes any bound
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        number = float(value)
+    elif _DECIMAL.fullmatch(text):
+        number = float(text)
+    else:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _parse_date(text: str) -> Optional[date]:
+    if not _ISO_DATE.fullmatch(text):
+        return None
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        return None
+
+
+def _date_of(name: str, lookup: Callable[[str], Any]) -> Optional[date]:
+    if name.lower() == "today":
+        return date.today()
+    value = lookup(name)
+    return _parse_date(str(value).strip()) if value else None
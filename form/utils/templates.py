@@ -0,0 +1,147 @@
+import copy
+import json
+import os
+import string
+import time
+from glob import glob
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from loguru import logger
+
+from form.utils.config import get_settings
+
+_FORMATTER = string.Formatter()
+
+
+class PromptTemplate:
+    """A `str.format` template parsed once into literal text and fields.
+
+    Args:
+        source (str): The template text.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self._parts = list(_FORMATTER.parse(source))
+        self.fields = {field for _, field, _, _ in self._parts if field is not None}
+        # Nested fields inside a format spec need the full formatter
+        self._nested = any(spec and "{" in spec for _, _, spec, _ in self._parts)
+        self._static = None if self.fields else source.format()
+
+    def render(self, **kwargs) -> str:
+        if self._static is not None:
+            return self._static
+        if self._nested:
+            return self.source.format(**kwargs)
+        chunks = []
+        for literal, field_name, format_spec, conversion in self._parts:
+            chunks.append(literal)
+            if field_name is not None:
+                value, _ = _FORMATTER.get_field(field_name, (), kwargs)
+                value = _FORMATTER.convert_field(value, conversion)
+                chunks.append(format(value, format_spec))
+        return "".join(chunks)
+
+
+class TemplateRegistry:
+    """Prompt templates and JSON schemas read from disk once and kept in memory.
+
+    Args:
+        hot_reload (bool): Check the modification time of a file on every access
+            and reload it when it changed.
+    """
+
+    def __init__(self, hot_reload: bool = False):
+        self.hot_reload = hot_reload
+        self._templates: Dict[str, Tuple[float, PromptTemplate]] = {}
+        self._schemas: Dict[str, Tuple[float, Any]] = {}
+        self.loads = 0
+        self.load_seconds = 0.0
+        self.renders = 0
+        self.render_seconds = 0.0
+
+    def preload(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            if path.endswith(".json"):
+                self._load_schema(path)
+            else:
+                self._load_template(path)
+
+    def render(self, path: str, **kwargs) -> str:
+        """Render a prompt template with `str.format` semantics."""
+        template = self._get(self._templates, path, self._load_template)
+        start = time.perf_counter()
+        rendered = template.render(**kwargs)
+        self.render_seconds += time.perf_counter() - start
+        self.renders += 1
+        return rendered
+
+    def get_json(self, path: str) -> Any:
+        """Get a copy of a JSON file that the caller is free to modify."""
+        return copy.deepcopy(self._get(self._schemas, path, self._load_schema))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "templates": len(self._templates),
+            "schemas": len(self._schemas),
+            "hot_reload": self.hot_reload,
+            "loads": self.loads,
+            "load_ms": self.load_seconds * 1000,
+            "renders": self.renders,
+            "render_ms": self.render_seconds * 1000,
+        }
+
+    def _get(self, entries: Dict[str, Tuple[float, Any]], path: str, load) -> Any:
+        entry = entries.get(path)
+        if entry is None:
+            return load(path)
+        if self.hot_reload and os.stat(path).st_mtime != entry[0]:
+            logger.info(f"Reloading changed file {path}")
+            return load(path)
+        return entry[1]
+
+    def _load_template(self, path: str) -> PromptTemplate:
+        start = time.perf_counter()
+        mtime = os.stat(path).st_mtime
+        with open(path, "r") as file:
+            template = PromptTemplate(file.read())
+        self._templates[path] = (mtime, template)
+        self._record_load(start)
+        return template
+
+    def _load_schema(self, path: str) -> Any:
+        start = time.perf_counter()
+        mtime = os.stat(path).st_mtime
+        with open(path, "r") as file:
+            schema = json.load(file)
+        self._schemas[path] = (mtime, schema)
+        self._record_load(start)
+        return schema
+
+    def _record_load(self, start: float) -> None:
+        self.load_seconds += time.perf_counter() - start
+        self.loads += 1
+
+
+_TEMPLATE_REGISTRY: Optional[TemplateRegistry] = None
+
+
+def get_template_registry() -> TemplateRegistry:
+    """Get the process-wide registry of prompt templates and form schemas."""
+    global _TEMPLATE_REGISTRY
+    if _TEMPLATE_REGISTRY is None:
+        _TEMPLATE_REGISTRY = TemplateRegistry(
+            hot_reload=get_settings().templates.hot_reload
+        )
+    return _TEMPLATE_REGISTRY
+
+
+def preload_templates() -> TemplateRegistry:
+    """Load every prompt and form schema so no request reads them from disk."""
+    registry = get_template_registry()
+    registry.preload(glob("form/prompts/*.txt") + glob("form/schemas/*.json"))
+    logger.info(
+        f"Loaded {registry.loads} templates and schemas "
+        f"in {registry.load_seconds * 1000:.1f} ms"
+    )
+    return registry
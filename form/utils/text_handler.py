@@ -1,7 +1,13 @@
 import hashlib
 import uuid
+from typing import Callable, List, TypeVar
 from uuid import UUID
 
+T = TypeVar("T")
+
+# Rough average for English text with OpenAI tokenizers
+CHARS_PER_TOKEN = 4
+
 
 def convert_str_to_uuid(id_str: str) -> UUID:
     if not id_str:
@@ -11,3 +17,51 @@ def convert_str_to_uuid(id_str: str) -> UUID:
     hex_string = hashlib.md5(id_str.encode("UTF-8")).hexdigest()
     session_uuid = uuid.UUID(hex=hex_string)
     return session_uuid
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens of a text without loading a tokenizer.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The estimated number of tokens, at least 1.
+    """
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def batch_by_token_budget(
+    items: List[T],
+    max_tokens: int,
+    max_batch_size: int,
+    get_text: Callable[[T], str] = str,
+) -> List[List[T]]:
+    """Split items into consecutive batches that fit a token and size budget.
+
+    An item that exceeds the token budget on its own gets a batch of its own.
+
+    Args:
+        items (list): The items to split.
+        max_tokens (int): The maximum estimated number of tokens per batch.
+        max_batch_size (int): The maximum number of items per batch.
+        get_text (callable): Returns the text of an item.
+
+    Returns:
+        list: The batches, in the original order of the items.
+    """
+    batches: List[List[T]] = []
+    batch: List[T] = []
+    batch_tokens = 0
+    for item in items:
+        tokens = estimate_tokens(get_text(item))
+        if batch and (
+            batch_tokens + tokens > max_tokens or len(batch) >= max_batch_size
+        ):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
@@ -0,0 +1,166 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from loguru import logger
+
+from form.db.db_operations import DatabaseOperations
+from form.db.db_tables import Embedding
+from form.utils.config import get_settings
+from form.vectorstore.numpy_engine import NumpyVectorIndex
+
+
+class VectorSearchBackend(ABC):
+    """Answers similarity searches for the vectorstore endpoints."""
+
+    @abstractmethod
+    async def get_nearest_embeddings(
+        self,
+        db_ops: DatabaseOperations,
+        target_embedding: list,
+        limit: int,
+        distance_type: str,
+        **kwargs,
+    ) -> List[Tuple[Embedding, float]]:
+        pass
+
+    @abstractmethod
+    async def get_embeddings_within_distance(
+        self,
+        db_ops: DatabaseOperations,
+        target_embedding: list,
+        distance: float,
+        distance_type: str,
+        load_vector: bool = True,
+    ) -> List[Embedding]:
+        pass
+
+    def on_upsert(self, embeddings: Dict[UUID, List[float]]) -> None:
+        """Called after embeddings have been written to the database."""
+
+    def on_delete(self, embedding_ids: Sequence[UUID]) -> None:
+        """Called after embeddings have been deleted from the database."""
+
+
+class PgVectorBackend(VectorSearchBackend):
+    """Searches with the pgvector operators inside Postgres."""
+
+    async def get_nearest_embeddings(
+        self,
+        db_ops: DatabaseOperations,
+        target_embedding: list,
+        limit: int,
+        distance_type: str,
+        **kwargs,
+    ) -> List[Tuple[Embedding, float]]:
+        return await db_ops.get_nearest_embeddings(
+            target_embedding, limit, distance_type, **kwargs
+        )
+
+    async def get_embeddings_within_distance(
+        self,
+        db_ops: DatabaseOperations,
+        target_embedding: list,
+        distance: float,
+        distance_type: str,
+        load_vector: bool = True,
+    ) -> List[Embedding]:
+        return await db_ops.get_embeddings_within_distance(
+            target_embedding, distance, distance_type, load_vector=load_vector
+        )
+
+
+class NumpyBackend(VectorSearchBackend):
+    """Searches an in-process NumPy matrix and loads only the matching rows.
+
+    The matrix is loaded from the embeddings table on first use and kept up to
+    date by the upsert and delete endpoints of this process.
+    """
+
+    def __init__(self, dimensions: int = 1536):
+        self.index = NumpyVectorIndex(dimensions=dimensions)
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+
+    async def _ensure_loaded(self, db_ops: DatabaseOperations) -> None:
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            rows = await db_ops.get_all_embedding_vectors()
+            if rows:
+                embedding_ids, vectors = zip(*rows)
+                self.index.add(embedding_ids, vectors)
+            self._loaded = True
+            logger.info(f"NumPy vector index loaded with {len(self.index)} vectors")
+
+    @staticmethod
+    async def _load_rows(
+        db_ops: DatabaseOperations,
+        matches: List[Tuple[UUID, float]],
+        load_vector: bool = True,
+    ) -> List[Tuple[Embedding, float]]:
+        if not matches:
+            return []
+        try:
+            rows = await db_ops.get_embeddings(
+                [embedding_id for embedding_id, _ in matches], load_vector=load_vector
+            )
+        except ValueError:
+            # Every match was deleted by another worker since it was indexed
+            return []
+        rows_by_id = {row.embedding_id: row for row in rows}
+        return [
+            (rows_by_id[embedding_id], distance)
+            for embedding_id, distance in matches
+            if embedding_id in rows_by_id
+        ]
+
+    async def get_nearest_embeddings(
+        self,
+        db_ops: DatabaseOperations,
+        target_embedding: list,
+        limit: int,
+        distance_type: str,
+        load_vector: bool = True,
+        **kwargs,
+    ) -> List[Tuple[Embedding, float]]:
+        await self._ensure_loaded(db_ops)
+        matches = self.index.search(target_embedding, limit, distance_type)
+        return await self._load_rows(db_ops, matches, load_vector)
+
+    async def get_embeddings_within_distance(
+        self,
+        db_ops: DatabaseOperations,
+        target_embedding: list,
+        distance: float,
+        distance_type: str,
+        load_vector: bool = True,
+    ) -> List[Embedding]:
+        await self._ensure_loaded(db_ops)
+        matches = self.index.within_distance(target_embedding, distance, distance_type)
+        return [row for row, _ in await self._load_rows(db_ops, matches, load_vector)]
+
+    def on_upsert(self, embeddings: Dict[UUID, List[float]]) -> None:
+        if self._loaded and embeddings:
+            self.index.add(list(embeddings), list(embeddings.values()))
+
+    def on_delete(self, embedding_ids: Sequence[UUID]) -> None:
+        if self._loaded:
+            self.index.delete(embedding_ids)
+
+
+_VECTOR_BACKEND: Optional[VectorSearchBackend] = None
+
+
+def get_vector_backend() -> VectorSearchBackend:
+    """Get the process-wide vector search backend configured in the settings."""
+    global _VECTOR_BACKEND
+    if _VECTOR_BACKEND is None:
+        if get_settings().vectorstore.backend == "numpy":
+            _VECTOR_BACKEND = NumpyBackend()
+        else:
+            _VECTOR_BACKEND = PgVectorBackend()
+    return _VECTOR_BACKEND
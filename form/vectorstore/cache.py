@@ -0,0 +1,184 @@
+import time
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import AsyncIterator, Dict, List, Optional
+from uuid import UUID
+
+from loguru import logger
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from form.db import get_async_session
+from form.db.db_tables import EmbeddingCacheEntry
+from form.utils.cache import TTLCache
+from form.utils.config import EmbeddingCacheConfig, get_settings
+from form.utils.text_handler import convert_str_to_uuid
+
+
+class EmbeddingCache:
+    """Two-tier cache of embeddings keyed on the model and the normalized text.
+
+    The first tier is an in-process LRU with a TTL, the second the persistent
+    `embedding_cache` table shared by all workers. Its rows expire after
+    `persistent_ttl_seconds`; expired rows are deleted by the writes, at most
+    once per `prune_interval` seconds and process.
+    """
+
+    prune_interval = 3600.0
+
+    def __init__(self, config: EmbeddingCacheConfig):
+        self.memory = TTLCache(max_size=config.max_size, ttl_seconds=config.ttl_seconds)
+        self.persistent = config.persistent
+        self.persistent_ttl = timedelta(seconds=config.persistent_ttl_seconds)
+        self._pruned_at: Optional[float] = None
+        self.persistent_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def cache_key(model: str, text: str) -> UUID:
+        return convert_str_to_uuid(f"{model}\n{text}")
+
+    async def get_many(
+        self, model: str, texts: List[str], db: Optional[AsyncSession] = None
+    ) -> Dict[str, List[float]]:
+        """Look up the cached embeddings of normalized texts.
+
+        Args:
+            model (str): The embedding model.
+            texts (list): The normalized texts.
+            db (AsyncSession): The caller's session for the persistent tier, a
+                session of its own is opened if None.
+
+        Returns:
+            dict: The embeddings that were found, by text.
+        """
+        found: Dict[str, List[float]] = {}
+        missing: Dict[UUID, str] = {}
+        for text in texts:
+            key = self.cache_key(model, text)
+            embedding = self.memory.get(key)
+            if embedding is not None:
+                found[text] = embedding
+            else:
+                missing[key] = text
+
+        if missing and self.persistent:
+            for key, embedding in (await self._load(list(missing), db)).items():
+                self.memory.set(key, embedding)
+                found[missing.pop(key)] = embedding
+                self.persistent_hits += 1
+
+        self.misses += len(missing)
+        return found
+
+    async def set_many(
+        self,
+        model: str,
+        embeddings: Dict[str, List[float]],
+        db: Optional[AsyncSession] = None,
+    ) -> None:
+        """Store the embeddings of normalized texts in both tiers.
+
+        Args:
+            model (str): The embedding model.
+            embeddings (dict): The embeddings by normalized text.
+            db (AsyncSession): The caller's session for the persistent tier, a
+                session of its own is opened if None.
+        """
+        values = []
+        for text, embedding in embeddings.items():
+            key = self.cache_key(model, text)
+            self.memory.set(key, embedding)
+            values.append(
+                {
+                    "cache_key": key,
+                    "model": model,
+                    "embedding": embedding,
+                    "expires_at": func.now() + self.persistent_ttl,
+                }
+            )
+        if values and self.persistent:
+            await self._store(values, db)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "memory_hits": self.memory.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "size": len(self.memory),
+            "max_size": self.memory.max_size,
+        }
+
+    async def _load(
+        self, keys: List[UUID], db: Optional[AsyncSession]
+    ) -> Dict[UUID, List[float]]:
+        # A failing persistent tier must never break the embedding path
+        async with _use_session(db) as session:
+            try:
+                result = await session.execute(
+                    select(
+                        EmbeddingCacheEntry.cache_key, EmbeddingCacheEntry.embedding
+                    ).where(
+                        EmbeddingCacheEntry.cache_key.in_(keys),
+                        EmbeddingCacheEntry.expires_at > func.now(),
+                    )
+                )
+                return {key: embedding.tolist() for key, embedding in result.all()}
+            except Exception as e:
+                await session.rollback()
+                logger.warning(f"Could not read from the embedding cache table: {e}")
+                return {}
+
+    async def _store(self, values: List[dict], db: Optional[AsyncSession]) -> None:
+        async with _use_session(db) as session:
+            try:
+                stmt = insert(EmbeddingCacheEntry).values(values)
+                # Rows of texts embedded again have expired
+                await session.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=["cache_key"],
+                        set_=dict(
+                            embedding=stmt.excluded.embedding,
+                            expires_at=stmt.excluded.expires_at,
+                        ),
+                    )
+                )
+                now = time.monotonic()
+                if (
+                    self._pruned_at is None
+                    or now - self._pruned_at > self.prune_interval
+                ):
+                    await session.execute(
+                        delete(EmbeddingCacheEntry).where(
+                            EmbeddingCacheEntry.expires_at <= func.now()
+                        )
+                    )
+                    self._pruned_at = now
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                logger.warning(f"Could not write to the embedding cache table: {e}")
+
+
+@asynccontextmanager
+async def _use_session(db: Optional[AsyncSession]) -> AsyncIterator[AsyncSession]:
+    if db is not None:
+        yield db
+    else:
+        async with get_async_session() as session:
+            yield session
+
+
+_EMBEDDING_CACHE: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Get the process-wide embedding cache, or None if caching is disabled."""
+    global _EMBEDDING_CACHE
+    config = get_settings().embedding_cache
+    if not config.enabled:
+        return None
+    if _EMBEDDING_CACHE is None:
+        _EMBEDDING_CACHE = EmbeddingCache(config)
+    return _EMBEDDING_CACHE
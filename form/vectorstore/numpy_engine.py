@@ -0,0 +1,140 @@
+from typing import Dict, List, Sequence, Tuple
+from uuid import UUID
+
+import numpy as np
+
+# Number of set bits of every byte value, for Hamming distances on packed bits
+_POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint16)
+
+
+class NumpyVectorIndex:
+    """Memory-resident exact vector search over a contiguous float32 matrix.
+
+    Rows are stored L2-normalized next to their norms, so cosine similarity is a
+    single matrix-vector product and the other distances are derived from it.
+    The sign bits of every row are kept packed for Hamming distances.
+    Distances follow the pgvector operators, e.g. max_inner_product is the
+    negative inner product so that smaller is always closer.
+
+    Args:
+        dimensions (int): The vector dimensions.
+        initial_capacity (int): Rows allocated up front; the matrix grows by
+            doubling when it is full.
+    """
+
+    def __init__(self, dimensions: int = 1536, initial_capacity: int = 1024):
+        self.dimensions = dimensions
+        self._unit = np.zeros((initial_capacity, dimensions), dtype=np.float32)
+        self._norms = np.zeros(initial_capacity, dtype=np.float32)
+        self._bits = np.zeros((initial_capacity, (dimensions + 7) // 8), dtype=np.uint8)
+        self._ids: List[UUID] = []
+        self._positions: Dict[UUID, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, embedding_id: UUID) -> bool:
+        return embedding_id in self._positions
+
+    def add(self, embedding_ids: Sequence[UUID], vectors: Sequence[Sequence[float]]):
+        """Add vectors, replacing the vectors of ids that are already indexed."""
+        if not len(embedding_ids):
+            return
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimensions)
+        norms = np.linalg.norm(matrix, axis=1)
+        unit = matrix / np.where(norms == 0, 1, norms)[:, None]
+        bits = np.packbits(matrix > 0, axis=1)
+        self._reserve(len(self._ids) + len(embedding_ids))
+        for embedding_id, row, norm, row_bits in zip(embedding_ids, unit, norms, bits):
+            position = self._positions.get(embedding_id)
+            if position is None:
+                position = len(self._ids)
+                self._ids.append(embedding_id)
+                self._positions[embedding_id] = position
+            self._unit[position] = row
+            self._norms[position] = norm
+            self._bits[position] = row_bits
+
+    def delete(self, embedding_ids: Sequence[UUID]) -> None:
+        """Delete vectors by moving the last row into the freed slot."""
+        for embedding_id in embedding_ids:
+            position = self._positions.pop(embedding_id, None)
+            if position is None:
+                continue
+            last = len(self._ids) - 1
+            if position != last:
+                moved_id = self._ids[last]
+                self._unit[position] = self._unit[last]
+                self._norms[position] = self._norms[last]
+                self._bits[position] = self._bits[last]
+                self._ids[position] = moved_id
+                self._positions[moved_id] = position
+            self._ids.pop()
+
+    def distances(self, target: Sequence[float], distance_type: str) -> np.ndarray:
+        """Compute the distance of every indexed vector to the target vector."""
+        count = len(self._ids)
+        unit, norms = self._unit[:count], self._norms[:count]
+        query = np.asarray(target, dtype=np.float32)
+        query_norm = float(np.linalg.norm(query))
+        query_unit = query / (query_norm or 1.0)
+
+        if distance_type == "cosine_distance":
+            return 1.0 - unit @ query_unit
+        if distance_type == "max_inner_product":
+            return -(norms * (unit @ query))
+        if distance_type == "l2_distance":
+            squared = norms**2 + query_norm**2 - 2 * norms * (unit @ query)
+            return np.sqrt(np.maximum(squared, 0))
+        if distance_type == "l1_distance":
+            return np.abs(unit * norms[:, None] - query).sum(axis=1)
+        if distance_type == "hamming_distance":
+            # Binary quantization: the sign of every dimension is one bit
+            query_bits = np.packbits(query > 0)
+            differing = np.bitwise_xor(self._bits[:count], query_bits)
+            return _POPCOUNT[differing].sum(axis=1).astype(np.float32)
+        raise ValueError(f"Unsupported distance type {distance_type}")
+
+    def search(
+        self, target: Sequence[float], limit: int, distance_type: str
+    ) -> List[Tuple[UUID, float]]:
+        """Find the closest vectors to the target vector.
+
+        Returns:
+            list: Up to `limit` (id, distance) pairs, closest first.
+        """
+        if not self._ids or limit <= 0:
+            return []
+        distances = self.distances(target, distance_type)
+        if limit < len(distances):
+            candidates = np.argpartition(distances, limit - 1)[:limit]
+        else:
+            candidates = np.arange(len(distances))
+        order = candidates[np.argsort(distances[candidates], kind="stable")]
+        return [(self._ids[i], float(distances[i])) for i in order]
+
+    def within_distance(
+        self, target: Sequence[float], distance: float, distance_type: str
+    ) -> List[Tuple[UUID, float]]:
+        """Find all vectors closer to the target vector than a distance."""
+        if not self._ids:
+            return []
+        distances = self.distances(target, distance_type)
+        matches = np.flatnonzero(distances < distance)
+        return [(self._ids[i], float(distances[i])) for i in matches]
+
+    def _reserve(self, rows: int) -> None:
+        capacity = self._unit.shape[0]
+        if rows <= capacity:
+            return
+        capacity = max(capacity, 1)
+        while capacity < rows:
+            capacity *= 2
+        unit = np.zeros((capacity, self.dimensions), dtype=np.float32)
+        norms = np.zeros(capacity, dtype=np.float32)
+        bits = np.zeros((capacity, self._bits.shape[1]), dtype=np.uint8)
+        count = len(self._ids)
+        unit[:count] = self._unit[:count]
+        norms[:count] = self._norms[:count]
+        bits[:count] = self._bits[:count]
+        self._unit, self._norms, self._bits = unit, norms, bits
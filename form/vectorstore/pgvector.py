@@ -1,38 +1,61 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 
-from openai import AsyncOpenAI
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from form.utils.config import get_settings
+from form.utils.openai_client import get_openai_client
+from form.vectorstore.cache import get_embedding_cache
 
 
 class OpenAIEmbeddings:
     def __init__(
-        self, api_key: Optional[str] = None, model: str = "text-embedding-3-small"
+        self,
+        api_key: Optional[str] = None,
+        model: str = "text-embedding-3-small",
+        use_cache: bool = True,
+        db: Optional[AsyncSession] = None,
     ):
         self.api_key = api_key or get_settings().open_ai_config.api_key
         self.model = model
-        self.client = AsyncOpenAI(api_key=self.api_key)
+        self.client = get_openai_client(self.api_key)
+        self.cache = get_embedding_cache() if use_cache else None
+        # The session the persistent cache tier uses, one of its own if None
+        self.db = db
 
     @staticmethod
     def _process_text(text: str) -> str:
         return text.strip().lower().replace("\n", " ")
 
     async def get_embedding(self, content: str) -> List[float]:
-        formatted_text = self._process_text(content)
-        embedding_object = await self.client.embeddings.create(
-            input=[formatted_text], model=self.model
-        )
-        return embedding_object.data[0].embedding
+        embeddings = await self.get_embeddings([content])
+        return embeddings[0]
 
     async def get_embeddings(self, contents: List[str]) -> List[List[float]]:
         formatted_texts = [self._process_text(text) for text in contents]
-        embedding_object = await self.client.embeddings.create(
-            input=formatted_texts, model=self.model
+        embeddings: Dict[str, List[float]] = (
+            await self.cache.get_many(self.model, formatted_texts, self.db)
+            if self.cache
+            else {}
+        )
+        missing_texts = list(
+            dict.fromkeys(text for text in formatted_texts if text not in embeddings)
         )
-        return [data.embedding for data in embedding_object.data]
+        if missing_texts:
+            embedding_object = await self.client.embeddings.create(
+                input=missing_texts, model=self.model
+            )
+            new_embeddings = {
+                text: data.embedding
+                for text, data in zip(missing_texts, embedding_object.data)
+            }
+            if self.cache:
+                await self.cache.set_many(self.model, new_embeddings, self.db)
+            embeddings.update(new_embeddings)
+        return [embeddings[text] for text in formatted_texts]
 
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.client.close()
+        # The client is shared process-wide and closed on application shutdown
+        pass
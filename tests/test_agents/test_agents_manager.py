@@ -0,0 +1,354 @@
+import asyncio
+import json
+from unittest import mock
+from uuid import uuid4
+
+import pytest
+
+from form.agents.agents_manager import AgentsManager
+from form.agents.fast_path import FastPath
+from form.agents.session_cache import SessionState
+from form.api.endpoints.chat import _save_chat_turn
+from form.models.responses import ChatOutput
+from form.utils.config import get_settings
+from form.utils.cache import TTLCache
+from form.utils.templates import get_template_registry
+
+
+@pytest.fixture
+def agents_manager():
+    manager = AgentsManager(db_session=None, session_id=None)
+    manager.schema = {"title": "", "currency": ""}
+    manager.form_validation = {"title": "min 3 chars", "currency": "USD, EUR"}
+    return manager
+
+
+def fake_agents(manager, intent_to: str, filled_title: str = "Dashboard"):
+    async def intent_process(input_prompt, messages):
+        await asyncio.sleep(0.05)
+        return {"intent": "valid", "content": "Hi!", "to": intent_to}
+
+    async def note_taking_process(input_prompt, form, form_val, messages):
+        manager.note_taking_agent.usage["started_calls"] += 1
+        await asyncio.sleep(0.01)
+        manager.note_taking_agent._record_usage(None)
+        return {"schema": {**form, "title": filled_title}}
+
+    async def specialist_process(input_prompt, messages):
+        manager.specialist_agent.usage["started_calls"] += 1
+        await asyncio.sleep(1)
+        return {"is_clarification_needed": False, "content": ""}
+
+    manager.intent_agent.process = intent_process
+    manager.note_taking_agent.process = note_taking_process
+    manager.specialist_agent.process = specialist_process
+
+
+def test_speculative_routing_to_user_discards_work(agents_manager):
+    agents_manager.speculative_execution = True
+    fake_agents(agents_manager, intent_to="user")
+
+    early_response, specialist = asyncio.run(
+        agents_manager._run_routing_agents("Hello")
+    )
+
+    assert early_response["content"] == "Hi!"
+    assert specialist is None
+    # The note-taking agent finished but its result must be thrown away
+    assert agents_manager.schema == {"title": "", "currency": ""}
+    assert agents_manager.get_turn_changes() == []
+    assert agents_manager.turn_metrics["speculation_cancelled"] is True
+    assert agents_manager.turn_metrics["cancelled_calls"] == 1
+
+
+def test_speculative_routing_to_note_taking(agents_manager):
+    agents_manager.speculative_execution = True
+    fake_agents(agents_manager, intent_to="Note-Taking-Agent")
+    agents_manager.specialist_agent.process = lambda input_prompt, messages: (
+        asyncio.sleep(0.05, result={"is_clarification_needed": False, "content": ""})
+    )
+
+    early_response, specialist = asyncio.run(
+        agents_manager._run_routing_agents("Title is Dashboard")
+    )
+
+    assert early_response is None
+    assert specialist == "None"
+    assert agents_manager.schema["title"] == "Dashboard"
+    assert agents_manager.get_turn_changes() == [
+        {"path": "title", "old": "", "new": "Dashboard", "source": "NoteTakingAgent"}
+    ]
+    assert agents_manager.turn_metrics["speculation_cancelled"] is False
+    assert agents_manager.turn_metrics["latency_saved"] > 0
+
+
+def test_sequential_routing_to_user(agents_manager):
+    agents_manager.speculative_execution = False
+    fake_agents(agents_manager, intent_to="user")
+
+    early_response, _ = asyncio.run(agents_manager._run_routing_agents("Hello"))
+
+    assert early_response["schema"] == {"title": "", "currency": ""}
+    assert agents_manager.note_taking_agent.usage["started_calls"] == 0
+
+
+def test_fast_path_answers_without_agents(agents_manager):
+    agents_manager.fast_path = FastPath()
+    agents_manager.schema = {"title": "Dashboard", "currency": ""}
+    agents_manager.form_validation = {"currency": "drop-down list -> USD, EUR"}
+    fake_agents(agents_manager, intent_to="user")
+    agents_manager.intent_agent.process = mock.Mock(side_effect=AssertionError)
+
+    early_response, _ = asyncio.run(agents_manager._run_routing_agents("eur"))
+
+    assert early_response["content"] == "The form was successfully filled."
+    assert early_response["schema"] == {"title": "Dashboard", "currency": "EUR"}
+    assert agents_manager.get_turn_changes() == [
+        {"path": "currency", "old": "", "new": "EUR", "source": "FastPath"}
+    ]
+    assert agents_manager.turn_metrics["fast_path"] is True
+    assert agents_manager.chat_history[-1]["from"] == "Fast-Path"
+
+
+def test_fast_path_miss_runs_the_agents(agents_manager):
+    agents_manager.fast_path = FastPath()
+    agents_manager.speculative_execution = False
+    fake_agents(agents_manager, intent_to="user")
+
+    early_response, _ = asyncio.run(agents_manager._run_routing_agents("Hello"))
+
+    assert early_response["content"] == "Hi!"
+    assert agents_manager.turn_metrics["fast_path"] is False
+
+
+def test_note_taking_stops_once_the_response_is_merged(agents_manager):
+    fake_agents(agents_manager, intent_to="Note-Taking-Agent")
+
+    schema = asyncio.run(agents_manager._process_note_taking("Title is Dashboard", ""))
+
+    # The merged form equals the response, another round would not add anything
+    assert schema == {"title": "Dashboard", "currency": ""}
+    assert agents_manager.turn_metrics["note_taking_iterations"] == 1
+    assert [change.path for change in agents_manager.turn_changes] == ["title"]
+
+
+def test_note_taking_stops_on_an_empty_change_set(agents_manager):
+    # Responses that leave out or blank fields never match the merged form
+    responses = [{"title": "Dashboard", "amount": "10"}, {"title": "", "currency": ""}]
+
+    async def note_taking_process(input_prompt, form, form_val, messages):
+        return {"schema": responses.pop(0)}
+
+    agents_manager.note_taking_agent.process = note_taking_process
+
+    asyncio.run(agents_manager._process_note_taking("Dashboard for 10", ""))
+
+    assert agents_manager.turn_metrics["note_taking_iterations"] == 2
+    assert [
+        (change.path, change.old, change.new) for change in agents_manager.turn_changes
+    ] == [("title", "", "Dashboard"), ("amount", None, "10")]
+
+
+def test_local_validation_rejects_invalid_values(agents_manager):
+    agents_manager.local_validation = True
+    agents_manager.form_validation = {
+        "title": "min 3 chars",
+        "currency": "drop-down list -> USD, EUR",
+    }
+
+    async def note_taking_process(input_prompt, form, form_val, messages):
+        return {"schema": {"title": "Dashboard", "currency": "JPY"}}
+
+    agents_manager.note_taking_agent.process = note_taking_process
+
+    schema = asyncio.run(agents_manager._process_note_taking("Dashboard in JPY", ""))
+
+    # The second round extracts the same invalid value and changes nothing
+    assert schema == {"title": "Dashboard", "currency": ""}
+    assert agents_manager.turn_metrics["note_taking_iterations"] == 2
+    assert agents_manager.turn_metrics["rejected_values"] == 2
+
+
+def test_incremental_note_taking_sends_only_empty_fields(agents_manager):
+    agents_manager.incremental_note_taking = True
+    sent_forms = []
+
+    async def note_taking_process(input_prompt, form, form_val, messages, indent):
+        sent_forms.append((form, form_val))
+        if len(sent_forms) == 1:
+            return {"schema": {**form, "title": "Dashboard"}}
+        return {"schema": form}
+
+    agents_manager.note_taking_agent.process = note_taking_process
+
+    schema = asyncio.run(agents_manager._process_note_taking("Title is Dashboard", ""))
+
+    assert schema == {"title": "Dashboard", "currency": ""}
+    assert sent_forms[1] == ({"currency": ""}, {"currency": "USD, EUR"})
+    assert agents_manager.turn_metrics["note_taking_iterations"] == 2
+
+
+def test_unit_of_work_initialize_loads_state_in_one_call(agents_manager):
+    calls = []
+
+    async def load_chat_state(session_id):
+        calls.append(session_id)
+        session = mock.Mock(form_data='{"title": "Dashboard", "currency": ""}')
+        messages = [mock.Mock(prompt="hello", response="")]
+        return session, messages
+
+    agents_manager.unit_of_work = True
+    agents_manager.db_ops = mock.Mock(load_chat_state=load_chat_state)
+    asyncio.run(agents_manager.initialize())
+
+    assert len(calls) == 1
+    assert agents_manager.schema == {"title": "Dashboard", "currency": ""}
+    assert agents_manager.chat_history == [{"role": "user", "content": "hello"}]
+
+
+def test_warm_turn_restores_cached_state_without_database(agents_manager):
+    session_cache = TTLCache(max_size=10)
+    agents_manager.session_cache = session_cache
+    agents_manager.db_ops = mock.Mock(side_effect=AssertionError("no queries"))
+    form = {"title": "Dashboard", "currency": ""}
+    session_cache.set(
+        agents_manager.session_id,
+        SessionState(
+            form=form,
+            form_validation={"title": "min 3 chars"},
+            history=[{"role": "user", "content": "hello"}],
+            form_version=3,
+        ),
+    )
+
+    asyncio.run(agents_manager.initialize())
+    agents_manager.turn_changes.append(
+        agents_manager._compile_form().set("currency", "EUR")
+    )
+    state = agents_manager.get_session_state("Currency is EUR", "Done")
+
+    # The cached form is not changed by the turn until it is written through
+    assert form["currency"] == ""
+    assert state.form == {"title": "Dashboard", "currency": "EUR"}
+    assert (agents_manager.form_version, state.form_version) == (3, 4)
+    assert state.history == [
+        {"role": "user", "content": "hello"},
+        {"role": "user", "content": "Currency is EUR"},
+    ]
+
+
+class FakeStore:
+    """Stores sessions and messages in memory, form_data as the JSON text sent."""
+
+    def __init__(self):
+        self.sessions = {}
+        self.messages = []
+        self.session_writes = 0
+        self.patches = 0
+
+    async def upsert_session(self, session_id, form_data):
+        stored = self.sessions.get(session_id)
+        self.sessions[session_id] = mock.Mock(
+            form_data=form_data,
+            form_version=0 if stored is None else stored.form_version + 1,
+        )
+        self.session_writes += 1
+
+    async def patch_session_form(self, session_id, fields, form_version):
+        stored = self.sessions[session_id]
+        if stored.form_version != form_version:
+            return False
+        form = json.loads(stored.form_data)
+        for keys, value in fields:
+            parent = form
+            for key in keys[:-1]:
+                parent = parent[key]
+            parent[keys[-1]] = value
+        # JSONB keeps the keys of an object in an order of its own
+        stored.form_data = json.dumps(form, sort_keys=True)
+        stored.form_version += 1
+        self.patches += 1
+        return True
+
+    async def upsert_message(self, **message):
+        self.messages.append(mock.Mock(**message))
+
+    async def get_messages_for_session(self, session_id, create_if_not_exists=False):
+        return self.messages
+
+    async def get_session_data(self, session_id):
+        return self.sessions.get(session_id)
+
+
+def run_stored_turn(store, prompt, fill=None):
+    manager = AgentsManager(db_session=None, session_id=store.session_id)
+    manager.db_ops = store
+    asyncio.run(manager.initialize())
+    if fill is not None:
+        path, value = fill
+        manager.turn_changes.append(manager._compile_form().set(path, value))
+    chat_response = ChatOutput(
+        response="Noted.",
+        form=manager.schema,
+        changes=manager.get_turn_changes(),
+        form_version=manager.next_form_version,
+    )
+    asyncio.run(
+        _save_chat_turn(
+            store, store.session_id, prompt, chat_response, None, manager.form_changed
+        )
+    )
+    return chat_response
+
+
+def test_reloaded_form_keeps_its_field_order_after_turns():
+    store = FakeStore()
+    store.session_id = uuid4()
+
+    first = run_stored_turn(
+        store, "The currency is EUR", ("financial_details.currency", "EUR")
+    )
+    # A turn that changes nothing writes its message only
+    second = run_stored_turn(store, "What else?")
+
+    assert (first.form_version, second.form_version) == (0, 0)
+    assert store.session_writes == 1
+    assert len(store.messages) == 2
+    manager = AgentsManager(db_session=None, session_id=store.session_id)
+    manager.db_ops = store
+    asyncio.run(manager.initialize())
+    assert list(manager.schema["financial_details"]) == [
+        "start_date",
+        "end_date",
+        "expected_amount",
+        "currency",
+    ]
+    assert manager.schema["financial_details"]["currency"] == "EUR"
+    assert manager._compile_form().first_empty() == ["general_information", "title"]
+
+
+def test_partially_written_form_is_reloaded_in_field_order(monkeypatch):
+    monkeypatch.setattr(get_settings().chat, "partial_form_writes", True)
+    store = FakeStore()
+    store.session_id = uuid4()
+
+    run_stored_turn(store, "The currency is EUR", ("financial_details.currency", "EUR"))
+    run_stored_turn(
+        store, "It starts in May", ("financial_details.start_date", "2025-05-01")
+    )
+
+    assert (store.session_writes, store.patches) == (1, 1)
+    stored = json.loads(store.sessions[store.session_id].form_data)
+    assert list(stored["financial_details"])[0] == "currency"
+    manager = AgentsManager(db_session=None, session_id=store.session_id)
+    manager.db_ops = store
+    asyncio.run(manager.initialize())
+    assert list(manager.schema) == list(
+        get_template_registry().get_json("form/schemas/form.json")
+    )
+    assert manager.schema["financial_details"] == {
+        "start_date": "2025-05-01",
+        "end_date": "",
+        "expected_amount": "",
+        "currency": "EUR",
+    }
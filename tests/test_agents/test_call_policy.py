@@ -0,0 +1,125 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from form.agents.call_policy import LatencyTracker, PolicyCall
+from form.models.exceptions import AgentCallTimeoutError
+from form.utils.config import CallPolicy
+
+
+def connection_error():
+    return openai.APIConnectionError(
+        request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    )
+
+
+def run(policy, request, tracker=None):
+    policy_call = PolicyCall(policy, tracker or LatencyTracker(), "intent")
+    return policy_call, asyncio.run(policy_call.run(request))
+
+
+def test_retries_retryable_errors_with_backoff():
+    attempts = []
+
+    async def request(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise connection_error()
+        return "ok"
+
+    policy = CallPolicy(deadline=5, max_retries=2, backoff_base=0.01)
+    policy_call, result = run(policy, request)
+
+    assert result == "ok"
+    assert policy_call.retries == 2
+    # Every attempt only gets the time left until the deadline
+    assert attempts[0] > attempts[1] > attempts[2]
+
+
+def test_gives_up_after_max_retries():
+    async def request(timeout):
+        raise connection_error()
+
+    with pytest.raises(openai.APIConnectionError):
+        run(CallPolicy(max_retries=1, backoff_base=0.01), request)
+
+
+def test_does_not_retry_other_errors():
+    attempts = []
+
+    async def request(timeout):
+        attempts.append(timeout)
+        raise ValueError("invalid JSON")
+
+    with pytest.raises(ValueError):
+        run(CallPolicy(backoff_base=0.01), request)
+    assert len(attempts) == 1
+
+
+def test_deadline_bounds_the_call():
+    async def request(timeout):
+        await asyncio.sleep(10)
+
+    loop = asyncio.new_event_loop()
+    policy_call = PolicyCall(CallPolicy(deadline=0.05), LatencyTracker(), "intent")
+    start = loop.time()
+    with pytest.raises(AgentCallTimeoutError):
+        loop.run_until_complete(policy_call.run(request))
+    assert loop.time() - start < 1
+    loop.close()
+
+
+def test_hedges_slow_requests():
+    tracker = LatencyTracker()
+    for _ in range(20):
+        tracker.add(0.01)
+    calls = []
+
+    async def request(timeout):
+        calls.append(timeout)
+        # The first request is stuck, the hedged duplicate is fast
+        await asyncio.sleep(10 if len(calls) == 1 else 0.01)
+        return len(calls)
+
+    policy = CallPolicy(deadline=5, hedging=True, hedge_min_samples=20)
+    policy_call, result = run(policy, request, tracker)
+
+    assert result == 2
+    assert policy_call.hedges == 1
+    # The stuck request is cancelled, its tokens are unknown
+    assert policy_call.cancelled_hedges == 1
+    assert policy_call.discarded == []
+
+
+def test_keeps_hedged_responses_that_return_together():
+    tracker = LatencyTracker()
+    for _ in range(20):
+        tracker.add(0.01)
+    released = asyncio.Event()
+    calls = []
+
+    async def request(timeout):
+        calls.append(timeout)
+        # The first request returns right after the hedged duplicate
+        if len(calls) == 1:
+            await released.wait()
+            return "first"
+        released.set()
+        return "hedge"
+
+    policy = CallPolicy(deadline=5, hedging=True, hedge_min_samples=20)
+    policy_call, result = run(policy, request, tracker)
+
+    assert sorted([result, *policy_call.discarded]) == ["first", "hedge"]
+    assert policy_call.cancelled_hedges == 0
+
+
+def test_latency_tracker_percentile():
+    tracker = LatencyTracker(size=100)
+    assert tracker.percentile(0.95) is None
+    for latency in range(1, 101):
+        tracker.add(latency / 100)
+    assert tracker.percentile(0.95) == 0.96
+    assert tracker.percentile(1.0) == 1.0
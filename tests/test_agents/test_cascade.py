@@ -0,0 +1,101 @@
+import asyncio
+import json
+import math
+from types import SimpleNamespace
+
+import pytest
+
+from form.agents.cascade import decision_confidence, missing_keys
+from form.agents.intent_agent import IntentAgent
+from form.utils.config import AgentModel
+
+
+def tokens(*pieces):
+    return [SimpleNamespace(token=text, logprob=math.log(p)) for text, p in pieces]
+
+
+def test_decision_confidence_only_counts_decision_values():
+    pieces = [
+        ('{"intent": "', 0.99),
+        ("valid", 0.6),
+        ('", "content": "', 0.99),
+        ("Hello there", 0.1),
+        ('", "to": "', 0.99),
+        ("user", 0.9),
+        ('"}', 0.99),
+    ]
+    content = "".join(text for text, _ in pieces)
+
+    confidence = decision_confidence(content, tokens(*pieces), ["intent", "to"])
+
+    assert confidence == pytest.approx(0.6)
+    assert decision_confidence(content, tokens(*pieces), ["missing"]) is None
+
+
+def test_missing_keys():
+    assert missing_keys({"intent": "valid"}, ["intent", "to"]) == ["to"]
+    assert missing_keys(["intent"], ["intent"]) == ["intent"]
+
+
+def fake_completion(content, probability=0.99):
+    return SimpleNamespace(
+        choices=[
+            SimpleNamespace(
+                message=SimpleNamespace(content=content),
+                logprobs=SimpleNamespace(
+                    content=tokens((content, probability)) if content else []
+                ),
+            )
+        ]
+    )
+
+
+def cascade_agent(small_response, probability=0.99):
+    agent = IntentAgent(
+        agent_model=AgentModel(
+            model="gpt-4o", cascade_model="gpt-4o-mini", min_confidence=0.8
+        )
+    )
+    requested = []
+    large_response = {"intent": "valid", "content": "Hi", "to": "user"}
+
+    async def request_openai(model_name, messages, *args, **kwargs):
+        requested.append(model_name)
+        if model_name == "gpt-4o-mini":
+            return fake_completion(small_response, probability)
+        return fake_completion(json.dumps(large_response))
+
+    agent._request_openai = request_openai
+    return agent, requested
+
+
+@pytest.mark.parametrize(
+    "small_response, probability, expected_models",
+    [
+        ('{"intent": "valid", "content": "Hi", "to": "user"}', 0.95, ["gpt-4o-mini"]),
+        (
+            '{"intent": "valid", "content": "Hi", "to": "user"}',
+            0.5,
+            ["gpt-4o-mini", "gpt-4o"],
+        ),
+        ('{"intent": "valid", "content": "Hi"}', 0.95, ["gpt-4o-mini", "gpt-4o"]),
+        ('{"intent": "valid", ', 0.95, ["gpt-4o-mini", "gpt-4o"]),
+    ],
+)
+def test_cascade_escalates(small_response, probability, expected_models):
+    agent, requested = cascade_agent(small_response, probability)
+
+    response = asyncio.run(agent.process("hi", "history"))
+
+    assert requested == expected_models
+    assert response["to"] == "user"
+    assert agent.usage["escalations"] == len(expected_models) - 1
+
+
+def test_without_cascade_only_the_agent_model_is_called():
+    agent, requested = cascade_agent("{}")
+    agent.agent_model = AgentModel(model="gpt-4o")
+
+    asyncio.run(agent.process("hi", "history"))
+
+    assert requested == ["gpt-4o"]
@@ -0,0 +1,64 @@
+import copy
+
+from form.agents.fast_path import FastPath
+from form.utils.compiled_form import CompiledForm, FieldChange
+
+FORM = {
+    "general_information": {"title": "Dashboard", "type_of_contract": ""},
+    "financial_details": {"expected_amount": "", "currency": ""},
+}
+RULES = {
+    "general_information": {
+        "title": "min 3 chars, max 50 characters",
+        "type_of_contract": "drop-down list -> Internal, External, Grant, NGO",
+    },
+    "financial_details": {
+        "expected_amount": "only numbers, min 0, max 1000000",
+        "currency": "drop-down list -> USD, EUR, GBP",
+    },
+}
+
+
+def compiled_form():
+    return CompiledForm(copy.deepcopy(FORM), RULES)
+
+
+def test_fills_the_next_field_and_asks_for_the_following_one():
+    form = compiled_form()
+
+    change, response = FastPath().process("external.", form)
+
+    assert change == FieldChange(
+        "general_information.type_of_contract", "", "External", "FastPath"
+    )
+    assert form.get("general_information.type_of_contract") == "External"
+    assert response["content"] == (
+        "Thanks, the type of contract is External. "
+        "What is the expected amount? Please answer with a number."
+    )
+
+
+def test_last_field_completes_the_form():
+    form = compiled_form()
+    form.set("general_information.type_of_contract", "Grant")
+    form.set("financial_details.expected_amount", "5000")
+
+    _, response = FastPath().process("GBP", form)
+
+    assert response["content"] == "The form was successfully filled."
+
+
+def test_leaves_everything_else_to_the_agents():
+    form = compiled_form()
+    fast_path = FastPath()
+
+    # Not only the value, another choice or nothing the rule can check
+    assert fast_path.process("External, but maybe a grant", form) is None
+    assert fast_path.process("Freelance", form) is None
+    form.set("general_information.type_of_contract", "Grant")
+    assert fast_path.process("2000000", form) is None
+    assert fast_path.process("about 5000", form) is None
+    assert fast_path.process("nan", form) is None
+    form.set("general_information.title", "")
+    assert fast_path.process("Dashboard", form) is None
+    assert form.form["financial_details"]["expected_amount"] == ""
@@ -0,0 +1,92 @@
+import asyncio
+from unittest import mock
+
+from form.agents.history_manager import HistoryManager
+from form.utils.text_handler import estimate_tokens
+
+
+class FakeSummaryAgent:
+    def __init__(self):
+        self.calls = []
+
+    async def process(self, input_prompt, summary=""):
+        self.calls.append((input_prompt, summary))
+        return {"summary": f"{summary} +{input_prompt.count(chr(10)) + 1}".strip()}
+
+
+class FakeDatabaseOperations:
+    def __init__(self):
+        self.summaries = []
+
+    async def update_session_summary(self, session_id, summary, summarized_messages):
+        self.summaries.append((summary, summarized_messages))
+
+
+def make_history(length):
+    return [
+        {"role": "user", "content": f"message {i} with some procurement details"}
+        for i in range(length)
+    ]
+
+
+def make_manager(window=4, batch=3):
+    return HistoryManager(
+        FakeDatabaseOperations(),
+        session_id=None,
+        window=window,
+        batch=batch,
+        summary_agent=FakeSummaryAgent(),
+    )
+
+
+def test_render_stays_within_budget_for_long_sessions():
+    manager = make_manager()
+    manager.summary = "The user orders 10 laptops."
+    sizes = [
+        estimate_tokens(manager.render(make_history(length), max_tokens=200))
+        for length in (50, 500, 5000)
+    ]
+
+    assert all(size <= 200 for size in sizes)
+    assert max(sizes) - min(sizes) < 20
+    rendered = manager.render(make_history(1000), max_tokens=200)
+    assert "The user orders 10 laptops." in rendered
+    assert rendered.endswith("message 999 with some procurement details")
+
+
+def test_render_always_keeps_the_latest_message():
+    manager = make_manager()
+    history = [{"role": "user", "content": "x" * 4000}]
+
+    assert manager.render(history, max_tokens=10).endswith("x" * 4000)
+
+
+def test_load_folds_messages_beyond_the_window():
+    async def run():
+        manager = make_manager(window=4, batch=3)
+        session = mock.Mock(summary="earlier", summarized_messages=2)
+        history = manager.load(session, make_history(10))
+        await manager.save_summary()
+        return manager, history
+
+    manager, history = asyncio.run(run())
+
+    # 2 of the 10 messages were already summarized, 4 of the other 8 are folded
+    assert len(history) == 8
+    assert manager.summary_agent.calls[0][1] == "earlier"
+    assert manager.summary_agent.calls[0][0].count("\n") == 3
+    assert manager.db_ops.summaries == [("earlier +4", 6)]
+    assert manager.summarized_messages == 6
+
+
+def test_load_waits_for_a_full_batch():
+    async def run():
+        manager = make_manager(window=4, batch=3)
+        manager.load(None, make_history(6))
+        await manager.save_summary()
+        return manager
+
+    manager = asyncio.run(run())
+
+    assert manager.summary_agent.calls == []
+    assert manager.db_ops.summaries == []
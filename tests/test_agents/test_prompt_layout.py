@@ -0,0 +1,129 @@
+import asyncio
+from types import SimpleNamespace
+
+from form.agents.conversation_agent import ConversationAgent
+from form.agents.intent_agent import IntentAgent
+from form.agents.note_taking_agent import NoteTakingAgent
+
+
+def capture_messages(agent):
+    calls = []
+
+    async def call_openai(model_name, messages, **kwargs):
+        calls.append(messages)
+        return {}
+
+    agent._call_openai = call_openai
+    return calls
+
+
+def test_intent_prompt_starts_with_static_instructions():
+    agent = IntentAgent()
+    calls = capture_messages(agent)
+    asyncio.run(agent.process("hello", "user: first turn"))
+    asyncio.run(agent.process("hello", "user: first turn\nassistant: second turn"))
+
+    first, second = calls
+    assert first[0] == second[0]
+    assert first[0]["content"] == agent._get_sys_prompt()
+    assert first[1]["content"] == "user: first turn"
+    assert first[-1] == {"role": "user", "content": "hello"}
+
+
+def test_note_taking_prompt_keeps_form_after_static_instructions():
+    agent = NoteTakingAgent()
+    calls = capture_messages(agent)
+    rules = {"title": "min 3 chars"}
+    asyncio.run(agent.process("hi", {"title": ""}, rules, "history a"))
+    asyncio.run(agent.process("hi", {"title": "Dashboard"}, rules, "history b"))
+
+    first, second = calls
+    assert first[0] == second[0]
+    assert "Dashboard" not in second[0]["content"]
+    assert "Dashboard" in second[1]["content"]
+    assert agent.last_prompt_size == sum(len(m["content"]) for m in second)
+
+
+def test_note_taking_prompt_keeps_rules_after_static_instructions():
+    agent = NoteTakingAgent()
+    calls = capture_messages(agent)
+    form = {"title": "", "currency": ""}
+    rules = {"title": "min 3 chars", "currency": "USD, EUR"}
+    asyncio.run(agent.process("hi", form, rules, "history", indent=None))
+    # Incremental rounds only send the empty fields and their rules
+    asyncio.run(
+        agent.process("hi", {"currency": ""}, {"currency": "USD, EUR"}, "history")
+    )
+
+    first, second = calls
+    assert first[0] == second[0]
+    assert "min 3 chars" not in first[0]["content"]
+    assert "min 3 chars" in first[1]["content"]
+    assert "min 3 chars" not in second[1]["content"]
+
+
+def test_conversation_prompt_keeps_empty_fields_after_static_instructions():
+    agent = ConversationAgent()
+    calls = capture_messages(agent)
+    asyncio.run(agent.process("hi", ["title"], "min 3 chars", "Noted."))
+    asyncio.run(agent.process("hi", ["currency"], "USD, EUR", "Noted."))
+
+    first, second = calls
+    assert first[0] == second[0]
+    assert "currency" in second[1]["content"]
+    assert [m["role"] for m in second] == ["system", "system", "user", "assistant"]
+
+
+def test_record_usage_counts_cached_prompt_tokens():
+    agent = IntentAgent()
+    agent._record_usage(
+        SimpleNamespace(
+            prompt_tokens=1200,
+            completion_tokens=30,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=1024),
+        )
+    )
+    agent._record_usage(SimpleNamespace(prompt_tokens=100, completion_tokens=10))
+
+    assert agent.usage["prompt_tokens"] == 1300
+    assert agent.usage["cached_prompt_tokens"] == 1024
+    assert agent.usage["completed_calls"] == 2
+
+
+class FakeRawResponse:
+    def __init__(self, content, usage):
+        self._response = SimpleNamespace(
+            usage=usage,
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        )
+
+    def parse(self):
+        return self._response
+
+
+def test_call_openai_records_agent_call():
+    agent = IntentAgent()
+    usage = SimpleNamespace(
+        prompt_tokens=1200,
+        completion_tokens=30,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=1024),
+    )
+
+    async def create(timeout, **kwargs):
+        assert 0 < timeout <= agent.call_policy.deadline
+        return FakeRawResponse('{"intent": "valid"}', usage)
+
+    agent.client = SimpleNamespace(
+        chat=SimpleNamespace(
+            completions=SimpleNamespace(
+                with_raw_response=SimpleNamespace(create=create)
+            )
+        )
+    )
+    response = asyncio.run(agent._call_openai("gpt-4o", messages=[]))
+
+    assert response == {"intent": "valid"}
+    (call,) = agent.calls
+    assert (call.agent, call.model, call.retries) == ("IntentAgent", "gpt-4o", 0)
+    assert (call.prompt_tokens, call.cached_tokens) == (1200, 1024)
+    assert not call.error
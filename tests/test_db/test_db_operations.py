@@ -0,0 +1,242 @@
+import asyncio
+from unittest import mock
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from form.db.db_operations import DatabaseOperations
+from form.db.db_tables import Session
+from form.models.requests import Document
+from form.vectorstore.pgvector import OpenAIEmbeddings
+
+
+class FakeResult:
+    def __init__(self, rows=(), rowcount=None):
+        self.rows = list(rows)
+        self.rowcount = len(self.rows) if rowcount is None else rowcount
+
+    def all(self):
+        return self.rows
+
+    def scalars(self):
+        return self
+
+    def scalar_one_or_none(self):
+        return self.rows[0] if self.rows else None
+
+    one_or_none = scalar_one_or_none
+
+
+class FakeAsyncSession:
+    def __init__(self, results=()):
+        self.statements = []
+        self.commits = 0
+        self.results = list(results)
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+        return self.results.pop(0) if self.results else None
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        pass
+
+
+async def fake_get_embeddings(self, contents):
+    return [[float(len(content))] * 3 for content in contents]
+
+
+def test_upsert_embeddings_batches_documents():
+    db = FakeAsyncSession()
+    docs = [Document(content=f"document {i}") for i in range(10)]
+    # The duplicate must not end up twice in the same statement
+    docs.append(Document(content="document 0", properties={"version": 2}))
+
+    settings = mock.Mock()
+    settings.open_ai_config.embedding_batch_max_tokens = 1000
+    settings.open_ai_config.embedding_batch_max_size = 4
+    settings.open_ai_config.embedding_max_concurrency = 2
+
+    with mock.patch.object(
+        OpenAIEmbeddings, "get_embeddings", fake_get_embeddings
+    ), mock.patch("form.db.db_operations.get_settings", return_value=settings):
+        asyncio.run(DatabaseOperations(db).upsert_embeddings(docs))
+
+    assert len(db.statements) == 3
+    assert db.commits == 1
+    rows = [
+        row
+        for statement in db.statements
+        for row in statement.compile().params.items()
+        if row[0].startswith("content")
+    ]
+    assert len(rows) == 10
+
+
+def test_paginate_uses_keyset_on_primary_key():
+    cursor = uuid4()
+    query = DatabaseOperations._paginate(
+        select(Session), Session.session_id, limit=10, after=cursor
+    )
+    compiled = query.compile()
+    sql = str(compiled)
+
+    assert "WHERE sessions.session_id > :session_id_1" in sql
+    assert "ORDER BY sessions.session_id" in sql
+    assert "LIMIT :param_1" in sql
+    assert compiled.params == {"session_id_1": cursor, "param_1": 10}
+
+
+def test_paginate_without_limit_or_cursor_returns_everything():
+    query = DatabaseOperations._paginate(
+        select(Session), Session.session_id, limit=None, after=None
+    )
+    sql = str(query.compile())
+
+    assert "WHERE" not in sql
+    assert "LIMIT" not in sql
+
+
+@pytest.mark.parametrize(
+    "method, args",
+    [
+        ("get_embedding", (uuid4(),)),
+        ("get_embeddings", ([uuid4(), uuid4()],)),
+        ("delete_embedding", (uuid4(),)),
+        ("delete_embeddings", ([uuid4(), uuid4()],)),
+        ("get_messages_for_session", (uuid4(),)),
+        ("delete_session", (uuid4(),)),
+        ("update_session_data", (uuid4(), "{}")),
+    ],
+)
+def test_missing_rows_are_detected_in_a_single_statement(method, args):
+    db = FakeAsyncSession(results=[FakeResult(rowcount=0)])
+
+    with pytest.raises(ValueError):
+        asyncio.run(getattr(DatabaseOperations(db), method)(*args))
+
+    assert len(db.statements) == 1
+
+
+def test_get_messages_for_empty_session():
+    session_id = uuid4()
+    db = FakeAsyncSession(results=[FakeResult(rows=[(session_id, None)])])
+
+    messages = asyncio.run(DatabaseOperations(db).get_messages_for_session(session_id))
+
+    assert messages == []
+    assert len(db.statements) == 1
+
+
+def test_delete_session_deletes_messages_in_the_same_statement():
+    session_id = uuid4()
+    db = FakeAsyncSession(results=[FakeResult(rows=[session_id])])
+
+    asyncio.run(DatabaseOperations(db).delete_session(session_id))
+
+    assert len(db.statements) == 1
+    sql = str(db.statements[0].compile())
+    assert sql.startswith("WITH deleted_messages AS")
+    assert "RETURNING sessions.session_id" in sql
+
+
+def test_save_chat_turn_writes_session_and_message_in_one_statement():
+    db = FakeAsyncSession()
+
+    asyncio.run(
+        DatabaseOperations(db).save_chat_turn(
+            session_id=uuid4(),
+            form_data="{}",
+            message_id=uuid4(),
+            prompt="hello",
+            response="hi",
+            changes=[{"path": "title", "old": "", "new": "Dashboard"}],
+        )
+    )
+
+    assert len(db.statements) == 1
+    assert db.commits == 1
+    compiled = db.statements[0].compile()
+    sql = str(compiled)
+    assert sql.startswith("WITH upserted_session AS")
+    assert "INSERT INTO messages" in sql
+    assert [
+        {"path": "title", "old": "", "new": "Dashboard"}
+    ] in compiled.params.values()
+
+
+def test_patch_session_form_sets_fields_at_the_expected_version():
+    db = FakeAsyncSession(results=[FakeResult(rows=[uuid4()]), FakeResult()])
+    db_ops = DatabaseOperations(db)
+    fields = [(["general_information", "title"], "Sales")]
+
+    assert asyncio.run(db_ops.patch_session_form(uuid4(), fields, 3))
+    # Another writer stored a newer form, nothing is written
+    assert not asyncio.run(db_ops.patch_session_form(uuid4(), fields, 3))
+
+    compiled = db.statements[0].compile(dialect=postgresql.dialect())
+    sql = str(compiled)
+    assert sql.startswith("UPDATE sessions SET")
+    assert "jsonb_set(CAST(sessions.form_data #>> '{}' AS JSONB)" in sql
+    assert "sessions.form_version = " in sql
+    assert ["general_information", "title"] in compiled.params.values()
+
+
+def test_save_chat_turn_with_form_fields_updates_the_session():
+    db = FakeAsyncSession(results=[FakeResult()])
+
+    written = asyncio.run(
+        DatabaseOperations(db).save_chat_turn(
+            session_id=uuid4(),
+            form_data=None,
+            message_id=uuid4(),
+            prompt="hello",
+            response="hi",
+            form_fields=[(["title"], "Sales")],
+            form_version=0,
+        )
+    )
+
+    # The session was not at version 0, so neither row is written
+    assert not written
+    sql = str(db.statements[0].compile(dialect=postgresql.dialect()))
+    assert sql.startswith("WITH upserted_session AS \n(UPDATE sessions SET")
+    assert sql.endswith("RETURNING messages.message_id")
+
+
+def test_load_chat_state_loads_the_session_and_messages_in_one_query():
+    session_id, message_id = uuid4(), uuid4()
+    session = object()
+    message = {
+        "message_id": str(message_id),
+        "prompt": "hello",
+        "response": "Hi!",
+        "changes": None,
+        "created_at": "2025-05-01T10:00:00.123456+00:00",
+    }
+    db = FakeAsyncSession(results=[FakeResult(rows=[(session, [message])])])
+
+    loaded, messages = asyncio.run(DatabaseOperations(db).load_chat_state(session_id))
+
+    assert loaded is session
+    assert [(m.message_id, m.session_id, m.prompt) for m in messages] == [
+        (message_id, session_id, "hello")
+    ]
+    assert messages[0].created_at.tzinfo is not None
+    assert db.commits == 1
+    assert len(db.statements) == 1
+    sql = str(db.statements[0].compile(dialect=postgresql.dialect()))
+    assert "json_agg" in sql and "ORDER BY messages.created_at" in sql
+
+    # A session without messages aggregates to NULL
+    db = FakeAsyncSession(results=[FakeResult(rows=[(session, None)])])
+    assert asyncio.run(DatabaseOperations(db).load_chat_state(session_id)) == (
+        session,
+        [],
+    )
+    db = FakeAsyncSession(results=[FakeResult()])
+    assert asyncio.run(DatabaseOperations(db).load_chat_state(uuid4())) == (None, [])
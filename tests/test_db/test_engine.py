@@ -0,0 +1,25 @@
+from sqlalchemy.pool import NullPool
+
+from form.db import get_pool_status, new_async_engine
+from form.utils.config import get_settings
+
+
+def test_new_async_engine_null_pool():
+    settings = get_settings()
+    config = settings.database.model_copy(update={"pool_mode": "null"})
+    engine = new_async_engine(settings.sqlalchemy_database_uri, config)
+    assert isinstance(engine.pool, NullPool)
+    assert get_pool_status(engine) == {"pool_class": "NullPool"}
+
+
+def test_new_async_engine_queue_pool():
+    settings = get_settings()
+    config = settings.database.model_copy(
+        update={"pool_mode": "queue", "pool_size": 7, "pool_timeout": 5.0}
+    )
+    engine = new_async_engine(settings.sqlalchemy_database_uri, config)
+    status = get_pool_status(engine)
+    assert status["pool_class"] == "AsyncAdaptedQueuePool"
+    assert status["size"] == 7
+    assert status["checked_out"] == 0
+    assert engine.pool._timeout == 5.0
@@ -158,3 +158,20 @@ def test_field_update_chat_with_gpt(client, chat_url):
     chat_output = response.json()
     assert_valid_chat_output(chat_output)
     assert chat_output["form"]["general_information"]["title"] == "Dashboard 2.0"
+
+
+def test_stream_chat_with_gpt(client, chat_url):
+    chat_input = {"message": "Hi"}
+    with client.stream(
+        "POST", chat_url.replace("/message", "/message/stream"), json=chat_input
+    ) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [
+            line.removeprefix("event: ")
+            for line in response.iter_lines()
+            if line.startswith("event: ")
+        ]
+
+    assert "token" in events
+    assert events[-1] == "form"
@@ -37,3 +37,10 @@ def test_check_table_failure(client):
     assert response.json() == {
         "detail": f"Table {non_existent_table} does not exist in the database."
     }
+
+
+def test_get_metrics(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE form_agent_calls_total counter" in response.text
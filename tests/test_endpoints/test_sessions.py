@@ -1,3 +1,5 @@
+import json
+
 import pytest
 
 from tests.test_endpoints.fixtures.sessions_fixture import (
@@ -15,6 +17,30 @@ def test_get_all_sessions(client, get_test_session_id):
     assert get_test_session_id in [session["session_id"] for session in sessions]
 
 
+def test_get_all_sessions_paginated(client, get_test_session_id):
+    session_ids, cursor = [], None
+    while True:
+        url = "/sessions/get_all_sessions?limit=1"
+        response = client.get(f"{url}&after={cursor}" if cursor else url)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 1
+        session_ids += [session["session_id"] for session in page]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert get_test_session_id in session_ids
+    assert len(session_ids) == len(set(session_ids))
+
+
+def test_stream_all_sessions(client, get_test_session_id):
+    response = client.get("/sessions/stream_all_sessions")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    sessions = [json.loads(line) for line in response.text.splitlines()]
+    assert get_test_session_id in [session["session_id"] for session in sessions]
+
+
 @pytest.mark.parametrize(
     "session_id, expected_status",
     [
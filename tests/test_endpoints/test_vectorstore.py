@@ -1,3 +1,5 @@
+import base64
+import json
 from uuid import uuid4
 
 import pytest
@@ -27,6 +29,31 @@ def test_get_all_embeddings(client):
     assert len(embeddings) >= 3
 
 
+def test_get_all_embeddings_paginated(client):
+    response = client.get("/vectorstore/get_all_embeddings?limit=2&vector_format=omit")
+    assert response.status_code == 200
+    first_page = response.json()
+    assert len(first_page) == 2
+    cursor = response.headers["X-Next-Cursor"]
+    assert cursor == first_page[-1]["embedding_id"]
+
+    response = client.get(
+        f"/vectorstore/get_all_embeddings?limit=2&after={cursor}&vector_format=omit"
+    )
+    assert response.status_code == 200
+    second_page_ids = [embedding["embedding_id"] for embedding in response.json()]
+    assert cursor not in second_page_ids
+    assert all(embedding_id > cursor for embedding_id in second_page_ids)
+
+
+def test_stream_all_embeddings(client):
+    response = client.get("/vectorstore/stream_all_embeddings?vector_format=omit")
+    assert response.status_code == 200
+    embeddings = [json.loads(line) for line in response.text.splitlines()]
+    assert len(embeddings) >= 3
+    assert all(embedding["embedding"] is None for embedding in embeddings)
+
+
 @pytest.mark.parametrize(
     "embedding_id, expected_status",
     [
@@ -164,3 +191,49 @@ def test_delete_embeddings(client, sample_documents_uuids, num_ids, expected_sta
     assert response.status_code == expected_status
     if expected_status == 404:
         assert response.json() == {"detail": "None of the embeddings exist"}
+
+
+def test_create_and_get_index_status(client):
+    response = client.put(
+        "/vectorstore/create_index?method=hnsw&distance_type=cosine_distance"
+    )
+    assert response.status_code == 204
+
+    response = client.get("/vectorstore/get_index_status")
+    assert response.status_code == 200
+    indexes = {index["name"]: index for index in response.json()}
+    index = indexes["idx_embeddings_embedding_hnsw_cosine_distance"]
+    assert index["method"] == "hnsw"
+    assert index["distance_type"] == "cosine_distance"
+
+
+def test_create_unsupported_index(client):
+    response = client.put(
+        "/vectorstore/create_index?method=ivfflat&distance_type=l1_distance"
+    )
+    assert response.status_code == 400
+
+
+def test_get_nearest_embeddings_with_ef_search(client):
+    response = client.get(
+        "/vectorstore/get_nearest_embeddings?query=test&limit=3&ef_search=100"
+    )
+    assert response.status_code == 200
+    assert len(response.json()) <= 3
+
+
+@pytest.mark.parametrize("vector_format", ["list", "base64", "omit"])
+def test_get_nearest_embeddings_vector_format(client, vector_format):
+    response = client.get(
+        "/vectorstore/get_nearest_embeddings?query=test&limit=3"
+        f"&vector_format={vector_format}"
+    )
+    assert response.status_code == 200
+    for embedding in response.json():
+        if vector_format == "omit":
+            assert embedding["embedding"] is None
+        elif vector_format == "base64":
+            packed = base64.b64decode(embedding["embedding"])
+            assert len(packed) == 1536 * 4
+        else:
+            assert len(embedding["embedding"]) == 1536
@@ -0,0 +1,36 @@
+from unittest import mock
+
+from form.utils.cache import TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(max_size=10, ttl_seconds=60)
+    with mock.patch("form.utils.cache.time.monotonic", return_value=0):
+        cache.set("a", 1)
+    with mock.patch("form.utils.cache.time.monotonic", return_value=30):
+        assert cache.get("a") == 1
+    with mock.patch("form.utils.cache.time.monotonic", return_value=61):
+        assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_stats():
+    cache = TTLCache(max_size=10)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+    assert cache.pop("a") == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 0, "max_size": 10}
@@ -0,0 +1,199 @@
+import copy
+
+from form.utils.compiled_form import (
+    CompiledForm,
+    FieldChange,
+    in_template_order,
+    to_json_patch,
+)
+from form.utils.form_handler import (
+    find_first_empty_field,
+    find_rule_validation,
+    match_if_form_updated,
+    update_all_empty_fields,
+)
+
+FORM = {
+    "general_information": {
+        "title": "Dashboard",
+        "detailed_description": {"business_need": "", "project_scope": ""},
+    },
+    "financial_details": {"currency": "", "expected_amount": "100"},
+}
+RULES = {
+    "general_information": {
+        "title": "min 3 chars",
+        "detailed_description": {
+            "business_need": "min 2 chars",
+            "project_scope": "max 200 chars",
+        },
+    },
+    "financial_details": {"currency": "USD, EUR", "expected_amount": "numbers"},
+}
+
+
+def test_lookups_match_the_recursive_walks():
+    form = CompiledForm(copy.deepcopy(FORM), RULES)
+
+    assert len(form) == 5
+    assert form.first_empty() == find_first_empty_field(FORM)
+    assert form.rule(form.first_empty()) == find_rule_validation(
+        RULES, find_first_empty_field(FORM)
+    )
+    assert form.rule("financial_details.currency") == "USD, EUR"
+    assert form.get(["general_information", "title"]) == "Dashboard"
+
+
+def test_empty_fields():
+    form = CompiledForm(
+        {
+            "name": "John Doe",
+            "address": {"street": "", "city": "New York"},
+            "contact": {"phone": "555-1234"},
+            "email": "",
+        }
+    )
+
+    assert form.empty_fields() == {"address": {"street": ""}, "email": ""}
+
+
+def test_empty_rules():
+    rules = {
+        "name": "min 3 chars",
+        "address": {"street": "max 50 chars", "city": "max 20 chars"},
+        "email": "valid email",
+    }
+    form = CompiledForm(
+        {
+            "name": "",
+            "address": {"street": "", "city": "Paris"},
+            "email": "",
+            "age": "",
+        },
+        rules,
+    )
+
+    # Fields without a rule are left out
+    assert form.empty_rules() == {
+        "name": "min 3 chars",
+        "address": {"street": "max 50 chars"},
+        "email": "valid email",
+    }
+
+
+def test_next_empty_field_follows_updates():
+    form = CompiledForm(copy.deepcopy(FORM), RULES)
+
+    form.set("general_information.detailed_description.business_need", "Reports")
+    assert form.first_empty() == [
+        "general_information",
+        "detailed_description",
+        "project_scope",
+    ]
+    form.set("general_information.detailed_description.project_scope", "All")
+    form.set("financial_details.currency", "EUR")
+    assert form.first_empty() is None
+
+    form.set("general_information.title", "")
+    assert form.first_empty() == ["general_information", "title"]
+    # The nested dict is updated in place
+    assert form.form["general_information"]["title"] == ""
+
+
+def test_update_matches_the_recursive_updates():
+    filled = {
+        "general_information": {
+            "title": "Sales dashboard",
+            "detailed_description": {"business_need": "Reports", "project_scope": ""},
+        },
+        "financial_details": {"currency": "EUR", "expected_amount": "100"},
+        "approver": "Jane",
+    }
+    expected = copy.deepcopy(FORM)
+    update_all_empty_fields(expected, filled)
+    match_if_form_updated(expected, filled)
+
+    form = CompiledForm(copy.deepcopy(FORM), RULES)
+    changes = form.update(filled)
+
+    assert form.form == expected
+    assert changes == [
+        FieldChange("general_information.title", "Dashboard", "Sales dashboard"),
+        FieldChange(
+            "general_information.detailed_description.business_need", "", "Reports"
+        ),
+        FieldChange("financial_details.currency", "", "EUR"),
+        FieldChange("approver", None, "Jane"),
+    ]
+    assert "approver" in form
+    assert form.update(filled) == []
+
+
+def test_update_can_only_fill_or_only_overwrite():
+    filled = {
+        "general_information": {"title": "Sales", "detailed_description": {}},
+        "financial_details": {"currency": "EUR", "expected_amount": ""},
+    }
+
+    form = CompiledForm(copy.deepcopy(FORM))
+    assert form.update(filled, overwrite=False) == [
+        FieldChange("financial_details.currency", "", "EUR")
+    ]
+    form = CompiledForm(copy.deepcopy(FORM))
+    assert form.update(filled, fill=False) == [
+        FieldChange("general_information.title", "Dashboard", "Sales")
+    ]
+
+
+def test_update_records_the_source_and_whether_the_forms_match():
+    form = CompiledForm(copy.deepcopy(FORM))
+    filled = copy.deepcopy(FORM)
+    filled["financial_details"]["currency"] = "EUR"
+
+    changes = form.update(filled, source="NoteTakingAgent")
+
+    assert changes == [
+        FieldChange("financial_details.currency", "", "EUR", "NoteTakingAgent")
+    ]
+    assert form.matches_last_update
+    # An empty value never clears a field, so the forms differ afterwards
+    assert form.update(FORM) == []
+    assert not form.matches_last_update
+
+
+def test_json_patch_replaces_changed_fields():
+    changes = [
+        FieldChange("general_information.title", "", "Sales"),
+        FieldChange("financial_details.amount/EUR", "1", "2"),
+    ]
+
+    assert to_json_patch(changes) == [
+        {"op": "replace", "path": "/general_information/title", "value": "Sales"},
+        {"op": "replace", "path": "/financial_details/amount~1EUR", "value": "2"},
+    ]
+    # Added fields may be missing their parent objects
+    assert to_json_patch([FieldChange("new_section.field", None, "x")]) is None
+
+
+def test_stored_form_is_put_back_in_template_order():
+    stored = {
+        "approver": "Jane",
+        "financial_details": {"expected_amount": "100", "currency": "EUR"},
+        "general_information": {
+            "detailed_description": {"project_scope": "", "business_need": ""},
+            "title": "Dashboard",
+        },
+    }
+
+    form = in_template_order(stored, FORM)
+
+    assert form == stored
+    assert list(form) == ["general_information", "financial_details", "approver"]
+    assert CompiledForm(form).paths == [
+        "general_information.title",
+        "general_information.detailed_description.business_need",
+        "general_information.detailed_description.project_scope",
+        "financial_details.currency",
+        "financial_details.expected_amount",
+        "approver",
+    ]
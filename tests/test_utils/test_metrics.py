@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+from form.utils.metrics import (
+    AgentCall,
+    AgentMetrics,
+    FastPathMetrics,
+    summarize_calls,
+)
+
+
+def make_calls():
+    return [
+        AgentCall("IntentAgent", "gpt-4o", 0.3, 1200, 20, cached_tokens=1024),
+        AgentCall("NoteTakingAgent", "gpt-4o", 1.5, 900, 200),
+        AgentCall("NoteTakingAgent", "gpt-4o", 0.7, 800, 150, retries=1),
+        AgentCall("SpecialistAgent", "gpt-4o", 40.0, error=True),
+    ]
+
+
+def test_render_prometheus():
+    metrics = AgentMetrics()
+    for call in make_calls():
+        metrics.record(call)
+    text = metrics.render_prometheus()
+
+    labels = 'agent="NoteTakingAgent",model="gpt-4o"'
+    assert f"form_agent_calls_total{{{labels}}} 2" in text
+    assert f"form_agent_prompt_tokens_total{{{labels}}} 1700" in text
+    assert f"form_agent_retries_total{{{labels}}} 1" in text
+    assert f'form_agent_latency_seconds_bucket{{{labels},le="1.0"}} 1' in text
+    assert f'form_agent_latency_seconds_bucket{{{labels},le="2.0"}} 2' in text
+    assert (
+        'form_agent_cached_tokens_total{agent="IntentAgent",model="gpt-4o"} 1024'
+        in text
+    )
+    assert 'form_agent_errors_total{agent="SpecialistAgent",model="gpt-4o"} 1' in text
+    assert (
+        'form_agent_latency_seconds_bucket{agent="SpecialistAgent",'
+        'model="gpt-4o",le="32.0"} 0' in text
+    )
+
+
+def test_summarize_calls():
+    breakdown = summarize_calls(make_calls())
+
+    assert breakdown["NoteTakingAgent"]["calls"] == 2
+    assert breakdown["NoteTakingAgent"]["completion_tokens"] == 350
+    assert breakdown["IntentAgent"]["cached_tokens"] == 1024
+
+
+def test_agent_call_from_usage_without_details():
+    usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5)
+    call = AgentCall.from_usage("IntentAgent", "gpt-4o", 0.1, usage, retries=2)
+
+    assert call.cached_tokens == 0
+    assert call.retries == 2
+    assert (
+        AgentCall.from_usage("IntentAgent", "gpt-4o", 0.1, None, 0).prompt_tokens == 0
+    )
+
+
+def test_agent_call_adds_the_usage_of_discarded_hedges():
+    usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5)
+    call = AgentCall.from_usage(
+        "IntentAgent", "gpt-4o", 0.1, usage, hedges=1, cancelled_hedges=0
+    )
+    call.add_usage(usage)
+
+    assert (call.prompt_tokens, call.completion_tokens) == (20, 10)
+    metrics = AgentMetrics()
+    metrics.record(
+        AgentCall("IntentAgent", "gpt-4o", 0.1, hedges=1, cancelled_hedges=1)
+    )
+    assert (
+        'form_agent_cancelled_hedges_total{agent="IntentAgent",model="gpt-4o"} 1'
+        in metrics.render_prometheus()
+    )
+
+
+def test_fast_path_metrics():
+    metrics = FastPathMetrics()
+    metrics.record_agent_turn(3.0)
+    metrics.record_agent_turn(5.0)
+    metrics.record_miss()
+    metrics.record_hit(0.001)
+    metrics.record_hit(0.001)
+
+    assert metrics.hit_rate == 2 / 3
+    assert round(metrics.saved_seconds, 3) == 7.998
+    text = metrics.render_prometheus()
+    assert "form_fast_path_hits_total 2" in text
+    assert "form_fast_path_misses_total 1" in text
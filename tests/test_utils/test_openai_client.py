@@ -0,0 +1,16 @@
+import asyncio
+
+from form.utils.openai_client import close_openai_clients, get_openai_client
+
+
+def test_get_openai_client_is_shared():
+    assert get_openai_client() is get_openai_client()
+    assert get_openai_client("sk-other") is get_openai_client("sk-other")
+    assert get_openai_client("sk-other") is not get_openai_client()
+
+
+def test_close_openai_clients():
+    client = get_openai_client()
+    asyncio.run(close_openai_clients())
+    assert client.is_closed()
+    assert get_openai_client() is not client
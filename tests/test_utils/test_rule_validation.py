@@ -0,0 +1,105 @@
+import copy
+from datetime import date, timedelta
+
+from form.utils.compiled_form import CompiledForm
+from form.utils.form_handler import read_json
+from form.utils.rule_validation import RejectedValue, compile_rule
+
+RULES = read_json("form/schemas/form_val.json")
+FORM = read_json("form/schemas/form.json")
+
+TOMORROW = (date.today() + timedelta(days=1)).isoformat()
+NEXT_YEAR = (date.today() + timedelta(days=365)).isoformat()
+
+
+def test_compile_rule_reads_the_form_rules():
+    financial = RULES["financial_details"]
+
+    title = compile_rule(RULES["general_information"]["title"])
+    amount = compile_rule(financial["expected_amount"])
+    currency = compile_rule(financial["currency"])
+    start_date = compile_rule(financial["start_date"])
+
+    assert (title.min_length, title.max_length, title.numeric) == (3, 50, False)
+    assert (amount.numeric, amount.minimum, amount.maximum) == (True, 0, 1000000)
+    assert amount.min_length is None
+    assert currency.choices == ("USD", "EUR", "GBP")
+    assert start_date.iso_date
+    assert (start_date.before, start_date.after) == (("end_date",), ("today",))
+
+
+def test_field_rule_checks_values():
+    title = compile_rule("min 3 chars, max 50 characters")
+    amount = compile_rule("only numbers, min 0, max 1000000")
+    currency = compile_rule("drop-down list -> USD, EUR, GBP")
+    end_date = compile_rule("date picker, after start_date, iso format")
+    dates = {"start_date": "2030-06-01"}.get
+
+    assert title.check("Dashboard") is None
+    assert title.check("") is None
+    assert title.check("ab") == "must be at least 3 characters long"
+    assert amount.check(2500) is None
+    assert amount.check("2.5k") == "must be a number"
+    for not_a_number in ("nan", "inf", "-Infinity", "1_000", "1e3", float("nan")):
+        assert amount.check(not_a_number) == "must be a number"
+    assert amount.check("9" * 400) == "must be a number"
+    assert amount.check("-1") == "must be at least 0"
+    assert currency.check("eur") is None
+    assert currency.check("JPY") == "must be one of USD, EUR, GBP"
+    assert end_date.check("2030-07-01", dates) is None
+    assert end_date.check("01/07/2030", dates) == "must be an ISO date, e.g. 2024-01-31"
+    assert end_date.check("2030-05-01", dates) == (
+        "must be after start_date (2030-06-01)"
+    )
+
+
+def test_field_rule_extracts_closed_answers():
+    currency = compile_rule("drop-down list -> USD, EUR, GBP")
+    amount = compile_rule("only numbers, min 0, max 1000000")
+    start_date = compile_rule("date picker, iso format e.g. yyyy-MM-dd")
+
+    assert currency.extract(" eur. ") == "EUR"
+    assert currency.extract("EUR or USD") is None
+    assert amount.extract("250,000") == "250000"
+    assert amount.extract("250k") is None
+    assert start_date.extract("2030-02-01!") == "2030-02-01"
+    assert start_date.extract("2030-02-30") is None
+    assert compile_rule("min 3 chars").extract("Dashboard") is None
+
+
+def test_update_rejects_invalid_values():
+    form = CompiledForm(copy.deepcopy(FORM), RULES, validate=True)
+    extracted = copy.deepcopy(FORM)
+    extracted["general_information"]["title"] = "Sales dashboard"
+    extracted["financial_details"].update(
+        start_date=NEXT_YEAR, end_date=TOMORROW, currency="JPY"
+    )
+
+    changes = form.update(extracted, source="NoteTakingAgent")
+
+    # The start date is not before the end date, which then has no start to follow
+    assert [change.path for change in changes] == [
+        "general_information.title",
+        "financial_details.end_date",
+    ]
+    assert form.rejected == [
+        RejectedValue(
+            "financial_details.start_date",
+            NEXT_YEAR,
+            f"must be before end_date ({TOMORROW})",
+            "NoteTakingAgent",
+        ),
+        RejectedValue(
+            "financial_details.currency",
+            "JPY",
+            "must be one of USD, EUR, GBP",
+            "NoteTakingAgent",
+        ),
+    ]
+    assert form.get("financial_details.currency") == ""
+    assert form.first_empty() == [
+        "general_information",
+        "detailed_description",
+        "business_need",
+    ]
+    assert not form.matches_last_update
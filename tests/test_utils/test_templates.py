@@ -0,0 +1,60 @@
+import glob
+import json
+import os
+
+import pytest
+
+from form.utils.templates import PromptTemplate, TemplateRegistry
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob("form/prompts/*.txt")))
+def test_prompt_template_matches_str_format(path):
+    with open(path) as file:
+        source = file.read()
+    kwargs = {
+        "first_empty_field": "title",
+        "rule_validation": "min 3 chars",
+        "form": '{"title": ""}',
+        "validation_rules": '{"title": "min 3 chars"}',
+        "field": "currency",
+        "value": "EUR",
+        "next_field": "title",
+        "hint": "",
+        "reply_format": "Reply in plain text.",
+    }
+
+    assert PromptTemplate(source).render(**kwargs) == source.format(**kwargs)
+
+
+def test_prompt_template_conversions_and_specs():
+    template = PromptTemplate("{{literal}} {name!r} {value:.2f} {items[0]}")
+
+    assert template.fields == {"name", "value", "items[0]"}
+    assert template.render(name="a", value=1.234, items=["x"]) == "{literal} 'a' 1.23 x"
+
+
+def test_registry_reads_files_once(tmp_path):
+    path = tmp_path / "form.json"
+    path.write_text(json.dumps({"title": ""}))
+    registry = TemplateRegistry()
+
+    schema = registry.get_json(str(path))
+    schema["title"] = "changed"
+    path.write_text(json.dumps({"title": "on disk"}))
+
+    assert registry.get_json(str(path)) == {"title": ""}
+    assert registry.loads == 1
+
+
+def test_registry_hot_reload(tmp_path):
+    path = tmp_path / "prompt.txt"
+    path.write_text("Hello {name}")
+    registry = TemplateRegistry(hot_reload=True)
+    assert registry.render(str(path), name="Ada") == "Hello Ada"
+
+    path.write_text("Bye {name}")
+    os.utime(path, (0, 0))
+
+    assert registry.render(str(path), name="Ada") == "Bye Ada"
+    assert registry.loads == 2
+    assert registry.renders == 2
@@ -2,7 +2,11 @@ from uuid import UUID
 
 import pytest
 
-from form.utils.text_handler import convert_str_to_uuid
+from form.utils.text_handler import (
+    batch_by_token_budget,
+    convert_str_to_uuid,
+    estimate_tokens,
+)
 
 
 def test_convert_str_to_uuid_empty_string():
@@ -31,3 +35,25 @@ def test_convert_str_to_uuid_long_string():
     result = convert_str_to_uuid(long_string)
     assert isinstance(result, UUID)
     assert str(result) == "cabe45dc-c9ae-5b66-ba86-600cca6b8ba8"
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("a" * 400) == 100
+
+
+@pytest.mark.parametrize(
+    "texts, max_tokens, max_batch_size, expected",
+    [
+        (["a" * 40] * 5, 25, 10, [[0, 1], [2, 3], [4]]),
+        (["a" * 4] * 5, 100, 2, [[0, 1], [2, 3], [4]]),
+        (["a" * 400, "a" * 4, "a" * 4], 10, 10, [[0], [1, 2]]),
+        ([], 10, 10, []),
+    ],
+)
+def test_batch_by_token_budget(texts, max_tokens, max_batch_size, expected):
+    items = list(enumerate(texts))
+    batches = batch_by_token_budget(
+        items, max_tokens, max_batch_size, get_text=lambda item: item[1]
+    )
+    assert [[index for index, _ in batch] for batch in batches] == expected
@@ -0,0 +1,86 @@
+import asyncio
+from types import SimpleNamespace
+
+from form.utils.config import EmbeddingCacheConfig
+from form.vectorstore.cache import EmbeddingCache
+from form.vectorstore.pgvector import OpenAIEmbeddings
+
+
+class FakeEmbeddingsAPI:
+    def __init__(self):
+        self.inputs = []
+
+    async def create(self, input, model):
+        self.inputs.append(input)
+        return SimpleNamespace(
+            data=[SimpleNamespace(embedding=[float(len(text))]) for text in input]
+        )
+
+
+def cached_embeddings():
+    openai_embedding = OpenAIEmbeddings(use_cache=False)
+    openai_embedding.cache = EmbeddingCache(EmbeddingCacheConfig(persistent=False))
+    openai_embedding.client = SimpleNamespace(embeddings=FakeEmbeddingsAPI())
+    return openai_embedding
+
+
+def test_embedding_cache_skips_repeated_queries():
+    openai_embedding = cached_embeddings()
+
+    first = asyncio.run(openai_embedding.get_embedding("Cost center"))
+    # Normalization makes these the same query
+    second = asyncio.run(openai_embedding.get_embedding("  cost center\n"))
+
+    assert first == second == [11.0]
+    assert openai_embedding.client.embeddings.inputs == [["cost center"]]
+    assert openai_embedding.cache.stats()["memory_hits"] == 1
+    assert openai_embedding.cache.stats()["misses"] == 1
+
+
+def test_embedding_cache_only_embeds_missing_texts():
+    openai_embedding = cached_embeddings()
+
+    asyncio.run(openai_embedding.get_embeddings(["a", "bb"]))
+    embeddings = asyncio.run(openai_embedding.get_embeddings(["bb", "ccc", "ccc"]))
+
+    assert embeddings == [[2.0], [3.0], [3.0]]
+    assert openai_embedding.client.embeddings.inputs == [["a", "bb"], ["ccc"]]
+
+
+def test_embedding_cache_key_depends_on_model():
+    assert EmbeddingCache.cache_key("model-a", "text") != EmbeddingCache.cache_key(
+        "model-b", "text"
+    )
+
+
+class FakeSession:
+    def __init__(self):
+        self.statements = []
+        self.commits = 0
+
+    async def execute(self, statement):
+        self.statements.append(str(statement))
+        return SimpleNamespace(all=lambda: [])
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        pass
+
+
+def test_persistent_tier_uses_the_callers_session_and_prunes_expired_rows():
+    cache = EmbeddingCache(EmbeddingCacheConfig())
+    db = FakeSession()
+
+    asyncio.run(cache.get_many("model", ["a"], db))
+    asyncio.run(cache.set_many("model", {"a": [1.0]}, db))
+    asyncio.run(cache.set_many("model", {"b": [2.0]}, db))
+
+    select_sql, insert_sql, delete_sql, second_insert_sql = db.statements
+    assert "embedding_cache.expires_at > now()" in select_sql
+    assert "ON CONFLICT (cache_key) DO UPDATE" in insert_sql
+    assert delete_sql.startswith("DELETE FROM embedding_cache")
+    # Expired rows are deleted at most once per prune interval
+    assert second_insert_sql.startswith("INSERT INTO embedding_cache")
+    assert db.commits == 2
@@ -0,0 +1,87 @@
+from uuid import uuid4
+
+import numpy as np
+import pytest
+
+from form.vectorstore.numpy_engine import NumpyVectorIndex
+
+
+def reference_distances(matrix, query, distance_type):
+    if distance_type == "cosine_distance":
+        return 1 - matrix @ query / (
+            np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        )
+    if distance_type == "max_inner_product":
+        return -(matrix @ query)
+    if distance_type == "l2_distance":
+        return np.linalg.norm(matrix - query, axis=1)
+    if distance_type == "l1_distance":
+        return np.abs(matrix - query).sum(axis=1)
+    return ((matrix > 0) != (query > 0)).sum(axis=1)
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(50, 8)).astype(np.float32)
+
+
+@pytest.mark.parametrize(
+    "distance_type",
+    [
+        "max_inner_product",
+        "cosine_distance",
+        "l1_distance",
+        "l2_distance",
+        "hamming_distance",
+    ],
+)
+def test_search_matches_brute_force(vectors, distance_type):
+    ids = [uuid4() for _ in range(len(vectors))]
+    # A tiny initial capacity exercises the growth of the matrix
+    index = NumpyVectorIndex(dimensions=8, initial_capacity=4)
+    index.add(ids, vectors)
+    query = vectors[0] + 0.1
+
+    expected = reference_distances(vectors, query, distance_type)
+    results = index.search(query, 5, distance_type)
+
+    assert len(results) == 5
+    distances = [distance for _, distance in results]
+    assert distances == sorted(distances)
+    np.testing.assert_allclose(distances, np.sort(expected)[:5], rtol=1e-4, atol=1e-4)
+    for embedding_id, distance in results:
+        np.testing.assert_allclose(
+            distance, expected[ids.index(embedding_id)], rtol=1e-4, atol=1e-4
+        )
+
+
+def test_add_replaces_and_delete_removes(vectors):
+    ids = [uuid4() for _ in range(3)]
+    index = NumpyVectorIndex(dimensions=8)
+    index.add(ids, vectors[:3])
+    index.add([ids[0]], [vectors[10]])
+    index.delete([ids[1], uuid4()])
+
+    assert len(index) == 2
+    assert ids[1] not in index
+    closest_id, distance = index.search(vectors[10], 1, "l2_distance")[0]
+    assert closest_id == ids[0]
+    assert distance == pytest.approx(0, abs=1e-5)
+
+
+def test_within_distance(vectors):
+    ids = [uuid4() for _ in range(len(vectors))]
+    index = NumpyVectorIndex(dimensions=8)
+    index.add(ids, vectors)
+
+    expected = reference_distances(vectors, vectors[3], "l2_distance")
+    matches = index.within_distance(vectors[3], 3.0, "l2_distance")
+
+    assert {embedding_id for embedding_id, _ in matches} == {
+        ids[i] for i in np.flatnonzero(expected < 3.0)
+    }
+
+
+def test_search_empty_index():
+    assert NumpyVectorIndex(dimensions=8).search([0.0] * 8, 5, "l2_distance") == []